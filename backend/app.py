@@ -1,7 +1,12 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from routes.api import api
-from models.server import Server
+from routes.api import api, apply_backfill, fleet_snapshot, is_request_authenticated, project_server
+from routes.metrics import metrics
+from models.server import get_server_model
+from services.broadcast import BroadcastFanout
+from services.cluster import ClusterSync, get_bus
+from services import wire_format
+from services.instrumentation import instruments, profiler, startup, engine_loggers, engine_log_level, set_engine_log_level
 from config import Config
 from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
@@ -10,16 +15,20 @@ import atexit
 import jwt
 import sqlite3
 import os
+import time
 from flask_socketio import SocketIO, emit
 import logging
 from logging.handlers import RotatingFileHandler
 
+startup.mark('imports')
+
 app = Flask(__name__)
 CORS(app, resources={
     r"/api/*": {
         "origins": "*",
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
         "allow_headers": ["Content-Type", "Authorization"],
+        "expose_headers": ["ETag", "X-Next-Cursor"],
         "supports_credentials": True
     }
 })
@@ -27,15 +36,16 @@ app.config.from_object(Config)
 
 # Register blueprint
 app.register_blueprint(api, url_prefix='/api')
+app.register_blueprint(metrics)
 
-# Initialize database
-server_model = Server(Config.DATABASE_PATH)
+# Initialize database (the same Server instance as routes/api.py)
+server_model = get_server_model(Config.DATABASE_PATH)
 try:
     server_model.init_db()
-    print("Database initialized successfully")
 except Exception as e:
     print(f"Database initialization error: {e}")
     exit(1)  # Exit if database initialization fails
+startup.mark('database')
 
 servers = {}  # Use dictionary to store server information, key is server_id
 
@@ -43,17 +53,30 @@ servers = {}  # Use dictionary to store server information, key is server_id
 scheduler = BackgroundScheduler()
 scheduler.start()
 
-# Add scheduled task, check server status every 30 seconds
+# Write live server state to the database in batches
 scheduler.add_job(
-    func=server_model.check_server_status,
-    trigger=IntervalTrigger(seconds=30),
-    id='check_server_status',
-    name='Check server status',
+    func=server_model.flush_live_state,
+    trigger=IntervalTrigger(seconds=Config.LIVE_STATE_FLUSH_INTERVAL),
+    id='flush_live_state',
+    name='Flush live server state',
     replace_existing=True
 )
 
+# Downsample metrics history and apply retention
+if Config.MAINTENANCE_JOBS:
+    scheduler.add_job(
+        func=server_model.roll_up_metrics,
+        trigger=IntervalTrigger(seconds=Config.METRICS_ROLLUP_INTERVAL),
+        id='roll_up_metrics',
+        name='Roll up metrics history',
+        replace_existing=True
+    )
+
 # Ensure scheduler is shut down when application exits
 atexit.register(lambda: scheduler.shutdown())
+atexit.register(server_model.pool.close_all)
+# Persist whatever is still pending (registered last, so it runs first)
+atexit.register(server_model.flush_live_state)
 
 @app.route('/api/servers/<server_id>/status', methods=['PUT'])
 def update_server_status(server_id):
@@ -140,14 +163,19 @@ def reset_password():
     success = server_model.set_admin_password(new_password)
     return jsonify({'success': success})
 
+socketio_logger, engineio_logger = engine_loggers(Config.SOCKETIO_LOG_LEVEL)
+
 socketio = SocketIO(
     app,
     cors_allowed_origins="*",
-    async_mode='threading',
+    async_mode=Config.ASYNC_MODE,
+    # Broadcasts reach the viewers of every worker through the queue
+    message_queue=Config.MESSAGE_QUEUE if not Config.MESSAGE_QUEUE.startswith('memory://') else None,
     ping_timeout=60,
     ping_interval=25,
-    logger=True,
-   engineio_logger=True,
+    # Per-packet logging only below SOCKETIO_LOG_LEVEL=INFO; switchable at runtime
+    logger=socketio_logger,
+    engineio_logger=engineio_logger,
     max_http_buffer_size=1000000,
     manage_session=False,
     always_connect=True,
@@ -155,35 +183,255 @@ socketio = SocketIO(
     websocket_ping_timeout=60
 )
 
-# Store client last update time
-client_last_update = {}
+# Batched status broadcasts to Socket.IO viewers
+broadcast_fanout = BroadcastFanout(
+    socketio,
+    project_server,
+    interval=Config.BROADCAST_INTERVAL,
+    max_backlog=Config.BROADCAST_MAX_BACKLOG,
+    distributed=bool(Config.MESSAGE_QUEUE)
+)
+broadcast_fanout.start()
+
+# Live state, liveness and allow list changes shared with the other workers
+message_bus = get_bus(Config.MESSAGE_QUEUE)
+cluster_sync = None
+if message_bus is not None:
+    cluster_sync = ClusterSync(
+        server_model.live_state,
+        message_bus,
+        liveness=server_model.liveness,
+        allow_list=server_model.allow_list
+    )
+    cluster_sync.start()
+
+@instruments.timed('liveness.expire')
+def handle_expired_servers(names):
+    """Servers that missed their report deadline go to stopped right away"""
+    for server in server_model.mark_stopped(names):
+        broadcast_fanout.publish(server)
+
+# Replaces the periodic check_server_status scan
+server_model.liveness.start(handle_expired_servers)
+
+# Agent name of every socket that has sent a full report, key is request.sid
+agent_sessions = {}
+
+# Latest self-telemetry block of each agent (monitor.py --self-telemetry), key is the agent name
+agent_telemetry = {}
+
+# Queue depths reported by /api/internal/stats
+instruments.add_gauge('agents.connected', lambda: len(agent_sessions))
+instruments.add_gauge('sockets.open', lambda: len(socketio.server.eio.sockets))
+instruments.add_gauge('queue.live_state_dirty', server_model.live_state.dirty_count)
+instruments.add_gauge('queue.history_pending', server_model.history.pending_count)
+instruments.add_gauge('queue.broadcast_buffered', lambda: broadcast_fanout.stats()['buffered'])
+
+# Protocol features announced to agents and viewers when they connect.
+# Viewers opt into status_batch in the connect auth, e.g. {'status_batch': True}
+SERVER_CAPABILITIES = {'delta': True, 'status_batch': True}
+if wire_format.available():
+    # Reports may be sent as MessagePack maps keyed by this field-id schema
+    SERVER_CAPABILITIES['msgpack'] = wire_format.SCHEMA_VERSION
 
 @socketio.on('connect')
-def handle_connect():
+def handle_connect(auth=None):
     print(f"Client connected: {request.sid}")
+    emit('capabilities', SERVER_CAPABILITIES)
+    # Every socket is a viewer until it reports as an agent
+    auth = auth if isinstance(auth, dict) else {}
+    token = auth.get('token')
+    broadcast_fanout.add_viewer(request.sid, bool(token) and server_model.verify_token(token),
+                                batch=bool(auth.get('status_batch')))
     
 @socketio.on('disconnect')
 def handle_disconnect():
     print(f"Client disconnected: {request.sid}")
-    if hasattr(request, 'client_name'):
-        print(f"Client {request.client_name} disconnected")
+    client_name = agent_sessions.pop(request.sid, None)
+    if client_name:
+        print(f"Client {client_name} disconnected")
 
 @socketio.on('server_update')
+@instruments.timed('events.server_update')
 def handle_server_update(data):
+    """Full report: static inventory plus current metrics, sent once per connection"""
     try:
         if not data or 'id' not in data or 'name' not in data:
             return
             
-        request.client_name = data['name']
+        if request.sid not in agent_sessions:
+            # Agents do not need the status broadcasts
+            broadcast_fanout.remove_viewer(request.sid)
+        agent_sessions[request.sid] = data['name']
         
-        data['status'] = 'running'
-        server_model.update_server(data)
-        
-        emit('server_status_update', data, broadcast=True)
+        server = server_model.update_server(data)
+        if server:
+            with instruments.timer('ingest.broadcast'):
+                broadcast_fanout.publish(server)
     except Exception as e:
+        instruments.count('events.server_update.errors')
         print(f"Error handling server update: {e}")
         logging.error(f"Error handling server update: {e}")
 
+@socketio.on('server_delta')
+@instruments.timed('events.server_delta')
+def handle_server_delta(data):
+    """Delta report: only the fields that changed since the last report"""
+    try:
+        client_name = agent_sessions.get(request.sid)
+        if client_name is None:
+            # No full report on this connection yet (e.g. the backend restarted)
+            instruments.count('events.server_delta.resync')
+            emit('resync')
+            return
+            
+        server = server_model.update_server({**(data or {}), 'name': client_name}, partial=True)
+        if server:
+            with instruments.timer('ingest.broadcast'):
+                broadcast_fanout.publish(server)
+    except Exception as e:
+        instruments.count('events.server_delta.errors')
+        print(f"Error handling server delta: {e}")
+        logging.error(f"Error handling server delta: {e}")
+
+@socketio.on('server_bulk_update')
+@instruments.timed('events.server_bulk_update')
+def handle_server_bulk_update(data):
+    """Reports for many hosts from a relay; the ack carries per-item results"""
+    try:
+        reports = data.get('servers') if isinstance(data, dict) else data
+        if not isinstance(reports, list):
+            return {'error': 'Invalid data'}
+        if len(reports) > Config.BULK_UPDATE_MAX_ITEMS:
+            return {'error': f'At most {Config.BULK_UPDATE_MAX_ITEMS} reports per event'}
+            
+        if request.sid not in agent_sessions:
+            broadcast_fanout.remove_viewer(request.sid)
+            
+        results, servers = server_model.update_servers(reports)
+        instruments.count('events.server_bulk_update.reports', len(reports))
+        with instruments.timer('ingest.broadcast'):
+            for server in servers:
+                broadcast_fanout.publish(server)
+        return {'accepted': len(servers), 'rejected': len(results) - len(servers), 'results': results}
+    except Exception as e:
+        print(f"Error handling bulk server update: {e}")
+        logging.error(f"Error handling bulk server update: {e}")
+        return {'error': str(e)}
+
+@socketio.on('server_backfill')
+@instruments.timed('events.server_backfill')
+def handle_server_backfill(data):
+    """Samples an agent spooled while disconnected (gzip JSON); history only"""
+    try:
+        result, _ = apply_backfill(data)
+        return result
+    except Exception as e:
+        print(f"Error handling server backfill: {e}")
+        logging.error(f"Error handling server backfill: {e}")
+        return {'error': str(e)}
+
+@socketio.on('agent_telemetry')
+@instruments.timed('events.agent_telemetry')
+def handle_agent_telemetry(data):
+    """An agent's own CPU, memory and timings; kept in memory for operators"""
+    client_name = agent_sessions.get(request.sid)
+    if client_name is None or not isinstance(data, dict):
+        return
+    agent_telemetry[client_name] = {**data, 'received': time.time()}
+
+@socketio.on('server_update_packed')
+@instruments.timed('events.server_update_packed')
+def handle_server_update_packed(payload):
+    """server_update encoded with the MessagePack field-id schema"""
+    try:
+        with instruments.timer('ingest.decode'):
+            data = wire_format.decode_report(payload)
+    except Exception as e:
+        instruments.count('events.server_update_packed.errors')
+        print(f"Error decoding packed server update: {e}")
+        return
+    handle_server_update(data)
+
+@socketio.on('server_delta_packed')
+@instruments.timed('events.server_delta_packed')
+def handle_server_delta_packed(payload):
+    """server_delta encoded with the MessagePack field-id schema"""
+    try:
+        with instruments.timer('ingest.decode'):
+            data = wire_format.decode_report(payload)
+    except Exception as e:
+        instruments.count('events.server_delta_packed.errors')
+        print(f"Error decoding packed server delta: {e}")
+        return
+    handle_server_delta(data)
+
+@app.route('/api/internal/stats', methods=['GET'])
+def internal_stats():
+    """Runtime counters for operators (admin token required)"""
+    if not is_request_authenticated():
+        return jsonify({'error': 'Unauthorized'}), 401
+    stats = {
+        'broadcast': broadcast_fanout.stats(),
+        'liveness': server_model.liveness.stats(),
+        'instrumentation': instruments.stats(),
+        'socketio_log_level': engine_log_level(),
+        'profiler': {'running': profiler.running},
+        'startup_ms': startup.phases()
+    }
+    if cluster_sync is not None:
+        stats['cluster'] = cluster_sync.stats()
+    return jsonify(stats)
+
+@app.route('/api/internal/agents', methods=['GET'])
+def internal_agents():
+    """Self-telemetry last reported by each agent (admin token required)"""
+    if not is_request_authenticated():
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify(agent_telemetry)
+
+@app.route('/api/internal/profiler', methods=['GET', 'POST'])
+def internal_profiler():
+    """Sampling profiler: POST {"action": "start"|"stop", "interval", "duration"}, GET the report.
+
+    GET ?format=folded returns collapsed stacks for flame graph tools.
+    """
+    if not is_request_authenticated():
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        if request.method == 'GET':
+            if request.args.get('format') == 'folded':
+                return app.response_class(profiler.folded(), mimetype='text/plain')
+            return jsonify(profiler.report(limit=request.args.get('limit', 30, type=int)))
+        
+        data = request.get_json(silent=True) or {}
+        action = data.get('action')
+        if action == 'start':
+            interval = float(data.get('interval', 0.005))
+            duration = data.get('duration', 60)
+            if not 0.001 <= interval <= 1:
+                return jsonify({'error': 'interval must be between 0.001 and 1 seconds'}), 400
+            profiler.start(interval=interval, duration=float(duration) if duration else None)
+        elif action == 'stop':
+            profiler.stop()
+        else:
+            return jsonify({'error': 'action must be start or stop'}), 400
+        return jsonify({'running': profiler.running})
+    except Exception as e:
+        print(f"Error controlling profiler: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/internal/log-level', methods=['PUT'])
+def internal_log_level():
+    """Change the Socket.IO/Engine.IO log level, e.g. {"level": "INFO"}"""
+    if not is_request_authenticated():
+        return jsonify({'error': 'Unauthorized'}), 401
+    data = request.get_json(silent=True) or {}
+    try:
+        return jsonify({'level': set_engine_log_level(data.get('level', ''))})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
 def check_inactive_clients():
     """Check inactive clients"""
     try:
@@ -211,13 +459,20 @@ def error_handler(e):
 def default_error_handler(e):
     print(f"SocketIO default error: {e}")
 
+# Load the fleet and build the public listing while the server starts
+# listening, so the first dashboard poll after a restart is served from memory
+socketio.start_background_task(fleet_snapshot.warm)
+
+startup.mark('services')
+
 if __name__ == '__main__':
     try:
+        print(startup.summary())
         print("Starting server in production mode...")
         socketio.run(
             app,
-            host='0.0.0.0',
-            port=5000,
+            host=Config.LISTEN_HOST,
+            port=Config.PORT,
             debug=False,
             use_reloader=False,
             allow_unsafe_werkzeug=True
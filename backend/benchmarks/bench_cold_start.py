@@ -0,0 +1,196 @@
+"""Cold-start benchmark: how long a restarted backend takes to serve again.
+
+Starts serve.py --runs times against a database seeded with --servers
+servers and measures, from process spawn, when the port accepts
+connections and when GET /api/servers first answers (the live state is
+loaded on that first read). SERVER_IP is removed from the child's
+environment, so a startup that waits on the network shows up here. The
+per-phase timings the backend prints at startup are summarised as well.
+
+With --agent-runs, client/monitor.py is measured too: how long importing
+the module takes (psutil, requests and socketio are imported on first
+use, so none of them count here) and how long a fresh agent takes to send
+its first report to a running backend, from the line it prints:
+
+    python benchmarks/bench_cold_start.py --runs 10 --servers 5000 --agent-runs 10
+"""
+import argparse
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from common import BACKEND_DIR, free_port, percentile, prepare_environment, seed_clients, start_backend
+
+STARTUP_LINE = re.compile(r'Started in \d+ ms \((.*)\)')
+PHASE = re.compile(r'(\S+) (\d+) ms')
+FIRST_REPORT_LINE = re.compile(r'First report sent (\d+) ms after start')
+CLIENT_DIR = os.path.join(os.path.dirname(BACKEND_DIR), 'client')
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Backend cold-start benchmark')
+    parser.add_argument('--runs', type=int, default=5, help='Restarts to measure')
+    parser.add_argument('--servers', type=int, default=1000, help='Servers in the database')
+    parser.add_argument('--mode', type=str, default='threading', help='ASYNC_MODE of the backend')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Seconds to wait for one start')
+    parser.add_argument('--agent-runs', type=int, default=0, help='Agent starts to measure')
+    return parser.parse_args()
+
+
+def seed_database(count):
+    from models.server import Server
+    from config import Config
+    server_model = Server(Config.DATABASE_PATH)
+    server_model.init_db()
+    for name in seed_clients(server_model, count):
+        server_model.update_server({
+            'id': name, 'name': name, 'type': 'VPS', 'location': 'US',
+            'ip_address': '203.0.113.10', 'uptime': 1000, 'cpu': 10.0, 'memory': 20.0,
+            'disk': 30.0, 'network_in': 0.0, 'network_out': 0.0, 'os_type': 'Debian',
+            'cpu_info': 'CPU (2 threads)', 'total_memory': 2.0, 'total_disk': 40.0
+        })
+    server_model.flush_live_state()
+    server_model.pool.close_all()
+
+
+def port_open(port):
+    try:
+        with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+            return True
+    except OSError:
+        return False
+
+
+def start_once(mode, timeout):
+    """Spawn serve.py; returns (ms to listening, ms to first /api/servers, startup phases)"""
+    port = free_port()
+    env = dict(os.environ, LISTEN_HOST='127.0.0.1', PORT=str(port), ASYNC_MODE=mode,
+               PYTHONPATH=BACKEND_DIR, PYTHONUNBUFFERED='1')
+    env.pop('SERVER_IP', None)
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(BACKEND_DIR, 'serve.py')], env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    phases = {}
+
+    def read_output():
+        for line in process.stdout:
+            match = STARTUP_LINE.search(line)
+            if match:
+                phases.update((name, float(ms)) for name, ms in PHASE.findall(match.group(1)))
+
+    reader = threading.Thread(target=read_output, daemon=True)
+    reader.start()
+    try:
+        deadline = started + timeout
+        while not port_open(port):
+            if process.poll() is not None:
+                raise RuntimeError('Backend exited during startup')
+            if time.perf_counter() > deadline:
+                raise RuntimeError('Backend did not start in time')
+            time.sleep(0.002)
+        listening = time.perf_counter() - started
+        while True:
+            try:
+                if requests.get(f'http://127.0.0.1:{port}/api/servers', timeout=timeout).status_code == 200:
+                    break
+            except requests.ConnectionError:
+                pass
+            if time.perf_counter() > deadline:
+                raise RuntimeError('Backend did not answer in time')
+            time.sleep(0.002)
+        serving = time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait()
+        reader.join(5)
+    return listening * 1000, serving * 1000, phases
+
+
+def agent_import_once():
+    """ms to import client/monitor.py in a fresh interpreter"""
+    code = ('import time; started = time.perf_counter(); import monitor; '
+            'print((time.perf_counter() - started) * 1000)')
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=CLIENT_DIR, text=True)
+    return float(output.strip().splitlines()[-1])
+
+
+def agent_start_once(port, workdir, timeout):
+    """ms from spawning an agent until it reports sending its first report"""
+    env = dict(os.environ, API_URL=f'http://127.0.0.1:{port}', PYTHONUNBUFFERED='1')
+    # Cold caches: no identity or probe cache from a previous run
+    state = tempfile.mkdtemp(prefix='agent-', dir=workdir)
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(CLIENT_DIR, 'monitor.py'), '--name', 'bench-00000',
+         '--identity-file', os.path.join(state, 'machine_id'),
+         '--probe-cache', os.path.join(state, 'probe_cache.json'),
+         '--spool-dir', os.path.join(state, 'spool')],
+        cwd=CLIENT_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    result = []
+
+    def read_output():
+        for line in process.stdout:
+            match = FIRST_REPORT_LINE.search(line)
+            if match:
+                result.append(float(match.group(1)))
+                return
+
+    reader = threading.Thread(target=read_output, daemon=True)
+    reader.start()
+    try:
+        reader.join(timeout)
+    finally:
+        process.terminate()
+        process.wait()
+    if not result:
+        raise RuntimeError('Agent did not report in time')
+    return result[0]
+
+
+def summary(values):
+    return (f"{min(values):>9.0f} {statistics.median(values):>9.0f} "
+            f"{percentile(values, 90):>9.0f} {max(values):>9.0f}")
+
+
+def main():
+    args = parse_arguments()
+    workdir = prepare_environment()
+    seed_database(args.servers)
+
+    listening, serving, phases = [], [], {}
+    for _ in range(args.runs):
+        to_listen, to_serve, run_phases = start_once(args.mode, args.timeout)
+        listening.append(to_listen)
+        serving.append(to_serve)
+        for name, value in run_phases.items():
+            phases.setdefault(name, []).append(value)
+
+    print(f"{args.runs} starts, {args.servers} servers, {args.mode}, SERVER_IP unset")
+    print(f"{'ms from spawn':<22} {'min':>9} {'median':>9} {'p90':>9} {'max':>9}")
+    print(f"{'port listening':<22} {summary(listening)}")
+    print(f"{'first /api/servers':<22} {summary(serving)}")
+    for name, values in phases.items():
+        print(f"{'  ' + name:<22} {summary(values)}")
+
+    if args.agent_runs:
+        imports = [agent_import_once() for _ in range(args.agent_runs)]
+        port = free_port()
+        backend = start_backend(port, {'ASYNC_MODE': args.mode})
+        try:
+            reports = [agent_start_once(port, workdir, args.timeout) for _ in range(args.agent_runs)]
+        finally:
+            backend.terminate()
+            backend.wait()
+        print(f"{'import monitor':<22} {summary(imports)}")
+        print(f"{'agent first report':<22} {summary(reports)}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
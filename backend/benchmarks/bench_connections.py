@@ -0,0 +1,163 @@
+"""Connection-scaling benchmark: many idle agent sockets against one backend.
+
+Starts serve.py once per async mode and connects --agents simulated
+agents over raw Engine.IO websockets (one asyncio process, so the load
+generator itself stays cheap). Each agent sends a full report and then
+a delta every --interval seconds, like client/monitor.py. Reports
+connected sockets, connect latency, backend memory and threads:
+
+    python benchmarks/bench_connections.py --agents 10000 --modes threading,gevent
+
+Needs aiohttp (load generator) and gevent/eventlet for those modes.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import time
+
+import psutil
+import requests
+
+from common import free_port, percentile, prepare_environment, seed_clients, start_backend
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Websocket connection scaling benchmark')
+    parser.add_argument('--agents', type=int, default=2000, help='Simulated agents')
+    parser.add_argument('--modes', type=str, default='threading,gevent', help='ASYNC_MODE values to compare')
+    parser.add_argument('--interval', type=float, default=3.0, help='Seconds between agent reports')
+    parser.add_argument('--ramp', type=float, default=500.0, help='New connections per second')
+    parser.add_argument('--hold', type=float, default=20.0, help='Seconds to hold all connections')
+    return parser.parse_args()
+
+
+def raise_open_file_limit():
+    import resource
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def agent_report(name):
+    return {
+        'id': name, 'name': name, 'type': 'VPS', 'location': 'US',
+        'ip_address': '203.0.113.10', 'uptime': 1000, 'cpu': random.uniform(0, 100),
+        'memory': random.uniform(0, 100), 'disk': 50.0, 'network_in': 0.0, 'network_out': 0.0,
+        'os_type': 'Debian', 'cpu_info': 'CPU (2 threads)', 'total_memory': 2.0, 'total_disk': 40.0
+    }
+
+
+async def run_agent(session, url, name, interval, stats, stop):
+    """One agent speaking Engine.IO v4 / Socket.IO v5 over a websocket"""
+    import aiohttp
+    started = time.perf_counter()
+    try:
+        async with session.ws_connect(f'{url}/socket.io/?EIO=4&transport=websocket', heartbeat=None) as ws:
+            await ws.receive()  # Engine.IO open packet
+            await ws.send_str('40')  # Socket.IO connect
+            while True:
+                message = await ws.receive()
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    raise ConnectionError('closed during handshake')
+                if message.data.startswith('40'):
+                    break
+            stats['connect_times'].append(time.perf_counter() - started)
+            stats['connected'] += 1
+            await ws.send_str('42' + json.dumps(['server_update', agent_report(name)]))
+
+            async def reader():
+                async for message in ws:
+                    if message.type == aiohttp.WSMsgType.TEXT and message.data == '2':
+                        await ws.send_str('3')  # pong
+
+            reading = asyncio.ensure_future(reader())
+            try:
+                while not stop.is_set():
+                    await asyncio.sleep(interval * random.uniform(0.9, 1.1))
+                    if ws.closed:
+                        stats['dropped'] += 1
+                        return
+                    await ws.send_str('42' + json.dumps(['server_delta', {'cpu': random.uniform(0, 100)}]))
+                    stats['reports'] += 1
+            finally:
+                reading.cancel()
+    except Exception:
+        stats['failed'] += 1
+
+
+async def drive(url, names, args, backend):
+    import aiohttp
+    stats = {'connected': 0, 'failed': 0, 'dropped': 0, 'reports': 0, 'connect_times': []}
+    stop = asyncio.Event()
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        tasks = []
+        for name in names:
+            tasks.append(asyncio.ensure_future(run_agent(session, url, name, args.interval, stats, stop)))
+            await asyncio.sleep(1.0 / args.ramp)
+        await asyncio.sleep(args.hold)
+
+        process = psutil.Process(backend.pid)
+        stats['rss_mb'] = process.memory_info().rss / 1e6
+        stats['threads'] = process.num_threads()
+        stats['open_sockets'] = stats['connected'] - stats['dropped'] - stats['failed']
+        stop.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return stats
+
+
+def run_mode(mode, db_template, names, args):
+    workdir = os.path.join(os.path.dirname(db_template), mode)
+    os.makedirs(workdir, exist_ok=True)
+    db_path = os.path.join(workdir, 'servers.db')
+    shutil.copy(db_template, db_path)
+
+    port = free_port()
+    backend = start_backend(port, {'ASYNC_MODE': mode, 'DATABASE_PATH': db_path})
+    try:
+        idle_rss = psutil.Process(backend.pid).memory_info().rss / 1e6
+        stats = asyncio.run(drive(f'http://127.0.0.1:{port}', names, args, backend))
+        servers = requests.get(f'http://127.0.0.1:{port}/api/servers', timeout=30).json()
+        stats['running'] = sum(1 for server in servers if server['status'] == 'running')
+    finally:
+        backend.terminate()
+        backend.wait()
+    stats['idle_rss_mb'] = idle_rss
+    return stats
+
+
+def main():
+    args = parse_arguments()
+    raise_open_file_limit()
+    prepare_environment()
+    from config import Config
+    from models.server import Server
+
+    server_model = Server(Config.DATABASE_PATH)
+    server_model.init_db()
+    print(f"Registering {args.agents} agents...")
+    names = seed_clients(server_model, args.agents, prefix='agent')
+    server_model.pool.close_all()
+
+    print(f"{'mode':<10} {'open':>7} {'failed':>7} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'rss MB':>8} {'KB/conn':>8} {'threads':>8} {'running':>8}")
+    for mode in args.modes.split(','):
+        try:
+            stats = run_mode(mode, Config.DATABASE_PATH, names, args)
+        except Exception as e:
+            print(f"{mode:<10} failed: {e}")
+            continue
+        per_connection = (stats['rss_mb'] - stats['idle_rss_mb']) * 1000 / max(1, stats['open_sockets'])
+        print(f"{mode:<10} {stats['open_sockets']:>7} {stats['failed']:>7} "
+              f"{percentile(stats['connect_times'], 50) * 1000:>8.1f} "
+              f"{percentile(stats['connect_times'], 99) * 1000:>8.1f} "
+              f"{stats['rss_mb']:>8.1f} {per_connection:>8.1f} {stats['threads']:>8} {stats['running']:>8}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""Requests per second with and without the SQLite connection pool.
+
+Reader threads poll GET /api/clients while writer threads reorder
+servers with PUT /api/servers/<id>/order, both hitting the database.
+Each mode runs in its own interpreter:
+
+    python benchmarks/bench_db_pool.py --duration 5 --readers 8 --writers 4
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+
+from common import prepare_environment, run_threads, run_worker, seed_clients
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='SQLite connection pool benchmark')
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds per mode')
+    parser.add_argument('--readers', type=int, default=8, help='Concurrent dashboard readers')
+    parser.add_argument('--writers', type=int, default=4, help='Concurrent writers')
+    parser.add_argument('--servers', type=int, default=200, help='Registered servers')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def worker(args):
+    prepare_environment()
+    import app as backend
+
+    server_model = backend.server_model
+    seed_clients(server_model, args.servers)
+    server_ids = [server['id'] for server in server_model.get_all_servers()]
+    clients = [backend.app.test_client() for _ in range(args.readers + args.writers)]
+
+    def read(index):
+        response = clients[index].get('/api/clients')
+        if response.status_code != 200:
+            raise RuntimeError(response.status_code)
+
+    def write(index):
+        client = clients[args.readers + index]
+        server_id = server_ids[(index * 7919 + write.counter[index]) % len(server_ids)]
+        write.counter[index] += 1
+        response = client.put(f'/api/servers/{server_id}/order', json={'order_index': index})
+        if response.status_code != 200:
+            raise RuntimeError(response.status_code)
+    write.counter = [0] * args.writers
+
+    # Readers and writers run at the same time
+    results = {}
+
+    def run_readers():
+        results['reads'] = run_threads(args.readers, args.duration, read)
+
+    reader_thread = threading.Thread(target=run_readers)
+    reader_thread.start()
+    results['writes'] = run_threads(args.writers, args.duration, write)
+    reader_thread.join()
+
+    print(json.dumps({
+        'pooled': server_model.pool.pooled,
+        'read_rps': results['reads'][0] / args.duration,
+        'write_rps': results['writes'][0] / args.duration,
+        'errors': results['reads'][1] + results['writes'][1]
+    }))
+
+
+def main():
+    args = parse_arguments()
+    if args.worker:
+        worker(args)
+        return
+
+    worker_args = ['--worker', '--duration', str(args.duration), '--readers', str(args.readers),
+                   '--writers', str(args.writers), '--servers', str(args.servers)]
+    script = os.path.abspath(__file__)
+    before = run_worker(script, worker_args, {'DB_POOL_ENABLED': '0'})
+    after = run_worker(script, worker_args, {'DB_POOL_ENABLED': '1'})
+
+    print(f"{'mode':<28}{'reads/s':>12}{'writes/s':>12}{'errors':>10}")
+    for label, result in (('connection per call', before), ('pooled WAL connections', after)):
+        print(f"{label:<28}{result['read_rps']:>12.1f}{result['write_rps']:>12.1f}{result['errors']:>10}")
+    if before['read_rps'] and before['write_rps']:
+        print(f"speedup: reads x{after['read_rps'] / before['read_rps']:.2f}, "
+              f"writes x{after['write_rps'] / before['write_rps']:.2f}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
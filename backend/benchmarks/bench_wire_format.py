@@ -0,0 +1,96 @@
+"""Microbenchmark of agent report encodings: CPU per encode/decode and bytes on the wire.
+
+Compares the legacy JSON format (every number sent as a string), JSON
+with native numbers, and the MessagePack field-id schema of
+services/wire_format.py, for a full report, a typical delta and a
+large relay batch:
+
+    python benchmarks/bench_wire_format.py --batch 1000
+"""
+import argparse
+import json
+import random
+import sys
+import timeit
+
+from common import BACKEND_DIR
+
+sys.path.insert(0, BACKEND_DIR)
+from services import wire_format  # noqa: E402
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Agent report wire format benchmark')
+    parser.add_argument('--batch', type=int, default=1000, help='Reports in the large payload')
+    return parser.parse_args()
+
+
+def full_report(i=0):
+    return {
+        'id': f'{random.getrandbits(128):032x}',
+        'name': f'node-{i:05d}',
+        'type': 'VPS',
+        'location': 'DE',
+        'ip_address': '203.0.113.10/2001:db8::10',
+        'uptime': random.randint(1000, 10000000),
+        'network_in': round(random.uniform(0, 1e7), 2),
+        'network_out': round(random.uniform(0, 1e7), 2),
+        'cpu': round(random.uniform(0, 100), 2),
+        'memory': round(random.uniform(0, 100), 2),
+        'disk': round(random.uniform(0, 100), 2),
+        'os_type': 'Ubuntu',
+        'cpu_info': 'Intel(R) Xeon(R) Gold 6248R CPU @ 3.00GHz (8 threads)',
+        'total_memory': 15.62,
+        'total_disk': 320.5
+    }
+
+
+def stringified(report):
+    """What agents sent before numbers were kept native"""
+    return {key: str(value) if isinstance(value, (int, float)) else value for key, value in report.items()}
+
+
+def json_codec(payload):
+    return (lambda: json.dumps(payload).encode('utf-8')), json.loads
+
+
+def msgpack_codec(payload):
+    if isinstance(payload, list):
+        encode = lambda: wire_format.msgpack.packb([wire_format.encode_report(r) for r in payload])  # noqa: E731
+        decode = lambda data: [wire_format.decode_report(r) for r in wire_format.msgpack.unpackb(data)]  # noqa: E731
+        return encode, decode
+    return (lambda: wire_format.encode_report(payload)), wire_format.decode_report
+
+
+def per_call(func):
+    """Microseconds per call, best of three autoranged runs"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=3, number=number)) / number * 1e6
+
+
+def main():
+    args = parse_arguments()
+    if not wire_format.available():
+        sys.exit('msgpack is not installed')
+
+    report = full_report()
+    delta = {key: report[key] for key in ('uptime', 'network_in', 'network_out', 'cpu')}
+    batch = [full_report(i) for i in range(args.batch)]
+    payloads = (('full report', report), ('delta', delta), (f'batch of {args.batch}', batch))
+
+    print(f"{'payload':<16} {'encoding':<20} {'bytes':>10} {'encode us':>11} {'decode us':>11}")
+    for label, payload in payloads:
+        legacy = [stringified(r) for r in payload] if isinstance(payload, list) else stringified(payload)
+        for name, codec in (('json (strings)', json_codec(legacy)),
+                            ('json', json_codec(payload)),
+                            ('msgpack field ids', msgpack_codec(payload))):
+            encode, decode = codec
+            data = encode()
+            encode_us = per_call(encode)
+            decode_us = per_call(lambda: decode(data))
+            print(f"{label:<16} {name:<20} {len(data):>10} {encode_us:>11.1f} {decode_us:>11.1f}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""Shared helpers for the backend benchmarks.
+
+Benchmarks run from the backend directory, e.g.
+    python benchmarks/bench_db_pool.py
+and never touch the real servers.db: prepare_environment() points the
+backend at a throwaway database before it is imported.
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def prepare_environment(**env):
+    """Use a temporary database and working directory; call before importing the backend"""
+    workdir = tempfile.mkdtemp(prefix='monitor-bench-')
+    os.environ.setdefault('SERVER_IP', '127.0.0.1')
+    os.environ['DATABASE_PATH'] = os.path.join(workdir, 'servers.db')
+    os.environ.update({key: str(value) for key, value in env.items()})
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    # Log files are written to the working directory
+    os.chdir(workdir)
+    return workdir
+
+
+def seed_clients(server_model, count, prefix='bench'):
+    """Register count allowed clients and return their names"""
+    names = [f'{prefix}-{i:05d}' for i in range(count)]
+    for name in names:
+        server_model.add_allowed_client(name)
+    return names
+
+
+def run_threads(threads, duration, operation):
+    """Call operation(thread_index) in a loop on each thread for duration seconds.
+
+    Returns (completed operations, errors).
+    """
+    deadline = time.perf_counter() + duration
+    counts = [0] * threads
+    errors = [0] * threads
+
+    def worker(index):
+        while time.perf_counter() < deadline:
+            try:
+                operation(index)
+                counts[index] += 1
+            except Exception:
+                errors[index] += 1
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return sum(counts), sum(errors)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def run_worker(script, args, env=None):
+    """Run a benchmark script in a fresh interpreter and return its JSON result.
+
+    The worker prints its result as JSON on the last line of stdout.
+    """
+    child_env = dict(os.environ)
+    child_env.update(env or {})
+    output = subprocess.run(
+        [sys.executable, script] + list(args),
+        env=child_env, cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_backend(port, env=None, timeout=30.0):
+    """Run serve.py on 127.0.0.1:port in a child process.
+
+    The child uses the database from prepare_environment() and writes its
+    log files to the current (temporary) working directory; pass
+    ASYNC_MODE in env to pick the concurrency model.
+    """
+    child_env = dict(os.environ)
+    child_env.update(env or {})
+    child_env.update(LISTEN_HOST='127.0.0.1', PORT=str(port), PYTHONPATH=BACKEND_DIR)
+    process = subprocess.Popen([sys.executable, os.path.join(BACKEND_DIR, 'serve.py')], env=child_env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('Backend exited during startup')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError('Backend did not start in time')
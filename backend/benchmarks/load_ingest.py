@@ -0,0 +1,122 @@
+"""Load test for the HTTP ingest endpoint POST /api/servers/update.
+
+Starts the backend on a free port with a temporary database, registers
+--agents allowed clients and has --workers threads post agent reports
+for them round-robin, as fast as the backend answers:
+
+    python benchmarks/load_ingest.py --agents 3000 --workers 64 --duration 20
+
+With --batch N each request carries N reports to POST
+/api/servers/bulk-update instead, the way a relay forwards them.
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+
+import requests
+
+from common import free_port, percentile, prepare_environment, seed_clients, start_backend
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='HTTP ingest load test')
+    parser.add_argument('--agents', type=int, default=3000, help='Simulated agents')
+    parser.add_argument('--workers', type=int, default=64, help='Concurrent HTTP connections')
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds of load')
+    parser.add_argument('--batch', type=int, default=0, help='Reports per bulk-update request')
+    return parser.parse_args()
+
+
+def agent_report(name):
+    """A full report shaped like the one client/monitor.py sends"""
+    return {
+        'id': name,
+        'name': name,
+        'type': 'VPS',
+        'location': 'US',
+        'ip_address': '203.0.113.10',
+        'uptime': random.randint(1000, 1000000),
+        'network_in': random.uniform(0, 1e6),
+        'network_out': random.uniform(0, 1e6),
+        'cpu': random.uniform(0, 100),
+        'memory': random.uniform(0, 100),
+        'disk': random.uniform(0, 100),
+        'os_type': 'Debian',
+        'cpu_info': 'Intel(R) Xeon(R) CPU (2 threads)',
+        'total_memory': 2.0,
+        'total_disk': 40.0
+    }
+
+
+def main():
+    args = parse_arguments()
+    prepare_environment()
+    from config import Config
+    from models.server import Server
+
+    server_model = Server(Config.DATABASE_PATH)
+    server_model.init_db()
+    names = seed_clients(server_model, args.agents, prefix='agent')
+
+    port = free_port()
+    backend = start_backend(port)
+    if args.batch:
+        url = f'http://127.0.0.1:{port}/api/servers/bulk-update'
+    else:
+        url = f'http://127.0.0.1:{port}/api/servers/update'
+    print(f"Backend on port {port}, {args.agents} agents, {args.workers} workers, {args.duration}s")
+
+    latencies = [[] for _ in range(args.workers)]
+    errors = [0] * args.workers
+    deadline = time.perf_counter() + args.duration
+
+    def worker(index):
+        session = requests.Session()
+        agents = names[index::args.workers]
+        i = 0
+        while time.perf_counter() < deadline:
+            if args.batch:
+                payload = [agent_report(agents[(i + j) % len(agents)]) for j in range(args.batch)]
+                i += args.batch
+            else:
+                payload = agent_report(agents[i % len(agents)])
+                i += 1
+            started = time.perf_counter()
+            try:
+                response = session.post(url, json=payload, timeout=10)
+                if response.status_code != 200:
+                    errors[index] += 1
+                    continue
+            except requests.RequestException:
+                errors[index] += 1
+                continue
+            latencies[index].append(time.perf_counter() - started)
+
+    try:
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        servers = requests.get(f'http://127.0.0.1:{port}/api/servers', timeout=10).json()
+    finally:
+        backend.terminate()
+        backend.wait()
+
+    all_latencies = [value for values in latencies for value in values]
+    running = sum(1 for server in servers if server['status'] == 'running')
+    reports = len(all_latencies) * (args.batch or 1)
+    print(f"requests:   {len(all_latencies)} ok, {sum(errors)} errors")
+    print(f"throughput: {len(all_latencies) / args.duration:.1f} req/s, "
+          f"{reports / args.duration:.1f} reports/s")
+    print(f"latency:    p50 {percentile(all_latencies, 50) * 1000:.1f} ms, "
+          f"p95 {percentile(all_latencies, 95) * 1000:.1f} ms, "
+          f"p99 {percentile(all_latencies, 99) * 1000:.1f} ms")
+    print(f"running:    {running}/{len(servers)} servers reported in")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,409 @@
+"""End-to-end backend benchmark with a simulated fleet; results are saved as JSON.
+
+Starts serve.py on a free port with a temporary database, connects
+--agents simulated agents that speak the client/monitor.py protocol
+(a full server_update, then a server_delta every --interval seconds),
+--viewers dashboard sockets that receive the status broadcasts and
+--pollers dashboards polling GET /api/servers. After a warm-up the
+suite measures for --duration seconds and reports:
+
+  - ingest throughput (reports per second)
+  - end-to-end latency from an agent's emit to the broadcast a viewer
+    receives, and GET /api/servers latency
+  - DB write rate (history rows and live state flushes)
+  - backend CPU and RSS, in total and per connection
+
+    python benchmarks/run_suite.py --agents 1000 --output before.json
+    python benchmarks/run_suite.py --agents 1000 --output after.json --compare before.json
+
+Needs aiohttp and psutil.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+
+import psutil
+
+from common import BACKEND_DIR, free_port, percentile, prepare_environment, seed_clients, start_backend
+
+ADMIN_PASSWORD = 'benchmark'
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Backend benchmark suite')
+    parser.add_argument('--agents', type=int, default=500, help='Simulated agents')
+    parser.add_argument('--viewers', type=int, default=5, help='Dashboard sockets receiving broadcasts')
+    parser.add_argument('--pollers', type=int, default=20, help='Dashboards polling GET /api/servers')
+    parser.add_argument('--interval', type=float, default=2.0, help='Seconds between agent reports')
+    parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds between dashboard polls')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds of measurement')
+    parser.add_argument('--warmup', type=float, default=5.0, help='Seconds between the last connect and measuring')
+    parser.add_argument('--ramp', type=float, default=500.0, help='New agent connections per second')
+    parser.add_argument('--mode', type=str, default='threading', help='ASYNC_MODE of the backend')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='Extra backend environment, e.g. LIVE_STATE_FLUSH_INTERVAL=1')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the simulated reports')
+    parser.add_argument('--output', type=str, help='Write the results to this JSON file')
+    parser.add_argument('--compare', type=str, help='Print the change against an earlier results file')
+    return parser.parse_args()
+
+
+def git_revision():
+    """Commit of the working tree, with a marker for uncommitted changes"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BACKEND_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return f'{commit}-dirty' if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def agent_report(name):
+    """A full report shaped like the one client/monitor.py sends"""
+    return {
+        'id': name, 'name': name, 'type': 'VPS', 'location': 'US',
+        'ip_address': '203.0.113.10', 'uptime': 0, 'cpu': random.uniform(0, 100),
+        'memory': random.uniform(0, 100), 'disk': 50.0, 'network_in': 0.0, 'network_out': 0.0,
+        'os_type': 'Debian', 'cpu_info': 'CPU (2 threads)', 'total_memory': 2.0, 'total_disk': 40.0
+    }
+
+
+class Fleet:
+    """Shared state of the simulated agents, viewers and pollers.
+
+    Each report carries a per-agent sequence number in its uptime field,
+    so a viewer receiving a broadcast can look up when that exact report
+    was emitted.
+    """
+
+    def __init__(self):
+        self.measuring = False
+        self.stop = None
+        self.sent_at = {}  # (name, sequence) -> perf_counter at emit
+        self.connected = 0
+        self.failed = 0
+        self.reports = 0
+        self.broadcast_latencies = []
+        self.broadcast_frames = 0
+        self.poll_latencies = []
+        self.polls = 0
+        self.not_modified = 0
+        self.poll_errors = 0
+        self.connect_times = []
+
+
+async def socket_session(session, url, auth=None):
+    """Open a Socket.IO v5 connection over an Engine.IO v4 websocket"""
+    import aiohttp
+    ws = await session.ws_connect(f'{url}/socket.io/?EIO=4&transport=websocket', heartbeat=None)
+    await ws.receive()  # Engine.IO open packet
+    await ws.send_str('40' + json.dumps(auth) if auth else '40')
+    while True:
+        message = await ws.receive()
+        if message.type != aiohttp.WSMsgType.TEXT:
+            raise ConnectionError('closed during handshake')
+        if message.data.startswith('40'):
+            return ws
+
+
+async def run_agent(session, url, name, args, fleet):
+    import aiohttp
+    started = time.perf_counter()
+    try:
+        ws = await socket_session(session, url)
+    except Exception:
+        fleet.failed += 1
+        return
+    fleet.connect_times.append(time.perf_counter() - started)
+    fleet.connected += 1
+
+    async def reader():
+        async for message in ws:
+            if message.type == aiohttp.WSMsgType.TEXT and message.data == '2':
+                await ws.send_str('3')  # pong
+
+    reading = asyncio.ensure_future(reader())
+    try:
+        sequence = 0
+        report = agent_report(name)
+        fleet.sent_at[(name, sequence)] = time.perf_counter()
+        await ws.send_str('42' + json.dumps(['server_update', report]))
+        while not fleet.stop.is_set():
+            await asyncio.sleep(args.interval * random.uniform(0.9, 1.1))
+            if ws.closed:
+                return
+            sequence += 1
+            delta = {'uptime': sequence, 'cpu': random.uniform(0, 100), 'memory': random.uniform(0, 100)}
+            if fleet.measuring:
+                fleet.sent_at[(name, sequence)] = time.perf_counter()
+            await ws.send_str('42' + json.dumps(['server_delta', delta]))
+            if fleet.measuring:
+                fleet.reports += 1
+    except Exception:
+        pass
+    finally:
+        reading.cancel()
+        await ws.close()
+
+
+async def run_viewer(session, url, fleet):
+    import aiohttp
+    ws = await socket_session(session, url, {'status_batch': True})
+    try:
+        async for message in ws:
+            if message.type != aiohttp.WSMsgType.TEXT:
+                break
+            if message.data == '2':
+                await ws.send_str('3')
+                continue
+            if not message.data.startswith('42'):
+                continue
+            event, *payload = json.loads(message.data[2:])
+            if event != 'server_status_batch' or not fleet.measuring:
+                continue
+            received = time.perf_counter()
+            fleet.broadcast_frames += 1
+            for server in payload[0]:
+                sent = fleet.sent_at.get((server.get('name'), server.get('uptime')))
+                if sent is not None:
+                    fleet.broadcast_latencies.append(received - sent)
+    finally:
+        await ws.close()
+
+
+async def run_poller(session, url, args, fleet):
+    etag = None
+    await asyncio.sleep(random.uniform(0, args.poll_interval))
+    while not fleet.stop.is_set():
+        headers = {'If-None-Match': etag} if etag else {}
+        started = time.perf_counter()
+        try:
+            async with session.get(f'{url}/api/servers', headers=headers) as response:
+                await response.read()
+                if response.status == 304:
+                    not_modified = True
+                elif response.status == 200:
+                    not_modified = False
+                    etag = response.headers.get('ETag')
+                else:
+                    raise ValueError(response.status)
+            if fleet.measuring:
+                fleet.poll_latencies.append(time.perf_counter() - started)
+                fleet.polls += 1
+                fleet.not_modified += not_modified
+        except Exception:
+            if fleet.measuring:
+                fleet.poll_errors += 1
+        await asyncio.sleep(args.poll_interval)
+
+
+async def drive(url, names, args, backend, token):
+    import aiohttp
+    fleet = Fleet()
+    fleet.stop = asyncio.Event()
+    process = psutil.Process(backend.pid)
+    idle_rss = process.memory_info().rss
+
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        tasks = [asyncio.ensure_future(run_viewer(session, url, fleet)) for _ in range(args.viewers)]
+        tasks += [asyncio.ensure_future(run_poller(session, url, args, fleet)) for _ in range(args.pollers)]
+        for name in names:
+            tasks.append(asyncio.ensure_future(run_agent(session, url, name, args, fleet)))
+            await asyncio.sleep(1.0 / args.ramp)
+        await asyncio.sleep(args.warmup)
+
+        stats_before = await backend_stats(session, url, token)
+        cpu_before = process.cpu_times()
+        fleet.measuring = True
+        started = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        fleet.measuring = False
+        elapsed = time.perf_counter() - started
+        cpu_after = process.cpu_times()
+        rss = process.memory_info().rss
+        threads = process.num_threads()
+        stats_after = await backend_stats(session, url, token)
+
+        fleet.stop.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    cpu_seconds = (cpu_after.user + cpu_after.system) - (cpu_before.user + cpu_before.system)
+    connections = fleet.connected + args.viewers
+    return {
+        'ingest': {
+            'agents_connected': fleet.connected,
+            'agents_failed': fleet.failed,
+            'reports': fleet.reports,
+            'reports_per_sec': round(fleet.reports / elapsed, 1),
+            'connect_p50_ms': round(percentile(fleet.connect_times, 50) * 1000, 2),
+            'connect_p99_ms': round(percentile(fleet.connect_times, 99) * 1000, 2)
+        },
+        'latency_ms': {
+            'emit_to_broadcast': summarize(fleet.broadcast_latencies),
+            'poll': summarize(fleet.poll_latencies)
+        },
+        'dashboards': {
+            'broadcast_frames': fleet.broadcast_frames,
+            'polls': fleet.polls,
+            'polls_per_sec': round(fleet.polls / elapsed, 1),
+            'not_modified': fleet.not_modified,
+            'poll_errors': fleet.poll_errors
+        },
+        'resources': {
+            'cpu_percent': round(cpu_seconds / elapsed * 100, 1),
+            'cpu_us_per_report': round(cpu_seconds / max(1, fleet.reports) * 1e6, 1),
+            'cpu_ms_per_connection_per_sec': round(cpu_seconds / elapsed / max(1, connections) * 1000, 3),
+            'rss_mb': round(rss / 1e6, 1),
+            'idle_rss_mb': round(idle_rss / 1e6, 1),
+            'rss_kb_per_connection': round((rss - idle_rss) / 1000 / max(1, connections), 1),
+            'threads': threads
+        },
+        'db': db_write_rates(stats_before, stats_after, elapsed),
+        'backend_latency_ms': (stats_after or {}).get('instrumentation', {}).get('latency', {})
+    }
+
+
+def summarize(values):
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'p50': round(percentile(values, 50) * 1000, 2),
+        'p90': round(percentile(values, 90) * 1000, 2),
+        'p99': round(percentile(values, 99) * 1000, 2),
+        'max': round(max(values) * 1000, 2)
+    }
+
+
+async def backend_stats(session, url, token):
+    """The backend's own counters from /api/internal/stats, if it has them"""
+    try:
+        async with session.get(f'{url}/api/internal/stats',
+                               headers={'Authorization': f'Bearer {token}'}) as response:
+            if response.status == 200:
+                return await response.json()
+    except Exception:
+        pass
+    return None
+
+
+def db_write_rates(before, after, elapsed):
+    """Flushes and written rows per second from the backend's histograms"""
+    if not before or not after:
+        return {}
+    result = {}
+    for stage in ('db.state_write', 'db.history_write'):
+        first = before['instrumentation']['latency'].get(stage, {})
+        last = after['instrumentation']['latency'].get(stage, {})
+        count = last.get('count', 0) - first.get('count', 0)
+        result[f'{stage.split(".")[1]}_per_sec'] = round(count / elapsed, 2)
+        result[f'{stage.split(".")[1]}_mean_ms'] = last.get('mean_ms')
+    return result
+
+
+def count_history_rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM metrics_raw').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def flatten(results, prefix=''):
+    """Numeric leaves of a results dict as {'a.b.c': value}"""
+    values = {}
+    for key, value in results.items():
+        if key == 'meta':
+            continue
+        path = f'{prefix}{key}'
+        if isinstance(value, dict):
+            values.update(flatten(value, path + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[path] = value
+    return values
+
+
+def compare(baseline, results):
+    old, new = flatten(baseline), flatten(results)
+    print(f"\n{'metric':<52} {'baseline':>12} {'current':>12} {'change':>9}")
+    for key in sorted(new):
+        if key not in old or key.startswith('backend_latency_ms'):
+            continue
+        change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+        print(f"{key:<52} {old[key]:>12} {new[key]:>12} {change:>+8.1f}%")
+
+
+def main():
+    args = parse_arguments()
+    random.seed(args.seed)
+    invoked_from = os.getcwd()
+    output = os.path.join(invoked_from, args.output) if args.output else None
+    baseline_path = os.path.join(invoked_from, args.compare) if args.compare else None
+
+    import resource
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    prepare_environment()
+    from config import Config
+    from models.server import Server
+
+    server_model = Server(Config.DATABASE_PATH)
+    server_model.init_db()
+    server_model.set_admin_password(ADMIN_PASSWORD)
+    names = seed_clients(server_model, args.agents, prefix='agent')
+    server_model.pool.close_all()
+
+    env = {'ASYNC_MODE': args.mode}
+    env.update(item.split('=', 1) for item in args.env)
+    port = free_port()
+    url = f'http://127.0.0.1:{port}'
+    print(f"Benchmarking {args.agents} agents, {args.viewers} viewers and {args.pollers} pollers "
+          f"({args.mode}) for {args.duration:.0f}s...")
+    backend = start_backend(port, env)
+    try:
+        import requests
+        token = requests.post(f'{url}/api/auth/login', json={'password': ADMIN_PASSWORD}, timeout=30).json()['token']
+        rows_before = count_history_rows(Config.DATABASE_PATH)
+        started = time.perf_counter()
+        results = asyncio.run(drive(url, names, args, backend, token))
+        # Rows written from the first report on, including the warm-up
+        results['db']['history_rows_per_sec'] = round(
+            (count_history_rows(Config.DATABASE_PATH) - rows_before) / (time.perf_counter() - started), 1)
+    finally:
+        backend.terminate()
+        backend.wait()
+
+    results['meta'] = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'args': vars(args)
+    }
+
+    print(json.dumps({key: value for key, value in results.items() if key != 'backend_latency_ms'}, indent=2))
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Results written to {output}")
+    if baseline_path:
+        with open(baseline_path) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
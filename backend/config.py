@@ -1,13 +1,19 @@
+import functools
 import os
 from dotenv import load_dotenv
 import socket
 
 load_dotenv()
 
+# Seconds the public IP lookup may take before falling back to the local address
+SERVER_IP_LOOKUP_TIMEOUT = float(os.getenv('SERVER_IP_LOOKUP_TIMEOUT', '2'))
+
+@functools.lru_cache(maxsize=None)
 def get_server_ip():
+    """Public IP of this host, looked up once and only when first needed"""
     try:
         import requests
-        ip = requests.get('https://api.ipify.org').text
+        ip = requests.get('https://api.ipify.org', timeout=SERVER_IP_LOOKUP_TIMEOUT).text
     except:
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         try:
@@ -19,10 +25,63 @@ def get_server_ip():
             s.close()
     return ip
 
-SERVER_IP = os.getenv('SERVER_IP', get_server_ip())
+def __getattr__(name):
+    # SERVER_IP is resolved on first access rather than at import, so
+    # startup never waits on the network
+    if name == 'SERVER_IP':
+        ip = os.getenv('SERVER_IP')
+        return ip if ip is not None else get_server_ip()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key')
-    DATABASE_PATH = os.path.join(os.path.dirname(__file__), 'servers.db')
+    DATABASE_PATH = os.getenv('DATABASE_PATH', os.path.join(os.path.dirname(__file__), 'servers.db'))
+    # Listen address and Socket.IO concurrency model (threading, eventlet or gevent), see serve.py
+    LISTEN_HOST = os.getenv('LISTEN_HOST', '0.0.0.0')
+    PORT = int(os.getenv('PORT', '5000'))
+    ASYNC_MODE = os.getenv('ASYNC_MODE', 'threading')
+    # Shared message queue for running several workers (redis://..., or
+    # memory:// within one process); empty for a single worker
+    MESSAGE_QUEUE = os.getenv('MESSAGE_QUEUE', '')
+    # Socket.IO/Engine.IO server log level; INFO logs every packet
+    SOCKETIO_LOG_LEVEL = os.getenv('SOCKETIO_LOG_LEVEL', 'ERROR')
+    # Latency histograms and counters of the ingest and read paths
+    INSTRUMENTATION_ENABLED = os.getenv('INSTRUMENTATION_ENABLED', '1') == '1'
+    # Run history rollups in this worker; enable on exactly one worker
+    MAINTENANCE_JOBS = os.getenv('MAINTENANCE_JOBS', '1') == '1'
+    # Seconds between batched writes of live server state to SQLite
+    LIVE_STATE_FLUSH_INTERVAL = float(os.getenv('LIVE_STATE_FLUSH_INTERVAL', '5'))
+    # SQLite connection pool (WAL mode); disable to open a connection per call
+    DB_POOL_ENABLED = os.getenv('DB_POOL_ENABLED', '1') == '1'
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '16'))
+    DB_BUSY_TIMEOUT = float(os.getenv('DB_BUSY_TIMEOUT', '5'))
+    # Metrics history: seconds kept at each resolution, and rollup cadence
+    METRICS_RETENTION = {
+        'raw': int(os.getenv('METRICS_RAW_RETENTION', str(60 * 60))),
+        '1m': int(os.getenv('METRICS_MINUTE_RETENTION', str(7 * 24 * 60 * 60))),
+        '1h': int(os.getenv('METRICS_HOUR_RETENTION', str(365 * 24 * 60 * 60))),
+    }
+    METRICS_ROLLUP_INTERVAL = int(os.getenv('METRICS_ROLLUP_INTERVAL', '60'))
+    # Maximum diff frames per second sent to dashboard stream subscribers
+    DASHBOARD_PUSH_RATE = float(os.getenv('DASHBOARD_PUSH_RATE', '2'))
+    # Bearer token required by GET /metrics; empty leaves it open
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+    # Most reports accepted in one bulk update
+    BULK_UPDATE_MAX_ITEMS = int(os.getenv('BULK_UPDATE_MAX_ITEMS', '10000'))
+    # Most history samples accepted in one agent backfill
+    BACKFILL_MAX_SAMPLES = int(os.getenv('BACKFILL_MAX_SAMPLES', '100000'))
+    # Largest backfill body accepted, after gzip decompression (bytes)
+    BACKFILL_MAX_BYTES = int(os.getenv('BACKFILL_MAX_BYTES', str(16 * 1024 * 1024)))
+    # Longest time a cached GET /api/servers body is reused while the fleet keeps changing
+    SNAPSHOT_MAX_AGE = float(os.getenv('SNAPSHOT_MAX_AGE', '1'))
+    # Socket.IO status broadcasts: seconds per batch, and queued packets
+    # after which a slow viewer is skipped
+    BROADCAST_INTERVAL = float(os.getenv('BROADCAST_INTERVAL', '0.5'))
+    BROADCAST_MAX_BACKLOG = int(os.getenv('BROADCAST_MAX_BACKLOG', '64'))
+    # A server is marked stopped when no report arrives within its own
+    # report interval plus this grace period (seconds)
+    LIVENESS_GRACE_PERIOD = float(os.getenv('LIVENESS_GRACE_PERIOD', '10'))
+    # Interval assumed until a server has reported twice
+    LIVENESS_INITIAL_INTERVAL = float(os.getenv('LIVENESS_INITIAL_INTERVAL', '20'))
     DEBUG = False
     CORS_HEADERS = 'Content-Type'
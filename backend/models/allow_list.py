@@ -0,0 +1,59 @@
+import threading
+from typing import Set
+from models.database import get_pool, per_database
+import logging
+
+
+class AllowList:
+    """In-memory copy of the allowed_clients table.
+
+    Loaded on first use and invalidated by every write to the table, so
+    the ingest path checks a set instead of running a SELECT per report.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.pool = get_pool(db_path)
+        self._names = None
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def _load(self) -> Set[str]:
+        conn = self.pool.connection()
+        try:
+            c = conn.cursor()
+            c.execute('SELECT name FROM allowed_clients')
+            return {row[0] for row in c.fetchall()}
+        finally:
+            conn.close()
+
+    def names(self) -> Set[str]:
+        names = self._names
+        if names is None:
+            with self._lock:
+                if self._names is None:
+                    self._names = self._load()
+                names = self._names
+        return names
+
+    def contains(self, name: str) -> bool:
+        return name in self.names()
+
+    def add_listener(self, callback):
+        """Call callback() whenever the cached names are invalidated"""
+        self._listeners.append(callback)
+
+    def invalidate(self):
+        """Drop the cached names; the next lookup reloads them"""
+        with self._lock:
+            self._names = None
+        for callback in self._listeners:
+            try:
+                callback()
+            except Exception as e:
+                logging.error(f"Error in allow list listener: {e}")
+
+
+@per_database
+def get_allow_list(db_path: str) -> AllowList:
+    return AllowList(db_path)
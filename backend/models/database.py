@@ -0,0 +1,140 @@
+import functools
+import sqlite3
+import threading
+from config import Config
+
+
+class PooledConnection:
+    """Handle to a pooled sqlite3 connection.
+
+    Behaves like the underlying connection, except that close() hands it
+    back to the pool instead of closing it. Nested get_db() calls on the
+    same thread share one connection; it is released when the outermost
+    handle is closed, rolling back anything left uncommitted.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._closed = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._conn.__exit__(exc_type, exc_value, traceback)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._pool._release()
+
+
+class ConnectionPool:
+    """Reusable SQLite connections configured once for concurrent access.
+
+    Every connection runs in WAL mode so dashboard reads never block the
+    ingest writes, with synchronous=NORMAL, a busy timeout and a
+    prepared-statement cache. Idle connections are kept for reuse by
+    whichever thread needs one next, since Werkzeug and Socket.IO start
+    a new thread per request or websocket.
+    """
+
+    def __init__(self, db_path: str, busy_timeout: float = 5.0,
+                 cached_statements: int = 128, max_idle: int = 16, pooled: bool = True):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self.max_idle = max_idle
+        self.pooled = pooled
+        self._idle = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _create(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout,
+            cached_statements=self.cached_statements,
+            check_same_thread=False
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout * 1000)}')
+        return conn
+
+    def connection(self):
+        """Get a connection; close() it when done, as with sqlite3"""
+        if not self.pooled:
+            return sqlite3.connect(self.db_path)
+
+        local = self._local
+        if getattr(local, 'conn', None) is None:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            local.conn = conn or self._create()
+            local.depth = 0
+        local.depth += 1
+        return PooledConnection(self, local.conn)
+
+    def _release(self):
+        local = self._local
+        local.depth -= 1
+        if local.depth > 0:
+            return
+        conn, local.conn = local.conn, None
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            return
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close_all(self):
+        """Close idle connections, e.g. at shutdown"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+# Reentrant: building one shared object (e.g. the Server model) fetches others
+_registry_lock = threading.RLock()
+
+
+def per_database(factory):
+    """Turn factory(db_path, ...) into a getter of one shared instance per file.
+
+    The first call for a database path builds the instance; later calls
+    return it and ignore their other arguments. Pools, caches and the
+    Server model all go through this, so every Server(db_path) in the
+    process shares them.
+    """
+    instances = {}
+
+    @functools.wraps(factory)
+    def get(db_path: str, *args, **kwargs):
+        with _registry_lock:
+            instance = instances.get(db_path)
+            if instance is None:
+                instance = instances[db_path] = factory(db_path, *args, **kwargs)
+            return instance
+    return get
+
+
+@per_database
+def get_pool(db_path: str) -> ConnectionPool:
+    return ConnectionPool(
+        db_path,
+        busy_timeout=Config.DB_BUSY_TIMEOUT,
+        max_idle=Config.DB_POOL_SIZE,
+        pooled=Config.DB_POOL_ENABLED
+    )
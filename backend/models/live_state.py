@@ -0,0 +1,242 @@
+import threading
+from typing import Callable, Dict, List, Optional
+from models.database import get_pool, per_database
+from services.instrumentation import instruments
+import time
+import logging
+
+
+class LiveStateStore:
+    """In-memory copy of the servers table shared by the whole process.
+
+    Agent updates are merged into this store and written back to SQLite
+    in batched transactions by flush(), so the ingest path never waits
+    on the disk. Readers get the latest state straight from memory.
+    """
+
+    # Columns written back to the servers table on flush
+    PERSISTED_FIELDS = (
+        'type', 'location', 'ip_address', 'status', 'uptime',
+        'network_in', 'network_out', 'cpu', 'memory', 'disk',
+        'os_type', 'cpu_info', 'total_memory', 'total_disk', 'last_update'
+    )
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.pool = get_pool(db_path)
+        self._lock = threading.RLock()
+        # Serializes flushes with admin writes that bypass the store
+        self._flush_lock = threading.RLock()
+        self._servers = {}  # name -> row dict
+        self._names_by_id = {}  # id -> name
+        self._dirty = set()
+        self._loaded = False
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Call callback(name, server_id) after a server changes or is removed"""
+        self._listeners.append(callback)
+
+    def _notify(self, changes):
+        for name, server_id in changes:
+            for callback in self._listeners:
+                try:
+                    callback(name, server_id)
+                except Exception as e:
+                    logging.error(f"Error in live state listener: {e}")
+
+    def _connect(self):
+        return self.pool.connection()
+
+    def _read_rows(self, where: str = '', params: tuple = ()) -> List[Dict]:
+        conn = self._connect()
+        try:
+            c = conn.cursor()
+            c.execute(f'SELECT * FROM servers {where}', params)
+            columns = [description[0] for description in c.description]
+            return [dict(zip(columns, row)) for row in c.fetchall()]
+        finally:
+            conn.close()
+
+    def load(self):
+        """(Re)load every server row from the database"""
+        rows = self._read_rows()
+        with self._lock:
+            previous = [(name, server_id) for server_id, name in self._names_by_id.items()]
+            self._servers = {row['name']: row for row in rows}
+            self._names_by_id = {row['id']: row['name'] for row in rows}
+            self._dirty.clear()
+            self._loaded = True
+        self._notify(previous + [(row['name'], row['id']) for row in rows])
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._flush_lock:
+                if not self._loaded:
+                    self.load()
+
+    def reload_server(self, name: str):
+        """Replace the cached row of one server with what is on disk"""
+        self._ensure_loaded()
+        rows = self._read_rows('WHERE name = ?', (name,))
+        with self._lock:
+            old = self._forget(name)
+            for row in rows:
+                self._servers[row['name']] = row
+                self._names_by_id[row['id']] = row['name']
+        changes = [(name, old['id'])] if old is not None else []
+        self._notify(changes + [(row['name'], row['id']) for row in rows])
+
+    def _forget(self, name: str):
+        row = self._servers.pop(name, None)
+        if row is not None:
+            self._names_by_id.pop(row['id'], None)
+        self._dirty.discard(name)
+        return row
+
+    def remove(self, server_id: str):
+        """Drop a server from the store (the row is already deleted on disk)"""
+        self._ensure_loaded()
+        with self._lock:
+            name = self._names_by_id.get(server_id)
+            if name is None:
+                return
+            self._forget(name)
+        self._notify([(name, server_id)])
+
+    def get(self, name: str) -> Optional[Dict]:
+        self._ensure_loaded()
+        with self._lock:
+            row = self._servers.get(name)
+            return dict(row) if row is not None else None
+
+    def get_by_id(self, server_id: str) -> Optional[Dict]:
+        self._ensure_loaded()
+        with self._lock:
+            name = self._names_by_id.get(server_id)
+            return dict(self._servers[name]) if name is not None else None
+
+    def get_id(self, name: str) -> Optional[str]:
+        self._ensure_loaded()
+        with self._lock:
+            row = self._servers.get(name)
+            return row['id'] if row is not None else None
+
+    def all(self) -> List[Dict]:
+        self._ensure_loaded()
+        with self._lock:
+            return [dict(row) for row in self._servers.values()]
+
+    def select(self, predicate: Callable[[Dict], bool]) -> List[Dict]:
+        """Copies of the servers predicate(row) accepts"""
+        self._ensure_loaded()
+        with self._lock:
+            return [dict(row) for row in self._servers.values() if predicate(row)]
+
+    def update(self, name: str, fields: Dict, persist: bool = True) -> Optional[str]:
+        """Merge fields into a server row.
+
+        Returns the previous status, or None if the server is unknown.
+        Unknown servers are ignored, like an UPDATE that matches no row.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            row = self._servers.get(name)
+            if row is None:
+                return None
+            old_status = row.get('status')
+            row.update(fields)
+            if persist:
+                self._dirty.add(name)
+            server_id = row['id']
+        self._notify([(name, server_id)])
+        return old_status
+
+    def update_if(self, name: str, fields: Dict, condition: Callable[[Dict], bool]) -> Optional[Dict]:
+        """Merge fields into a server row if condition(row) holds.
+
+        The check and the update happen under the store lock, so no other
+        update can slip in between. Returns a copy of the updated row, or
+        None if the server is unknown or the condition failed.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            row = self._servers.get(name)
+            if row is None or not condition(row):
+                return None
+            row.update(fields)
+            self._dirty.add(name)
+            server = dict(row)
+        self._notify([(name, server['id'])])
+        return server
+
+    def apply(self, record: Dict):
+        """Take a server row as another worker last saw it.
+
+        Inserts the server if this process does not know it yet; the row
+        is not marked dirty, the worker that owns the change persists it.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            row = self._servers.get(record['name'])
+            if row is None:
+                row = self._servers[record['name']] = {}
+            elif row['id'] != record['id']:
+                self._names_by_id.pop(row['id'], None)
+            row.update(record)
+            self._names_by_id[record['id']] = record['name']
+        self._notify([(record['name'], record['id'])])
+
+    def update_by_id(self, server_id: str, fields: Dict, persist: bool = True) -> Optional[str]:
+        self._ensure_loaded()
+        with self._lock:
+            name = self._names_by_id.get(server_id)
+            if name is None:
+                return None
+            return self.update(name, fields, persist)
+
+    def dirty_count(self) -> int:
+        with self._lock:
+            return len(self._dirty)
+
+    def flush(self) -> int:
+        """Write all pending changes to SQLite in a single transaction"""
+        waited_since = time.perf_counter()
+        with self._flush_lock:
+            instruments.observe('db.flush_lock_wait', time.perf_counter() - waited_since)
+            with self._lock:
+                if not self._dirty:
+                    return 0
+                names = list(self._dirty)
+                self._dirty.clear()
+                params = [
+                    tuple(self._servers[name].get(field) for field in self.PERSISTED_FIELDS) + (name,)
+                    for name in names if name in self._servers
+                ]
+
+            assignments = ', '.join(f'{field} = ?' for field in self.PERSISTED_FIELDS)
+            conn = self._connect()
+            try:
+                # Includes any wait for SQLite's write lock (busy timeout)
+                with instruments.timer('db.state_write'):
+                    conn.executemany(f'UPDATE servers SET {assignments} WHERE name = ?', params)
+                    conn.commit()
+            except Exception as e:
+                conn.rollback()
+                # Keep the rows dirty so the next flush retries them
+                with self._lock:
+                    self._dirty.update(name for name in names if name in self._servers)
+                logging.error(f"Error flushing live server state: {e}")
+                raise
+            finally:
+                conn.close()
+            return len(params)
+
+    def exclusive(self):
+        """Lock held while writing to the servers table outside the store"""
+        return self._flush_lock
+
+
+@per_database
+def get_live_state(db_path: str) -> LiveStateStore:
+    return LiveStateStore(db_path)
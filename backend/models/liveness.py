@@ -0,0 +1,111 @@
+import heapq
+import threading
+import time
+from typing import Callable, List, Optional
+from models.database import per_database
+import logging
+
+
+class LivenessTracker:
+    """Deadline-driven detection of servers that stopped reporting.
+
+    Every report pushes the server's next deadline onto a heap: its own
+    observed report interval plus a grace period. A single thread sleeps
+    until the earliest deadline, so each report costs O(log n) and
+    nothing scans the fleet. Superseded heap entries are skipped lazily
+    when they reach the top.
+    """
+
+    # Weight of the newest gap in the report interval estimate
+    SMOOTHING = 0.3
+
+    def __init__(self, grace_period: float = 10.0, initial_interval: float = 20.0,
+                 max_interval: float = 300.0):
+        self.grace_period = grace_period
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self._heap = []  # (deadline, name)
+        self._deadlines = {}  # name -> current deadline
+        self._last_seen = {}  # name -> monotonic time of the last report
+        self._intervals = {}  # name -> smoothed report interval
+        self._condition = threading.Condition()
+        self._on_expire = None
+        self._thread = None
+        self.expired_count = 0
+
+    def start(self, on_expire: Callable[[List[str]], None]):
+        """Call on_expire(names) from a background thread when deadlines pass"""
+        self._on_expire = on_expire
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='liveness', daemon=True)
+            self._thread.start()
+
+    def seen(self, name: str, now: Optional[float] = None):
+        """Record a report or heartbeat from a server"""
+        now = now if now is not None else time.monotonic()
+        with self._condition:
+            last = self._last_seen.get(name)
+            interval = self._intervals.get(name, self.initial_interval)
+            if last is not None:
+                gap = min(max(now - last, 0.5), self.max_interval)
+                if name in self._intervals:
+                    interval += self.SMOOTHING * (gap - interval)
+                else:
+                    interval = gap
+                self._intervals[name] = interval
+            self._last_seen[name] = now
+
+            deadline = now + interval + self.grace_period
+            self._deadlines[name] = deadline
+            wake = not self._heap or deadline < self._heap[0][0]
+            heapq.heappush(self._heap, (deadline, name))
+            if wake:
+                self._condition.notify()
+
+    def forget(self, name: str):
+        """Stop tracking a server (deleted or no longer expected to report)"""
+        with self._condition:
+            self._deadlines.pop(name, None)
+            self._last_seen.pop(name, None)
+            self._intervals.pop(name, None)
+
+    def stats(self):
+        with self._condition:
+            return {
+                'tracked': len(self._deadlines),
+                'heap_size': len(self._heap),
+                'expired': self.expired_count
+            }
+
+    def _pop_expired(self, now: float) -> List[str]:
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, name = heapq.heappop(self._heap)
+            if self._deadlines.get(name) == deadline:
+                # Expired servers are tracked again on their next report;
+                # the outage itself must not count as a report interval
+                del self._deadlines[name]
+                self._last_seen.pop(name, None)
+                expired.append(name)
+        return expired
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    now = time.monotonic()
+                    expired = self._pop_expired(now)
+                    if expired:
+                        break
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    self._condition.wait(timeout)
+                self.expired_count += len(expired)
+            try:
+                self._on_expire(expired)
+            except Exception as e:
+                logging.error(f"Error handling expired servers: {e}")
+
+
+@per_database
+def get_liveness_tracker(db_path: str, grace_period: float, initial_interval: float) -> LivenessTracker:
+    return LivenessTracker(grace_period, initial_interval)
@@ -0,0 +1,299 @@
+import threading
+import time
+from typing import Dict, List, Optional
+from models.database import get_pool, per_database
+from services.instrumentation import instruments
+import logging
+
+# Metrics kept in the history tables
+METRIC_FIELDS = ('cpu', 'memory', 'disk', 'network_in', 'network_out')
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _aggregate_columns(raw: bool) -> str:
+    """SELECT list of sample count and min/avg/max for every metric"""
+    if raw:
+        aggregates = [f'MIN({field}), AVG({field}), MAX({field})' for field in METRIC_FIELDS]
+        return ', '.join(['COUNT(*)'] + aggregates)
+    # Averages of rolled-up buckets are weighted by their sample count
+    aggregates = [
+        f'MIN({field}_min), SUM({field}_avg * samples) / SUM(samples), MAX({field}_max)'
+        for field in METRIC_FIELDS
+    ]
+    return ', '.join(['SUM(samples)'] + aggregates)
+
+
+class MetricsHistory:
+    """Append-only metric history with automatic downsampling.
+
+    Raw agent samples go to metrics_raw and are rolled up into 1-minute
+    and 1-hour min/avg/max buckets. Each table has its own retention, so
+    the database stays bounded however long the fleet has been running.
+    """
+
+    # (name, table, bucket size in seconds), finest first
+    RESOLUTIONS = (
+        ('raw', 'metrics_raw', 0),
+        ('1m', 'metrics_1m', 60),
+        ('1h', 'metrics_1h', 3600),
+    )
+
+    # Cap on the number of points returned when no step is requested
+    MAX_POINTS = 720
+
+    # Samples kept queued while writes keep failing; the oldest are dropped beyond this
+    MAX_PENDING = 100000
+
+    def __init__(self, db_path: str, retention: Dict[str, int]):
+        self.db_path = db_path
+        self.pool = get_pool(db_path)
+        self.retention = retention
+        self._pending = []
+        self._lock = threading.Lock()
+        # Start of the oldest minute that still needs to be rolled up
+        self._rollup_from = None
+
+    def init_db(self, c):
+        """Create history tables using an open cursor from Server.init_db"""
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS metrics_raw (
+                server_id TEXT NOT NULL,
+                ts INTEGER NOT NULL,
+                cpu REAL,
+                memory REAL,
+                disk REAL,
+                network_in REAL,
+                network_out REAL
+            )
+        ''')
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_metrics_raw_server_ts
+            ON metrics_raw(server_id, ts)
+        ''')
+        columns = ',\n'.join(
+            f'{field}_min REAL, {field}_avg REAL, {field}_max REAL' for field in METRIC_FIELDS
+        )
+        for _, table, _ in self.RESOLUTIONS[1:]:
+            c.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table} (
+                    server_id TEXT NOT NULL,
+                    ts INTEGER NOT NULL,
+                    samples INTEGER NOT NULL,
+                    {columns},
+                    PRIMARY KEY (server_id, ts)
+                ) WITHOUT ROWID
+            ''')
+
+    def record(self, server_id: str, sample: Dict, ts: float = None):
+        """Queue one sample; it is written on the next flush()"""
+        row = (server_id, int(ts if ts is not None else time.time())) + tuple(
+            _to_float(sample.get(field)) for field in METRIC_FIELDS
+        )
+        with self._lock:
+            self._pending.append(row)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self) -> int:
+        """Append queued samples to metrics_raw in one transaction"""
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+        conn = self.pool.connection()
+        try:
+            with instruments.timer('db.history_write'):
+                conn.executemany(f'''
+                    INSERT INTO metrics_raw (server_id, ts, {', '.join(METRIC_FIELDS)})
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+                conn.commit()
+            return len(rows)
+        except Exception as e:
+            conn.rollback()
+            # Requeue ahead of newer samples so the next flush retries them
+            with self._lock:
+                self._pending = rows + self._pending
+                dropped = len(self._pending) - self.MAX_PENDING
+                if dropped > 0:
+                    del self._pending[:dropped]
+            if dropped > 0:
+                instruments.count('db.history_dropped', dropped)
+            logging.error(f"Error writing metrics history: {e}")
+            raise
+        finally:
+            conn.close()
+
+    def backfill(self, server_id: str, samples: List[Dict], now: float = None) -> int:
+        """Insert samples with their original timestamps (e.g. an agent's offline spool).
+
+        Written immediately rather than queued, so the rollup that
+        mark_stale() schedules already sees them. Samples outside the
+        retention window or in the future are skipped.
+        """
+        now = now if now is not None else time.time()
+        oldest = now - max(self.retention.values())
+        rows = []
+        for sample in samples:
+            ts = _to_float(sample.get('ts')) if isinstance(sample, dict) else None
+            if ts is None or not oldest <= ts <= now + 60:
+                continue
+            rows.append((server_id, int(ts)) + tuple(
+                _to_float(sample.get(field)) for field in METRIC_FIELDS
+            ))
+        if not rows:
+            return 0
+        conn = self.pool.connection()
+        try:
+            conn.executemany(f'''
+                INSERT INTO metrics_raw (server_id, ts, {', '.join(METRIC_FIELDS)})
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logging.error(f"Error writing metrics backfill: {e}")
+            raise
+        finally:
+            conn.close()
+        self.mark_stale(min(row[1] for row in rows))
+        return len(rows)
+
+    def mark_stale(self, ts: float):
+        """Make the next rollup revisit buckets from ts on (for late samples)"""
+        minute = int(ts) // 60 * 60
+        with self._lock:
+            if self._rollup_from is None or minute < self._rollup_from:
+                self._rollup_from = minute
+
+    def rollup(self, now: float = None, lag: float = 0):
+        """Roll completed minutes and hours up and apply retention.
+
+        Queued samples are flushed first. Minutes within lag seconds of
+        now are left for the next run, so samples still buffered by
+        another writer (at most one flush interval old) are not missed.
+        """
+        self.flush()
+        now = int(now if now is not None else time.time())
+        cutoff = int(now - lag)
+        current_minute = cutoff // 60 * 60
+        current_hour = cutoff // 3600 * 3600
+        conn = self.pool.connection()
+        c = conn.cursor()
+        try:
+            with self._lock:
+                start = self._rollup_from
+            if start is None:
+                c.execute('SELECT MAX(ts) FROM metrics_1m')
+                latest = c.fetchone()[0]
+                if latest is not None:
+                    start = latest + 60
+                else:
+                    c.execute('SELECT MIN(ts) FROM metrics_raw')
+                    earliest = c.fetchone()[0]
+                    start = earliest // 60 * 60 if earliest is not None else current_minute
+
+            if start < current_minute:
+                self._aggregate(c, 'metrics_raw', 'metrics_1m', 60, start, current_minute, raw=True)
+                hour_start = start // 3600 * 3600
+                if hour_start < current_hour:
+                    self._aggregate(c, 'metrics_1m', 'metrics_1h', 3600, hour_start, current_hour)
+
+            for name, table, _ in self.RESOLUTIONS:
+                c.execute(f'DELETE FROM {table} WHERE ts < ?', (now - self.retention[name],))
+            conn.commit()
+
+            with self._lock:
+                # Unless mark_stale() moved it back while we were running
+                if self._rollup_from is None or self._rollup_from >= start:
+                    self._rollup_from = max(start, current_minute)
+        except Exception as e:
+            conn.rollback()
+            logging.error(f"Error rolling up metrics history: {e}")
+            raise
+        finally:
+            conn.close()
+
+    def _aggregate(self, c, source, target, bucket, start, end, raw=False):
+        """Recompute target buckets in [start, end) from the source table"""
+        c.execute(f'''
+            INSERT OR REPLACE INTO {target}
+            SELECT server_id, ts / {bucket} * {bucket} AS bucket, {_aggregate_columns(raw)}
+            FROM {source}
+            WHERE ts >= ? AND ts < ?
+            GROUP BY server_id, bucket
+        ''', (start, end))
+
+    def choose_resolution(self, start: float, end: float, step: Optional[int], now: float = None):
+        """Pick the coarsest resolution that still covers the range at the given step.
+
+        Returns (resolution name, table, bucket size, effective step).
+        """
+        now = now if now is not None else time.time()
+        if not step:
+            step = max(1, int((end - start) / self.MAX_POINTS))
+        # Only resolutions whose retention reaches back to start can answer the query
+        covering = [r for r in self.RESOLUTIONS if now - self.retention[r[0]] <= start]
+        if not covering:
+            covering = [self.RESOLUTIONS[-1]]
+        fitting = [r for r in covering if r[2] <= step]
+        name, table, bucket = fitting[-1] if fitting else covering[0]
+        return name, table, bucket, max(step, bucket)
+
+    def query(self, server_id: str, start: float, end: float, step: Optional[int] = None,
+              now: float = None) -> Dict:
+        """Return min/avg/max points for one server between start and end.
+
+        now should be the time the caller derived a default range from,
+        so that e.g. the last hour is still answered from raw samples.
+        """
+        name, table, bucket, step = self.choose_resolution(start, end, step, now)
+
+        conn = self.pool.connection()
+        c = conn.cursor()
+        try:
+            c.execute(f'''
+                SELECT ts / {step} * {step} AS bucket, {_aggregate_columns(name == 'raw')}
+                FROM {table}
+                WHERE server_id = ? AND ts >= ? AND ts <= ?
+                GROUP BY bucket
+                ORDER BY bucket
+            ''', (server_id, int(start), int(end)))
+            columns = ['ts', 'samples'] + [
+                f'{field}_{kind}' for field in METRIC_FIELDS for kind in ('min', 'avg', 'max')
+            ]
+            points = [dict(zip(columns, row)) for row in c.fetchall()]
+        finally:
+            conn.close()
+
+        return {
+            'server_id': server_id,
+            'resolution': name,
+            'step': step,
+            'from': int(start),
+            'to': int(end),
+            'points': points
+        }
+
+    def delete_server(self, server_id: str):
+        """Remove all history of a server"""
+        conn = self.pool.connection()
+        try:
+            for _, table, _ in self.RESOLUTIONS:
+                conn.execute(f'DELETE FROM {table} WHERE server_id = ?', (server_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+
+@per_database
+def get_metrics_history(db_path: str, retention: Dict[str, int]) -> MetricsHistory:
+    return MetricsHistory(db_path, retention)
@@ -1,11 +1,18 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import sqlite3
 from typing import Dict, List
 import bcrypt
 import hashlib
 import os
 import jwt
+import time
 from config import Config
+from models.allow_list import get_allow_list
+from models.database import get_pool, per_database
+from models.live_state import get_live_state
+from models.liveness import get_liveness_tracker
+from models.metrics_history import get_metrics_history
+from services.instrumentation import instruments
 import logging
 
 class Server:
@@ -17,17 +24,36 @@ class Server:
     # Add timeout configuration
     CONNECTION_TIMEOUT = 30  # Connection timeout in seconds
     
+    # Columns the fleet listing can be filtered on
+    LIST_FILTERS = ('status', 'location', 'type', 'os_type')
+    
+    # Upper bound on remembered verified tokens
+    MAX_VERIFIED_TOKENS = 256
+    
     def __init__(self, db_path: str):
         self.db_path = db_path
+        self.pool = get_pool(db_path)
+        self.allow_list = get_allow_list(db_path)
+        # Shared by every Server instance using the same database
+        self.live_state = get_live_state(db_path)
+        self.history = get_metrics_history(db_path, Config.METRICS_RETENTION)
+        self.liveness = get_liveness_tracker(
+            db_path, Config.LIVENESS_GRACE_PERIOD, Config.LIVENESS_INITIAL_INTERVAL
+        )
+        self._verified_tokens = {}  # token -> expiry (epoch seconds)
+        self._db_initialized = False
 
     def init_db(self):
         """Initialize database and create required tables if they don't exist"""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        
+        # Runs once per instance: it also marks every running server stopped
+        if self._db_initialized:
+            return
         # Ensure the database directory exists
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         
+        conn = self.get_db()
+        c = conn.cursor()
+        
         try:
             # Create tables (if not exists)
             c.execute('''
@@ -85,7 +111,17 @@ class Server:
                     is_initialized BOOLEAN DEFAULT FALSE
                 )
             ''')
+            
+            # Index for the paginated fleet listing
+            c.execute('''
+                CREATE INDEX IF NOT EXISTS idx_servers_order
+                ON servers(order_index DESC, id)
+            ''')
+            
+            # Create metrics history tables
+            self.history.init_db(c)
             conn.commit()
+            self._db_initialized = True
             print("Database initialized successfully")
         except Exception as e:
             print(f"Error initializing database: {e}")
@@ -94,102 +130,277 @@ class Server:
             conn.close()
 
     def get_all_servers(self) -> List[Dict]:
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('SELECT * FROM servers')
-        columns = [description[0] for description in c.description]
-        servers = []
-        for row in c.fetchall():
-            server = dict(zip(columns, row))
-            servers.append(server)
-        conn.close()
-        return servers
+        return self.live_state.all()
 
-    def update_server(self, server_data: Dict):
+    def list_servers(self, filters: Dict[str, List[str]] = None, after: tuple = None,
+                     limit: int = None):
+        """One page of the fleet, ordered by (order_index DESC, id).
+
+        filters maps columns from LIST_FILTERS to accepted values; after is
+        the (order_index, id) key of the last server on the previous page.
+        Unfiltered pages are selected with the servers index and filled
+        with the live records. Filtered pages are not index-backed: they
+        scan and sort the live records in memory, since the table lags
+        them by up to one flush interval.
+        Returns (servers, key of the last server or None).
+        """
+        if filters:
+            return self._list_live_servers(filters, after, limit)
+        
+        servers = []
+        last_key = None
+        batch = limit or -1
         conn = self.get_db()
         c = conn.cursor()
         try:
-            # Get current status
-            c.execute('SELECT status FROM servers WHERE name = ?', (server_data['name'],))
-            current = c.fetchone()
-            old_status = current[0] if current else 'unknown'
-            
-            # Modify status logic
-            # If client update is received, the server is considered running
-            server_data['status'] = 'running'
-            
-            # Update timestamp
-            server_data['last_update'] = datetime.now().isoformat()
-            
-            # Log status change
-            if old_status != server_data['status']:
-                self.log_status_change(server_data['name'], old_status, server_data['status'])
-            
-            # Execute update
-            c.execute('''
-                UPDATE servers 
-                SET type = ?,
-                    location = ?,
-                    ip_address = ?,
-                    status = ?,
-                    uptime = ?,
-                    network_in = ?,
-                    network_out = ?,
-                    cpu = ?,
-                    memory = ?,
-                    disk = ?,
-                    os_type = ?,
-                    cpu_info = ?,
-                    total_memory = ?,
-                    total_disk = ?,
-                    last_update = ?
-                WHERE name = ?
-            ''', (
-                server_data.get('type', 'Unknown'),
-                server_data.get('location', 'UN'),
-                server_data.get('ip_address', '127.0.0.1'),
-                server_data['status'],
-                server_data.get('uptime', 0),
-                server_data.get('network_in', 0),
-                server_data.get('network_out', 0),
-                server_data.get('cpu', 0),
-                server_data.get('memory', 0),
-                server_data.get('disk', 0),
-                server_data.get('os_type', 'Unknown'),
-                server_data.get('cpu_info', 'N/A'),
-                server_data.get('total_memory', 0),
-                server_data.get('total_disk', 0),
-                server_data['last_update'],
-                server_data['name']
-            ))
-            conn.commit()
+            while True:
+                where, key_params = '', []
+                if after is not None:
+                    where = 'WHERE order_index < ? OR (order_index = ? AND id > ?)'
+                    key_params = [after[0], after[0], after[1]]
+                c.execute(f'''
+                    SELECT id, order_index FROM servers
+                    {where}
+                    ORDER BY order_index DESC, id
+                    LIMIT ?
+                ''', key_params + [batch])
+                rows = c.fetchall()
+                
+                for server_id, order_index in rows:
+                    after = (order_index, server_id)
+                    server = self.live_state.get_by_id(server_id)
+                    # Deleted since the query
+                    if server is None:
+                        continue
+                    servers.append(server)
+                    last_key = after
+                    if limit and len(servers) >= limit:
+                        return servers, last_key
+                
+                if not limit or len(rows) < batch:
+                    return servers, None
         finally:
             conn.close()
 
+    def _list_live_servers(self, filters: Dict[str, List[str]], after: tuple = None,
+                           limit: int = None):
+        """list_servers() with filters, from the in-memory live state"""
+        servers = self.live_state.select(
+            lambda server: all(server.get(column) in values for column, values in filters.items())
+        )
+        key = lambda server: (-(server.get('order_index') or 0), server['id'])  # noqa: E731
+        servers.sort(key=key)
+        if after is not None:
+            after_key = (-(after[0] or 0), after[1])
+            servers = [server for server in servers if key(server) > after_key]
+        if not limit or len(servers) <= limit:
+            return servers, None
+        last = servers[limit - 1]
+        return servers[:limit], (last.get('order_index') or 0, last['id'])
+
+    def get_server(self, server_id: str):
+        """Get the live state of a single server by id"""
+        return self.live_state.get_by_id(server_id)
+
+    # Fields an agent reports, with the value used when a full report omits one
+    REPORT_DEFAULTS = {
+        'type': 'Unknown',
+        'location': 'UN',
+        'ip_address': '127.0.0.1',
+        'uptime': 0,
+        'network_in': 0,
+        'network_out': 0,
+        'cpu': 0,
+        'memory': 0,
+        'disk': 0,
+        'os_type': 'Unknown',
+        'cpu_info': 'N/A',
+        'total_memory': 0,
+        'total_disk': 0
+    }
+    
+    # Older agents send numbers as strings
+    INTEGER_FIELDS = ('uptime',)
+    REAL_FIELDS = ('network_in', 'network_out', 'cpu', 'memory', 'disk', 'total_memory', 'total_disk')
+
+    def _coerce_report(self, fields: Dict) -> Dict:
+        for key in self.INTEGER_FIELDS + self.REAL_FIELDS:
+            value = fields.get(key)
+            if isinstance(value, str):
+                try:
+                    number = float(value)
+                    fields[key] = int(number) if key in self.INTEGER_FIELDS else number
+                except ValueError:
+                    fields[key] = 0
+        return fields
+
+    @instruments.timed('ingest.apply')
+    def update_server(self, server_data: Dict, partial: bool = False):
+        """Merge an agent report into the live state.
+
+        A full report replaces every reported field, falling back to
+        defaults; a partial report (a delta) only changes the fields it
+        carries. Returns the merged server record, or None if the server
+        is not registered. The change reaches the database on the next
+        flush_live_state().
+        """
+        if partial:
+            fields = {key: server_data[key] for key in self.REPORT_DEFAULTS if key in server_data}
+        else:
+            fields = {key: server_data.get(key, default) for key, default in self.REPORT_DEFAULTS.items()}
+        self._coerce_report(fields)
+        
+        # Modify status logic
+        # If client update is received, the server is considered running
+        fields['status'] = 'running'
+        
+        # Update timestamp
+        fields['last_update'] = datetime.now().isoformat()
+        
+        old_status = self.live_state.update(server_data['name'], fields)
+        
+        # Log status change
+        if old_status != fields['status']:
+            self.log_status_change(server_data['name'], old_status or 'unknown', fields['status'])
+        
+        if old_status is None:
+            return None
+        
+        self.liveness.seen(server_data['name'])
+        
+        # Append to the metrics history
+        server = self.live_state.get(server_data['name'])
+        self.history.record(server['id'], server)
+        return server
+
+    def update_servers(self, reports: List[Dict]):
+        """Apply a batch of agent reports, e.g. forwarded by a relay.
+
+        The allow list is read once for the whole batch. Each report is
+        merged into the live state like update_server(), so the batch
+        reaches the database in the next flush's single executemany.
+        Returns (per-item results, updated server records).
+        """
+        with instruments.timer('ingest.allow_list'):
+            allowed = self.allow_list.names()
+        results, servers = [], []
+        for report in reports:
+            name = report.get('name') if isinstance(report, dict) else None
+            if not name or 'id' not in report:
+                results.append({'name': name, 'status': 'error', 'error': 'Invalid data'})
+                continue
+            if name not in allowed:
+                results.append({'name': name, 'status': 'error', 'error': 'Client not allowed'})
+                continue
+            try:
+                server = self.update_server(report)
+            except Exception as e:
+                results.append({'name': name, 'status': 'error', 'error': str(e)})
+                continue
+            if server is None:
+                results.append({'name': name, 'status': 'error', 'error': 'Server not found'})
+                continue
+            results.append({'name': name, 'status': 'success'})
+            servers.append(server)
+        return results, servers
+
+    def backfill_metrics(self, client_name: str, samples: List[Dict]):
+        """Add samples recorded while an agent was offline to the history.
+
+        Only the history is written; live status and metrics are left to
+        the agent's current reports. Returns the number of samples stored,
+        or None if the server is not registered.
+        """
+        server_id = self.live_state.get_id(client_name)
+        if server_id is None:
+            return None
+        return self.history.backfill(server_id, samples)
+
+    def set_server_status(self, server_id: str, status: str) -> bool:
+        """Set the status of a server, e.g. to put it into maintenance"""
+        old_status = self.live_state.update_by_id(server_id, {'status': status})
+        if old_status is None:
+            return False
+        if old_status != status:
+            server = self.live_state.get_by_id(server_id)
+            self.log_status_change(server['name'], old_status, status)
+        return True
+
+    def touch_server(self, server_id: str) -> bool:
+        """Record a heartbeat: refresh last_update and mark the server running"""
+        server = self.live_state.get_by_id(server_id)
+        if server is None:
+            return False
+        if server['status'] != self.STATUS_MAINTENANCE:
+            old_status = self.live_state.update_by_id(server_id, {
+                'last_update': datetime.now().isoformat(),
+                'status': self.STATUS_RUNNING
+            })
+            self.liveness.seen(server['name'])
+            if old_status != self.STATUS_RUNNING:
+                self.log_status_change(server['name'], old_status, self.STATUS_RUNNING)
+        return True
+
+    def mark_stopped(self, names: List[str]) -> List[Dict]:
+        """Mark running servers that missed their deadline as stopped.
+
+        The status and the time of the last report are checked again
+        under the live state lock, so a report that arrives after the
+        deadline passed keeps the server running. Returns the updated
+        records. The status reaches the database on the next
+        flush_live_state().
+        """
+        cutoff = datetime.now() - timedelta(seconds=self.liveness.grace_period)
+
+        def expired(server):
+            if server['status'] != self.STATUS_RUNNING:
+                return False
+            try:
+                return datetime.fromisoformat(server['last_update']) <= cutoff
+            except (TypeError, ValueError):
+                return True
+
+        stopped = []
+        for name in names:
+            server = self.live_state.update_if(name, {'status': self.STATUS_STOPPED}, expired)
+            if server is None:
+                continue
+            self.log_status_change(name, self.STATUS_RUNNING, self.STATUS_STOPPED)
+            stopped.append(server)
+        return stopped
+
+    @instruments.timed('db.flush')
+    def flush_live_state(self):
+        """Write pending live state changes and history samples to the database"""
+        try:
+            self.history.flush()
+            return self.live_state.flush()
+        except Exception as e:
+            print(f"Error flushing server state: {e}")
+            return 0
+
+    def roll_up_metrics(self):
+        """Downsample metrics history and drop expired samples"""
+        try:
+            # Other workers' samples may be buffered for up to one flush interval
+            self.history.rollup(lag=2 * Config.LIVE_STATE_FLUSH_INTERVAL)
+        except Exception as e:
+            print(f"Error rolling up metrics: {e}")
+
+    def get_metrics(self, server_id: str, start: float, end: float, step: int = None,
+                    now: float = None) -> Dict:
+        """Get metrics history of a server at the best stored resolution"""
+        return self.history.query(server_id, start, end, step, now=now)
+
     def get_db(self):
-        return sqlite3.connect(self.db_path)
+        """Get a pooled connection; close() returns it to the pool"""
+        return self.pool.connection()
 
     def get_latest_servers(self) -> List[Dict]:
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        try:
-            c.execute('''
-                SELECT id, name, type, location, status, uptime, 
-                       network_in, network_out, cpu, memory, disk, 
-                       os_type, order_index, first_seen, last_update
-                FROM servers
-                ORDER BY order_index DESC, first_seen ASC
-            ''')
-            
-            columns = [description[0] for description in c.description]
-            servers = []
-            for row in c.fetchall():
-                server_dict = dict(zip(columns, row))
-                servers.append(server_dict)
-            
-            return servers
-        finally:
-            conn.close()
+        servers = self.live_state.all()
+        servers.sort(key=lambda s: s.get('first_seen') or '')
+        servers.sort(key=lambda s: s.get('order_index') or 0, reverse=True)
+        return servers
 
     def get_next_order_index(self):
         conn = self.get_db()
@@ -211,6 +422,8 @@ class Server:
                 WHERE id = ?
             ''', (order_index, server_id))
             conn.commit()
+            # order_index is not part of the flushed columns, keep memory in sync only
+            self.live_state.update_by_id(server_id, {'order_index': order_index}, persist=False)
             return True
         except Exception as e:
             print(f"Error updating server order: {e}")
@@ -219,44 +432,29 @@ class Server:
             conn.close()
 
     def check_server_status(self):
-        """Unified server status check method"""
-        conn = self.get_db()
-        c = conn.cursor()
-        try:
-            current_time = datetime.now()
-            
-            # Get all servers that need to be checked
-            c.execute('''
-                SELECT id, name, last_update, status
-                FROM servers 
-                WHERE status = 'running'
-                AND datetime(last_update) < datetime(?, '-30 seconds')
-                AND status != 'maintenance'
-            ''', (current_time.isoformat(),))
-            
-            servers_to_check = c.fetchall()
-            
-            for server_id, name, last_update, status in servers_to_check:
-                last_update_time = datetime.fromisoformat(last_update)
-                if (current_time - last_update_time).total_seconds() > 30:
-                    c.execute('''
-                        UPDATE servers
-                        SET status = 'stopped'
-                        WHERE id = ? AND status = 'running'
-                    ''', (server_id,))
-                    self.log_status_change(name, 'running', 'stopped')
-            
-            conn.commit()
-        finally:
-            conn.close()
+        """Full sweep for stale servers (the liveness tracker does this per deadline)"""
+        current_time = datetime.now()
+        
+        for server in self.live_state.all():
+            if server['status'] != self.STATUS_RUNNING or not server.get('last_update'):
+                continue
+            last_update_time = datetime.fromisoformat(server['last_update'])
+            if (current_time - last_update_time).total_seconds() > self.CONNECTION_TIMEOUT:
+                self.live_state.update(server['name'], {'status': self.STATUS_STOPPED})
+                self.log_status_change(server['name'], self.STATUS_RUNNING, self.STATUS_STOPPED)
 
     def delete_server(self, server_id: str) -> bool:
         """Delete all records of the specified server"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_db()
         c = conn.cursor()
         try:
             c.execute('DELETE FROM servers WHERE id = ?', (server_id,))
             conn.commit()
+            server = self.live_state.get_by_id(server_id)
+            if server:
+                self.liveness.forget(server['name'])
+            self.live_state.remove(server_id)
+            self.history.delete_server(server_id)
             return True
         except Exception as e:
             print(f"Error deleting server: {e}")
@@ -272,6 +470,8 @@ class Server:
         client_name = client_name.strip()
         conn = self.get_db()
         c = conn.cursor()
+        # Keep a concurrent flush from writing the old row back
+        self.live_state.exclusive().acquire()
         try:
             # Delete existing client records (if any)
             c.execute('DELETE FROM allowed_clients WHERE name = ?', (client_name,))
@@ -312,21 +512,18 @@ class Server:
             ))
             
             conn.commit()
+            self.live_state.reload_server(client_name)
         except Exception as e:
             conn.rollback()
             raise Exception(f"Failed to add client: {str(e)}")
         finally:
+            self.live_state.exclusive().release()
+            self.allow_list.invalidate()
             conn.close()
 
     def is_client_allowed(self, client_name: str) -> bool:
-        """Check if the client is allowed"""
-        conn = self.get_db()
-        c = conn.cursor()
-        try:
-            c.execute('SELECT name FROM allowed_clients WHERE name = ?', (client_name,))
-            return c.fetchone() is not None
-        finally:
-            conn.close()
+        """Check if the client is allowed (served from the cached allow list)"""
+        return self.allow_list.contains(client_name)
 
     def delete_allowed_client(self, client_name: str):
         """Delete allowed clients"""
@@ -342,11 +539,13 @@ class Server:
                 WHERE name = ?
             ''', (client_name,))
             conn.commit()
+            self.live_state.update(client_name, {'status': self.STATUS_STOPPED}, persist=False)
         finally:
+            self.allow_list.invalidate()
             conn.close()
 
     def set_admin_password(self, password: str) -> bool:
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_db()
         c = conn.cursor()
         try:
             # Use bcrypt for password encryption
@@ -381,7 +580,7 @@ class Server:
             conn.close()
 
     def verify_password(self, password: str) -> bool:
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_db()
         c = conn.cursor()
         try:
             c.execute('SELECT password_hash FROM admin_auth WHERE is_initialized = TRUE')
@@ -399,7 +598,7 @@ class Server:
             conn.close()
 
     def is_initialized(self) -> bool:
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_db()
         c = conn.cursor()
         try:
             c.execute('SELECT is_initialized FROM admin_auth WHERE is_initialized = TRUE')
@@ -409,11 +608,19 @@ class Server:
 
     def verify_token(self, token: str) -> bool:
         """Verify JWT token"""
-        try:
-            jwt.decode(token, Config.SECRET_KEY, algorithms=["HS256"])
+        # Tokens that already verified are trusted until they expire
+        expires = self._verified_tokens.get(token)
+        if expires is not None and expires > time.time():
             return True
+        try:
+            payload = jwt.decode(token, Config.SECRET_KEY, algorithms=["HS256"])
         except:
+            self._verified_tokens.pop(token, None)
             return False
+        if len(self._verified_tokens) >= self.MAX_VERIFIED_TOKENS:
+            self._verified_tokens.clear()
+        self._verified_tokens[token] = payload.get('exp', time.time() + 60)
+        return True
 
     def update_client_connection(self, client_name: str, is_connected: bool):
         """Update client connection status"""
@@ -431,50 +638,27 @@ class Server:
 
     def update_last_activity(self, client_name: str):
         """Update client's last activity time"""
-        conn = self.get_db()
-        c = conn.cursor()
-        try:
-            current_time = datetime.now().isoformat()
-            c.execute('''
-                UPDATE servers 
-                SET last_update = ?,
-                    status = 'running'
-                WHERE name = ?
-            ''', (current_time, client_name))
-            conn.commit()
-        finally:
-            conn.close()
+        current_time = datetime.now().isoformat()
+        self.live_state.update(client_name, {
+            'last_update': current_time,
+            'status': self.STATUS_RUNNING
+        })
 
     def check_client_connection(self, client_name: str):
         """Check client connection based on last activity"""
-        conn = self.get_db()
-        c = conn.cursor()
-        try:
-            c.execute('''
-                SELECT last_update 
-                FROM servers 
-                WHERE name = ?
-            ''', (client_name,))
-            result = c.fetchone()
+        server = self.live_state.get(client_name)
+        
+        if server and server.get('last_update'):
+            last_update = datetime.fromisoformat(server['last_update'])
+            current_time = datetime.now()
             
-            if result:
-                last_update = datetime.fromisoformat(result[0])
-                current_time = datetime.now()
-                
-                # Change timeout from 20 seconds to 30 seconds to match check_server_status
-                if (current_time - last_update).total_seconds() <= 30:
-                    return
-                
-            # If no update within 30 seconds or no record found, set status to stopped
-            c.execute('''
-                UPDATE servers 
-                SET status = 'stopped' 
-                WHERE name = ? 
-                AND status = 'running'
-            ''', (client_name,))
-            conn.commit()
-        finally:
-            conn.close()
+            # Change timeout from 20 seconds to 30 seconds to match check_server_status
+            if (current_time - last_update).total_seconds() <= 30:
+                return
+            
+        # If no update within 30 seconds or no record found, set status to stopped
+        if server and server['status'] == self.STATUS_RUNNING:
+            self.live_state.update(client_name, {'status': self.STATUS_STOPPED})
 
     def log_status_change(self, server_name: str, old_status: str, new_status: str):
         """Enhanced status change logging"""
@@ -482,4 +666,9 @@ class Server:
         log_message = f"{current_time} - Server '{server_name}' status changed: {old_status} -> {new_status}"
         
         # Write to log file
-        logging.info(log_message)
\ No newline at end of file
+        logging.info(log_message)
+
+
+@per_database
+def get_server_model(db_path: str) -> Server:
+    return Server(db_path)
@@ -1,11 +1,18 @@
-from flask import Blueprint, request, jsonify
-from models.server import Server
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from models.server import Server, get_server_model
+from services.fleet_feed import FleetFeed
+from services.fleet_snapshot import FleetSnapshot
+from services.instrumentation import instruments
 from config import Config
 from datetime import datetime
 import sqlite3
+import base64
+import json
+import time
+import zlib
 
 api = Blueprint('api', __name__)
-server_model = Server(Config.DATABASE_PATH)
+server_model = get_server_model(Config.DATABASE_PATH)
 
 @api.route('/servers/<server_id>/status', methods=['PUT', 'OPTIONS'])
 def update_server_status(server_id):
@@ -23,134 +30,358 @@ def update_server_status(server_id):
             return jsonify({'error': 'Invalid status'}), 400
             
         # Update server status
-        server_model.update_server({
-            'id': server_id,
-            'status': new_status
-        })
+        if not server_model.set_server_status(server_id, new_status):
+            return jsonify({'error': 'Server not found'}), 404
         
         # Get updated server data
-        conn = server_model.get_db()
-        c = conn.cursor()
-        try:
-            c.execute('SELECT * FROM servers WHERE id = ? ORDER BY last_update DESC LIMIT 1', (server_id,))
-            server_data = c.fetchone()
-            if server_data:
-                columns = [description[0] for description in c.description]
-                return jsonify(dict(zip(columns, server_data)))
-        finally:
-            conn.close()
-            
-        return jsonify({'error': 'Server not found'}), 404
+        return jsonify(server_model.get_server(server_id))
             
     except Exception as e:
         print(f"Error updating server status: {e}")
         return jsonify({'error': str(e)}), 500
 
 @api.route('/servers/update', methods=['POST'])
+@instruments.timed('http.update_server')
 def update_server():
     try:
-        data = request.json
-        print(f"Received update data: {data}")
+        with instruments.timer('ingest.decode'):
+            data = request.get_json(silent=True)
         
         if not data or 'id' not in data or 'name' not in data:
             return jsonify({'error': 'Invalid data'}), 400
             
         # Check if the client is allowed
-        if not server_model.is_client_allowed(data['name']):
+        with instruments.timer('ingest.allow_list'):
+            allowed = server_model.is_client_allowed(data['name'])
+        if not allowed:
+            instruments.count('http.update_server.rejected')
             return jsonify({'error': 'Client not allowed'}), 403
             
-        # Get current server status
-        conn = server_model.get_db()
-        c = conn.cursor()
-        try:
-            c.execute('SELECT status, order_index FROM servers WHERE id = ?', (data['id'],))
-            result = c.fetchone()
+        # A single in-memory write; it reaches the database with the next batched flush
+        server_model.update_server(data)
+        return jsonify({'status': 'success'}), 200
             
-            if result:
-                current_status, order_index = result
-                # Update status based on current state
-                if current_status in ['maintenance', 'stopped']:
-                    data['status'] = 'running'
-                elif current_status == 'running':
-                    data['status'] = 'running'  # Maintain running status
-                data['order_index'] = order_index
-            else:
-                # New server first connection
-                data['status'] = 'running'
-                c.execute('SELECT COALESCE(MAX(order_index), 0) FROM servers')
-                data['order_index'] = c.fetchone()[0] - 1
+    except Exception as e:
+        instruments.count('http.update_server.errors')
+        print(f"Error in update_server: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def parse_bulk_reports(body: bytes, content_type: str) -> list:
+    """Reports from a JSON array, a {'servers': [...]} object (the payload
+    of the server_bulk_update event) or an NDJSON body (one report per line)"""
+    if 'ndjson' not in content_type and body.lstrip()[:1] in (b'[', b'{'):
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None  # more than one line of NDJSON
+        if isinstance(data, dict) and 'servers' in data:
+            return data['servers']
+        if isinstance(data, list):
+            return data
+    return [json.loads(line) for line in body.splitlines() if line.strip()]
+
+@api.route('/servers/bulk-update', methods=['POST'])
+def bulk_update_servers():
+    """Many agent reports in one request, for relays and proxies"""
+    try:
+        try:
+            reports = parse_bulk_reports(request.get_data(), request.content_type or '')
+        except ValueError:
+            return jsonify({'error': 'Invalid JSON'}), 400
             
-            server_model.update_server(data)
-            return jsonify({'status': 'success'}), 200
+        if not isinstance(reports, list):
+            return jsonify({'error': 'Invalid data'}), 400
+        if len(reports) > Config.BULK_UPDATE_MAX_ITEMS:
+            return jsonify({'error': f'At most {Config.BULK_UPDATE_MAX_ITEMS} reports per request'}), 413
             
-        finally:
-            conn.close()
+        results, servers = server_model.update_servers(reports)
+        return jsonify({
+            'accepted': len(servers),
+            'rejected': len(results) - len(servers),
+            'results': results
+        }), 200
             
     except Exception as e:
-        print(f"Error in update_server: {e}")
+        print(f"Error in bulk_update_servers: {e}")
         return jsonify({'error': str(e)}), 500
 
+class PayloadTooLarge(ValueError):
+    """A request body over its configured size limit (HTTP 413)"""
+
+def gunzip_limited(data: bytes, limit: int) -> bytes:
+    """Decompress gzip data, refusing to produce more than limit bytes"""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = decompressor.decompress(data, limit)
+    except zlib.error as e:
+        raise ValueError(f'Invalid gzip data: {e}')
+    if not decompressor.eof:
+        if decompressor.unconsumed_tail or len(data) >= limit:
+            raise PayloadTooLarge(f'Backfill larger than {limit} bytes')
+        raise ValueError('Truncated gzip data')
+    return data
+
+def decode_backfill(payload) -> dict:
+    """{'name': ..., 'samples': [...]} from a dict or gzip-compressed JSON"""
+    if isinstance(payload, (bytes, bytearray)):
+        payload = json.loads(gunzip_limited(payload, Config.BACKFILL_MAX_BYTES))
+    if not isinstance(payload, dict) or not payload.get('name') \
+            or not isinstance(payload.get('samples'), list):
+        raise ValueError('Invalid data')
+    if len(payload['samples']) > Config.BACKFILL_MAX_SAMPLES:
+        raise ValueError(f'At most {Config.BACKFILL_MAX_SAMPLES} samples per backfill')
+    return payload
+
+def apply_backfill(payload, name: str = None):
+    """Store an agent's offline samples; returns (response body, status code).
+
+    When the caller names the client up front, the allow list is checked
+    before the payload is decoded, and the payload must be for that client.
+    """
+    if name is not None and not server_model.is_client_allowed(name):
+        return {'error': 'Client not allowed'}, 403
+    try:
+        data = decode_backfill(payload)
+    except PayloadTooLarge as e:
+        return {'error': str(e)}, 413
+    except (ValueError, OSError, EOFError) as e:
+        return {'error': str(e)}, 400
+    if name is not None and data['name'] != name:
+        return {'error': 'Payload is for another client'}, 400
+    if not server_model.is_client_allowed(data['name']):
+        return {'error': 'Client not allowed'}, 403
+    stored = server_model.backfill_metrics(data['name'], data['samples'])
+    if stored is None:
+        return {'error': 'Server not found'}, 404
+    return {'status': 'success', 'stored': stored}, 200
+
+@api.route('/servers/backfill', methods=['POST'])
+def backfill_server_metrics():
+    """History samples an agent recorded while the backend was unreachable.
+
+    ?name= identifies the client, so unknown clients are turned away
+    before their body is read.
+    """
+    try:
+        name = request.args.get('name')
+        if not name:
+            return jsonify({'error': 'name query parameter is required'}), 400
+        if not server_model.is_client_allowed(name):
+            return jsonify({'error': 'Client not allowed'}), 403
+        
+        body = request.stream.read(Config.BACKFILL_MAX_BYTES + 1)
+        if len(body) > Config.BACKFILL_MAX_BYTES:
+            return jsonify({'error': f'Backfill larger than {Config.BACKFILL_MAX_BYTES} bytes'}), 413
+        if request.headers.get('Content-Encoding') != 'gzip':
+            try:
+                body = json.loads(body)
+            except ValueError:
+                return jsonify({'error': 'Invalid JSON'}), 400
+        result, status = apply_backfill(body, name)
+        return jsonify(result), status
+    except Exception as e:
+        print(f"Error in backfill_server_metrics: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# Columns returned by the fleet listing
+SERVER_LIST_COLUMNS = (
+    'id', 'name', 'type', 'location', 'status', 'uptime',
+    'network_in', 'network_out', 'cpu', 'memory', 'disk',
+    'os_type', 'cpu_info', 'total_memory', 'total_disk',
+    'ip_address', 'order_index'
+)
+
+MASKED_IP = '***.***.***.**'
+
+# Query parameters that switch GET /api/servers to the paginated listing
+LIST_QUERY_PARAMS = ('limit', 'cursor', 'fields') + Server.LIST_FILTERS
+
+def is_request_authenticated(allow_query_token: bool = False) -> bool:
+    """Check the admin token from the Authorization header.
+
+    ?token= is only read with allow_query_token, for the SSE stream:
+    EventSource cannot set headers, and query strings end up in access logs.
+    """
+    # 检查是否有认证token
+    token = request.args.get('token') if allow_query_token else None
+    auth_header = request.headers.get('Authorization')
+    if auth_header:
+        try:
+            token = auth_header.split(' ')[1]
+        except IndexError:
+            pass
+    return bool(token) and server_model.verify_token(token)
+
+def project_server(server, is_authenticated: bool):
+    server_dict = {column: server.get(column) for column in SERVER_LIST_COLUMNS}
+    # 对未认证的请求隐藏IP地址
+    if not is_authenticated:
+        server_dict['ip_address'] = MASKED_IP
+    return server_dict
+
+# Push feed for dashboards, shared by every stream subscriber
+fleet_feed = FleetFeed(server_model.live_state, project_server, max_rate=Config.DASHBOARD_PUSH_RATE)
+
+# Cached listing bodies for GET /api/servers, rebuilt once per fleet change
+fleet_snapshot = FleetSnapshot(server_model.live_state, project_server, max_age=Config.SNAPSHOT_MAX_AGE)
+
+# Largest page GET /api/servers?limit= returns
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(key) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> tuple:
+    padded = cursor + '=' * (-len(cursor) % 4)
+    order_index, server_id = json.loads(base64.urlsafe_b64decode(padded))
+    return int(order_index), str(server_id)
+
+def parse_list_query(args):
+    """Validate the paging, projection and filter parameters of the fleet listing"""
+    query = {'filters': {}, 'after': None, 'limit': None, 'fields': None}
+    for column in Server.LIST_FILTERS:
+        if args.get(column):
+            query['filters'][column] = args[column].split(',')
+    if args.get('limit'):
+        limit = args.get('limit', type=int)
+        if limit is None or not 0 < limit <= MAX_PAGE_SIZE:
+            raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+        query['limit'] = limit
+    if args.get('cursor'):
+        try:
+            query['after'] = decode_cursor(args['cursor'])
+        except Exception:
+            raise ValueError('Invalid cursor')
+    if args.get('fields'):
+        fields = args['fields'].split(',')
+        unknown = [field for field in fields if field not in SERVER_LIST_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        query['fields'] = fields
+    return query
+
+def list_servers_page(is_authenticated: bool):
+    """Paginated, filtered and projected listing, see get_servers"""
+    try:
+        query = parse_list_query(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    with instruments.timer('read.list_query'):
+        servers, last_key = server_model.list_servers(query['filters'], query['after'], query['limit'])
+    result = []
+    for server in servers:
+        server_dict = project_server(server, is_authenticated)
+        if query['fields']:
+            server_dict = {field: server_dict[field] for field in query['fields']}
+        result.append(server_dict)
+    
+    response = jsonify(result)
+    if last_key is not None:
+        response.headers['X-Next-Cursor'] = encode_cursor(last_key)
+    return response
+
 @api.route('/servers', methods=['GET'])
+@instruments.timed('http.get_servers')
 def get_servers():
+    """Fleet listing.
+
+    Without parameters the whole fleet is returned from the cached
+    snapshot. limit/cursor page through it by (order_index DESC, id),
+    fields= selects columns and status, location, type and os_type
+    filter it (comma-separated values); the cursor for the next page is
+    in the X-Next-Cursor header.
+    """
     try:
-        conn = server_model.get_db()
-        c = conn.cursor()
-        c.execute('''
-            SELECT id, name, type, location, status, uptime, 
-                   network_in, network_out, cpu, memory, disk, 
-                   os_type, cpu_info, total_memory, total_disk, 
-                   ip_address, order_index
-            FROM servers 
-            ORDER BY order_index DESC
-        ''')
-        servers = c.fetchall()
-        columns = [description[0] for description in c.description]
+        is_authenticated = is_request_authenticated()
+        if any(param in request.args for param in LIST_QUERY_PARAMS):
+            return list_servers_page(is_authenticated)
         
-        # 检查是否有认证token
-        auth_header = request.headers.get('Authorization')
-        is_authenticated = False
-        if auth_header:
-            try:
-                token = auth_header.split(' ')[1]
-                if server_model.verify_token(token):
-                    is_authenticated = True
-            except:
-                pass
+        view = fleet_snapshot.view(is_authenticated)
+        headers = {
+            'ETag': view.etag,
+            'Cache-Control': 'no-cache',
+            'Vary': 'Accept-Encoding, Authorization'
+        }
         
-        # Convert to list of dictionaries
-        result = []
-        for server in servers:
-            server_dict = dict(zip(columns, server))
-            # 对未认证的请求隐藏IP地址
-            if not is_authenticated:
-                server_dict['ip_address'] = '***.***.***.**'
-            result.append(server_dict)
-            
-        return jsonify(result)
+        # Unchanged since the client's copy
+        if request.if_none_match.contains_raw(view.etag):
+            instruments.count('http.get_servers.not_modified')
+            return Response(status=304, headers=headers)
+        
+        encoding = fleet_snapshot.negotiate(view, request.accept_encodings)
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(view.body(encoding), mimetype='application/json', headers=headers)
     except Exception as e:
+        instruments.count('http.get_servers.errors')
         print(f"Error getting servers: {e}")
         return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
+
+@api.route('/servers/stream', methods=['GET'])
+def stream_servers():
+    """Server-Sent Events feed: one 'snapshot' event, then coalesced 'diff' events"""
+    subscription = fleet_feed.subscribe(is_request_authenticated(allow_query_token=True))
+
+    def events():
+        try:
+            while True:
+                frame = subscription.next_frame(timeout=15)
+                if frame is None:
+                    # Keep proxies from closing an idle stream
+                    yield ': keepalive\n\n'
+                    continue
+                event, data = frame
+                yield f'event: {event}\ndata: {data}\n\n'
+        finally:
+            fleet_feed.unsubscribe(subscription)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 @api.route('/servers/<server_id>', methods=['GET'])
 def get_server_status(server_id):
     try:
-        conn = server_model.get_db()
-        c = conn.cursor()
-        c.execute('SELECT * FROM servers WHERE id = ? ORDER BY last_update DESC LIMIT 1', (server_id,))
-        server_data = c.fetchone()
-        columns = [description[0] for description in c.description]
-        if not server_data:
+        server_dict = server_model.get_server(server_id)
+        if not server_dict:
             return jsonify({'error': 'Server not found'}), 404
             
-        columns = [description[0] for description in c.description]
-        server_dict = dict(zip(columns, server_data))
         return jsonify(server_dict)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
+
+def _parse_time(value, default: float) -> float:
+    """Parse a query timestamp given as epoch seconds or ISO 8601"""
+    if value is None or value == '':
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@api.route('/servers/<server_id>/metrics', methods=['GET'])
+def get_server_metrics(server_id):
+    try:
+        if not server_model.get_server(server_id):
+            return jsonify({'error': 'Server not found'}), 404
+            
+        try:
+            now = time.time()
+            end = _parse_time(request.args.get('to'), now)
+            start = _parse_time(request.args.get('from'), end - 3600)
+            step = int(request.args['step']) if request.args.get('step') else None
+        except ValueError:
+            return jsonify({'error': 'Invalid from, to or step'}), 400
+            
+        if start >= end or (step is not None and step <= 0):
+            return jsonify({'error': 'Invalid time range'}), 400
+            
+        return jsonify(server_model.get_metrics(server_id, start, end, step, now=now))
+    except Exception as e:
+        print(f"Error getting server metrics: {e}")
+        return jsonify({'error': str(e)}), 500
 
 @api.route('/servers/<server_id>/order', methods=['PUT'])
 def update_server_order(server_id):
@@ -161,20 +392,10 @@ def update_server_order(server_id):
         if order_index is None:
             return jsonify({'error': 'Order index is required'}), 400
             
-        conn = server_model.get_db()
-        c = conn.cursor()
-        
-        try:
-            c.execute('''
-                UPDATE servers 
-                SET order_index = ? 
-                WHERE id = ?
-            ''', (order_index, server_id))
-            conn.commit()
+        if not server_model.update_server_order(server_id, order_index):
+            return jsonify({'error': 'Failed to update order'}), 500
             
-            return jsonify({'status': 'success'}), 200
-        finally:
-            conn.close()
+        return jsonify({'status': 'success'}), 200
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -183,21 +404,15 @@ def update_server_order(server_id):
 def delete_server(server_id):
     try:
         # Get server name
-        conn = server_model.get_db()
-        c = conn.cursor()
-        try:
-            c.execute('SELECT name FROM servers WHERE id = ?', (server_id,))
-            result = c.fetchone()
-            if result:
-                client_name = result[0]
-                # Delete server record
-                server_model.delete_server(server_id)
-                # Delete allowed client
-                server_model.delete_allowed_client(client_name)
-                return jsonify({'status': 'success'}), 200
+        server = server_model.get_server(server_id)
+        if not server:
             return jsonify({'error': 'Server not found'}), 404
-        finally:
-            conn.close()
+            
+        # Delete server record
+        server_model.delete_server(server_id)
+        # Delete allowed client
+        server_model.delete_allowed_client(server['name'])
+        return jsonify({'status': 'success'}), 200
     except Exception as e:
         print(f"Error deleting server: {e}")
         return jsonify({'error': str(e)}), 500
@@ -210,18 +425,12 @@ def add_client():
             return jsonify({'error': 'Client name is required'}), 400
             
         # Check if the client name already exists
-        conn = server_model.get_db()
-        c = conn.cursor()
-        try:
-            c.execute('SELECT name FROM allowed_clients WHERE name = ?', (data['name'],))
-            if c.fetchone():
-                return jsonify({'error': 'Client already exists'}), 400
-                
-            # Add new client
-            server_model.add_allowed_client(data['name'])
-            return jsonify({'status': 'success'}), 200
-        finally:
-            conn.close()
+        if server_model.is_client_allowed(data['name']):
+            return jsonify({'error': 'Client already exists'}), 400
+            
+        # Add new client
+        server_model.add_allowed_client(data['name'])
+        return jsonify({'status': 'success'}), 200
             
     except Exception as e:
         print(f"Error adding client: {e}")
@@ -271,19 +480,8 @@ def reset_password():
 def server_heartbeat(server_id):
     """Lightweight heartbeat endpoint"""
     try:
-        conn = server_model.get_db()
-        c = conn.cursor()
-        try:
-            current_time = datetime.now().isoformat()
-            c.execute('''
-                UPDATE servers 
-                SET last_update = ?, status = 'running'
-                WHERE id = ? AND status != 'maintenance'
-            ''', (current_time, server_id))
-            conn.commit()
-            return jsonify({'status': 'success'}), 200
-        finally:
-            conn.close()
+        server_model.touch_server(server_id)
+        return jsonify({'status': 'success'}), 200
     except Exception as e:
         print(f"Error in heartbeat: {e}")
         return jsonify({'error': str(e)}), 500
@@ -0,0 +1,32 @@
+from flask import Blueprint, Response, request, jsonify
+from routes.api import server_model
+from services.prometheus import FleetExposition
+from config import Config
+import hmac
+
+metrics = Blueprint('metrics', __name__)
+
+# Exposition cache, re-rendered per changed host
+fleet_exposition = FleetExposition(server_model.live_state)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+@metrics.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint for the live fleet"""
+    if Config.METRICS_TOKEN:
+        # Prometheus sends it with `authorization: {credentials: ...}`
+        auth_header = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(auth_header, f'Bearer {Config.METRICS_TOKEN}'):
+            return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        if 'gzip' in request.accept_encodings:
+            response = Response(fleet_exposition.render_gzip(), content_type=CONTENT_TYPE)
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = Response(fleet_exposition.render(), content_type=CONTENT_TYPE)
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+    except Exception as e:
+        print(f"Error rendering metrics: {e}")
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,57 @@
+"""Production entry point for the backend.
+
+    ASYNC_MODE=gevent python serve.py
+
+ASYNC_MODE=threading (the default) serves like `python app.py`, with
+one OS thread per websocket. With gevent (or eventlet) every connection
+is a green thread instead, so a single process can hold tens of
+thousands of mostly idle agent sockets. The standard library has to be
+monkey-patched before the app and its threads are imported, which is
+why this is a separate script rather than a flag on app.py.
+"""
+import os
+import time
+
+STARTED = time.perf_counter()
+
+ASYNC_MODE = os.getenv('ASYNC_MODE', 'threading')
+
+if ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+elif ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+
+
+def raise_open_file_limit():
+    """Every agent socket is a file descriptor; use the hard limit"""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass  # Windows, or not allowed
+
+
+def main():
+    raise_open_file_limit()
+    from app import app, socketio
+    from config import Config
+    from services.instrumentation import startup
+
+    # Count the interpreter's own imports and monkey-patching as well
+    startup.begin(STARTED)
+    print(startup.summary())
+
+    options = {}
+    if ASYNC_MODE == 'threading':
+        options['allow_unsafe_werkzeug'] = True
+    print(f"Starting server on {Config.LISTEN_HOST}:{Config.PORT} ({ASYNC_MODE})...")
+    socketio.run(app, host=Config.LISTEN_HOST, port=Config.PORT, debug=False,
+                 use_reloader=False, log_output=False, **options)
+
+
+if __name__ == '__main__':
+    main()
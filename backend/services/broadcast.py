@@ -0,0 +1,138 @@
+import threading
+from typing import Callable, Dict
+import logging
+from services.instrumentation import instruments
+
+
+class BroadcastFanout:
+    """Batches server_status_update broadcasts to Socket.IO viewers.
+
+    Agent updates are buffered per tick, keyed by server name, so several
+    updates from one host within a tick collapse into its latest state.
+    Each tick sends one 'server_status_batch' frame per room (encoded once
+    and reused for every member) to viewers that asked for batches when
+    connecting; the others get the per-server 'server_status_update'
+    events they always got, one per host updated in the tick.
+
+    Viewers whose socket still has more than max_backlog packets queued
+    are skipped for that tick instead of letting their queue grow. With
+    distributed=True (a shared message queue) batches are emitted even
+    without local viewers, since other workers may have some.
+    """
+
+    # Authenticated viewers get full records, everyone else masked IPs
+    ADMIN_ROOM = 'status_admins'
+    VIEWER_ROOM = 'status_viewers'
+    # Viewers that did not negotiate status_batch
+    LEGACY_ADMIN_ROOM = 'status_admins_legacy'
+    LEGACY_VIEWER_ROOM = 'status_viewers_legacy'
+    ROOMS = (
+        (ADMIN_ROOM, True, True),
+        (VIEWER_ROOM, False, True),
+        (LEGACY_ADMIN_ROOM, True, False),
+        (LEGACY_VIEWER_ROOM, False, False)
+    )
+
+    def __init__(self, socketio, project: Callable[[Dict, bool], Dict],
+                 interval: float = 0.5, max_backlog: int = 64, namespace: str = '/',
+                 distributed: bool = False):
+        self.socketio = socketio
+        self.project = project
+        self.interval = interval
+        self.max_backlog = max_backlog
+        self.namespace = namespace
+        self.distributed = distributed
+        self._buffer = {}  # name -> latest server record
+        self._lock = threading.Lock()
+        self._started = False
+        self.counters = {
+            'received': 0,   # updates handed to publish()
+            'coalesced': 0,  # updates merged into one already buffered this tick
+            'sent': 0,       # frames delivered to a viewer
+            'dropped': 0,    # frames skipped for a backlogged viewer
+            'ticks': 0       # ticks that sent a batch
+        }
+
+    def start(self):
+        if not self._started:
+            self._started = True
+            self.socketio.start_background_task(self._run)
+
+    def add_viewer(self, sid: str, authenticated: bool, batch: bool = False):
+        """Subscribe a socket; batch=True if it negotiated server_status_batch"""
+        for room, admin, batched in self.ROOMS:
+            if admin == authenticated and batched == batch:
+                self.socketio.server.enter_room(sid, room, namespace=self.namespace)
+
+    def remove_viewer(self, sid: str):
+        for room, _, _ in self.ROOMS:
+            self.socketio.server.leave_room(sid, room, namespace=self.namespace)
+
+    def publish(self, server: Dict):
+        """Queue a server record for the next tick; never blocks on sockets"""
+        with self._lock:
+            self.counters['received'] += 1
+            buffered = self._buffer.get(server['name'])
+            if buffered is not None:
+                self.counters['coalesced'] += 1
+                buffered.update(server)
+            else:
+                self._buffer[server['name']] = dict(server)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self.counters, buffered=len(self._buffer))
+
+    def _backlog(self, eio_sid: str) -> int:
+        """Number of packets waiting in a viewer's engine.io send queue"""
+        try:
+            return self.socketio.server.eio.sockets[eio_sid].queue.qsize()
+        except Exception:
+            return 0
+
+    def _members(self, room: str):
+        manager = self.socketio.server.manager
+        if self.namespace not in manager.rooms:
+            return []
+        return list(manager.get_participants(self.namespace, room))
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Error broadcasting server status: {e}")
+
+    def flush(self):
+        """Send everything buffered since the last tick"""
+        with self._lock:
+            servers, self._buffer = list(self._buffer.values()), {}
+        if not servers:
+            return
+        with instruments.timer('broadcast.flush'):
+            self._send(servers)
+
+    def _send(self, servers):
+        sent = dropped = 0
+        for room, authenticated, batched in self.ROOMS:
+            members = self._members(room)
+            if not members and not self.distributed:
+                continue
+            skipped = [sid for sid, eio_sid in members if self._backlog(eio_sid) > self.max_backlog]
+            if len(skipped) < len(members) or self.distributed:
+                batch = [self.project(server, authenticated) for server in servers]
+                if batched:
+                    self.socketio.emit('server_status_batch', batch, to=room,
+                                       namespace=self.namespace, skip_sid=skipped)
+                else:
+                    for server in batch:
+                        self.socketio.emit('server_status_update', server, to=room,
+                                           namespace=self.namespace, skip_sid=skipped)
+            sent += len(members) - len(skipped)
+            dropped += len(skipped)
+
+        with self._lock:
+            self.counters['ticks'] += 1
+            self.counters['sent'] += sent
+            self.counters['dropped'] += dropped
@@ -0,0 +1,208 @@
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+import logging
+
+
+class LocalBus:
+    """In-process message bus; lets several workers share state in one process (tests)"""
+
+    def __init__(self):
+        self._subscribers = []
+
+    def publish(self, message: Dict):
+        for callback in list(self._subscribers):
+            callback(message)
+
+    def subscribe(self, callback: Callable[[Dict], None], on_reconnect: Callable[[], None] = None):
+        self._subscribers.append(callback)
+
+
+class RedisBus:
+    """Message bus over a Redis pub/sub channel, shared by every worker"""
+
+    # Seconds between attempts to resubscribe after losing Redis
+    RECONNECT_DELAY = 1
+    RECONNECT_DELAY_MAX = 30
+
+    def __init__(self, url: str, channel: str = 'server-monitor:state'):
+        import redis
+        self.redis = redis.Redis.from_url(url)
+        self.channel = channel
+
+    def publish(self, message: Dict):
+        self.redis.publish(self.channel, json.dumps(message))
+
+    def subscribe(self, callback: Callable[[Dict], None], on_reconnect: Callable[[], None] = None):
+        """Call callback for every message on a background thread.
+
+        The thread resubscribes with exponential backoff when the
+        connection to Redis drops. Messages published meanwhile are lost;
+        on_reconnect is called after resubscribing so the caller can
+        refresh what it may have missed.
+        """
+        import redis
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+
+        def listen():
+            nonlocal pubsub
+            delay = self.RECONNECT_DELAY
+            while True:
+                try:
+                    for item in pubsub.listen():
+                        delay = self.RECONNECT_DELAY
+                        try:
+                            callback(json.loads(item['data']))
+                        except Exception as e:
+                            logging.error(f"Error handling cluster message: {e}")
+                except (redis.ConnectionError, redis.TimeoutError, OSError) as e:
+                    logging.error(f"Lost cluster bus subscription, retrying in {delay}s: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, self.RECONNECT_DELAY_MAX)
+                try:
+                    pubsub.close()
+                    pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(self.channel)
+                except (redis.ConnectionError, redis.TimeoutError, OSError) as e:
+                    logging.error(f"Cluster bus resubscribe failed: {e}")
+                    continue
+                logging.info("Cluster bus subscription restored")
+                if on_reconnect is not None:
+                    try:
+                        on_reconnect()
+                    except Exception as e:
+                        logging.error(f"Error after cluster bus reconnect: {e}")
+
+        threading.Thread(target=listen, name='cluster-bus', daemon=True).start()
+
+
+_local_bus = LocalBus()
+
+
+def get_bus(url: str):
+    """Bus for a MESSAGE_QUEUE URL: None when unset, memory:// for in-process"""
+    if not url:
+        return None
+    if url.startswith('memory://'):
+        return _local_bus
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBus(url)
+    raise ValueError(f'Unsupported message queue: {url}')
+
+
+class ClusterSync:
+    """Keeps the live state of several backend workers in step.
+
+    Every worker owns the agents connected to it: it merges their reports,
+    persists them and tracks their deadlines. Local changes are coalesced
+    and published on the bus every interval; other workers apply them to
+    their own store without persisting, feed them to their liveness
+    tracker so a host is still marked stopped if its worker goes away, and
+    drop their allow list cache when a client was added or removed.
+    """
+
+    def __init__(self, store, bus, liveness=None, allow_list=None,
+                 interval: float = 0.5, worker_id: Optional[str] = None):
+        self.store = store
+        self.bus = bus
+        self.liveness = liveness
+        self.allow_list = allow_list
+        self.interval = interval
+        self.worker_id = worker_id or f'{os.getpid()}-{os.urandom(3).hex()}'
+        self._pending = {}  # name -> server id
+        self._allow_list_changed = False
+        self._lock = threading.Lock()
+        # Set on the thread that applies remote changes, so they are not echoed
+        self._applying = threading.local()
+        self._thread = None
+        self.counters = {'published': 0, 'applied': 0}
+        # Load first: the rows read at startup are not news to the other workers
+        store.all()
+        store.add_listener(self._on_change)
+        if allow_list is not None:
+            allow_list.add_listener(self._on_allow_list_change)
+        bus.subscribe(self._on_message, on_reconnect=self._on_bus_reconnect)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='cluster-sync', daemon=True)
+            self._thread.start()
+
+    def _on_change(self, name: str, server_id: str):
+        if getattr(self._applying, 'active', False):
+            return
+        with self._lock:
+            self._pending[name] = server_id
+
+    def _on_allow_list_change(self):
+        if getattr(self._applying, 'active', False):
+            return
+        with self._lock:
+            self._allow_list_changed = True
+
+    def _on_bus_reconnect(self):
+        # Hosts catch up with their next report; an allow list change would not
+        if self.allow_list is not None:
+            self.allow_list.invalidate()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self.counters, worker=self.worker_id, pending=len(self._pending))
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.publish()
+            except Exception as e:
+                logging.error(f"Error publishing cluster state: {e}")
+
+    def publish(self):
+        """Send everything that changed locally since the last call"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            allow_list_changed, self._allow_list_changed = self._allow_list_changed, False
+        if not pending and not allow_list_changed:
+            return
+
+        servers, removed = [], []
+        for name, server_id in pending.items():
+            server = self.store.get(name)
+            if server is None:
+                removed.append([name, server_id])
+            else:
+                servers.append(server)
+        self.bus.publish({
+            'worker': self.worker_id,
+            'servers': servers,
+            'removed': removed,
+            'allow_list': allow_list_changed
+        })
+        with self._lock:
+            self.counters['published'] += len(servers) + len(removed)
+
+    def _on_message(self, message: Dict):
+        if message.get('worker') == self.worker_id:
+            return
+        self._applying.active = True
+        try:
+            for server in message.get('servers', []):
+                self.store.apply(server)
+                if self.liveness is not None:
+                    if server.get('status') == 'running':
+                        self.liveness.seen(server['name'])
+                    else:
+                        self.liveness.forget(server['name'])
+            for name, server_id in message.get('removed', []):
+                self.store.remove(server_id)
+                if self.liveness is not None:
+                    self.liveness.forget(name)
+            if message.get('allow_list') and self.allow_list is not None:
+                self.allow_list.invalidate()
+        finally:
+            self._applying.active = False
+        with self._lock:
+            self.counters['applied'] += len(message.get('servers', [])) + len(message.get('removed', []))
@@ -0,0 +1,124 @@
+import json
+import queue
+import threading
+import time
+from typing import Callable, Dict, Optional
+import logging
+
+
+class Subscription:
+    """One dashboard connection to the fleet feed"""
+
+    def __init__(self, feed, authenticated: bool, max_backlog: int):
+        self.feed = feed
+        self.authenticated = authenticated
+        self.frames = queue.Queue(maxsize=max_backlog)
+        # Set when frames were dropped; the next frame is a full snapshot
+        self.needs_snapshot = False
+
+    def next_frame(self, timeout: float) -> Optional[tuple]:
+        """Wait for the next (event, data) frame; None on timeout"""
+        if self.needs_snapshot:
+            self.needs_snapshot = False
+            return 'snapshot', self.feed.snapshot(self.authenticated)
+        try:
+            return self.frames.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def offer(self, frame: tuple):
+        try:
+            self.frames.put_nowait(frame)
+        except queue.Full:
+            # A slow reader resyncs from a snapshot instead of stalling the feed
+            while True:
+                try:
+                    self.frames.get_nowait()
+                except queue.Empty:
+                    break
+            self.needs_snapshot = True
+
+
+class FleetFeed:
+    """Push feed of fleet changes for dashboards.
+
+    A subscriber gets one snapshot of the fleet, then diff frames with
+    the servers that changed, coalesced to at most max_rate frames per
+    second. Each diff is serialized once per view (authenticated or
+    masked) and shared by all subscribers of that view, so the cost per
+    tick does not grow with viewers times fleet size.
+    """
+
+    def __init__(self, store, project: Callable[[Dict, bool], Dict],
+                 max_rate: float = 2.0, max_backlog: int = 32):
+        self.store = store
+        self.project = project
+        self.interval = 1.0 / max_rate
+        self.max_backlog = max_backlog
+        self._pending = {}  # name -> server id
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        store.add_listener(self._on_change)
+
+    def _on_change(self, name: str, server_id: str):
+        if not self._subscribers:
+            return
+        with self._lock:
+            self._pending[name] = server_id
+
+    def snapshot(self, authenticated: bool) -> str:
+        servers = self.store.all()
+        servers.sort(key=lambda s: (-(s.get('order_index') or 0), s['id']))
+        return json.dumps([self.project(server, authenticated) for server in servers])
+
+    def subscribe(self, authenticated: bool) -> Subscription:
+        subscription = Subscription(self, authenticated, self.max_backlog)
+        subscription.needs_snapshot = True
+        with self._lock:
+            self._subscribers.add(subscription)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='fleet-feed', daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                self.publish()
+            except Exception as e:
+                logging.error(f"Error publishing fleet feed: {e}")
+            time.sleep(max(0, self.interval - (time.monotonic() - started)))
+
+    def publish(self):
+        """Send one diff frame with everything that changed since the last one"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            subscribers = list(self._subscribers)
+        if not pending or not subscribers:
+            return
+
+        updated, removed = [], []
+        for name, server_id in pending.items():
+            server = self.store.get(name)
+            if server is None:
+                removed.append(server_id)
+            else:
+                updated.append(server)
+
+        frames = {}
+        for authenticated in {s.authenticated for s in subscribers}:
+            frames[authenticated] = ('diff', json.dumps({
+                'servers': [self.project(server, authenticated) for server in updated],
+                'removed': removed
+            }))
+        for subscription in subscribers:
+            subscription.offer(frames[subscription.authenticated])
@@ -0,0 +1,119 @@
+import gzip
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict
+from services.instrumentation import instruments
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always available
+    brotli = None
+
+
+class SnapshotView:
+    """Serialized fleet listing for one view at one generation"""
+
+    def __init__(self, generation: int, etag: str, body: bytes, built_at: float):
+        self.generation = generation
+        self.etag = etag
+        self.built_at = built_at
+        self._bodies = {'identity': body}
+        self._lock = threading.Lock()
+
+    def body(self, encoding: str = 'identity') -> bytes:
+        """The body in the given content encoding, compressed on first use"""
+        data = self._bodies.get(encoding)
+        if data is None:
+            with self._lock:
+                data = self._bodies.get(encoding)
+                if data is None:
+                    raw = self._bodies['identity']
+                    if encoding == 'br':
+                        data = brotli.compress(raw, quality=5)
+                    else:
+                        data = gzip.compress(raw, compresslevel=6)
+                    self._bodies[encoding] = data
+        return data
+
+
+class FleetSnapshot:
+    """Versioned, pre-serialized fleet listing for GET /api/servers.
+
+    Every change to the live state bumps a generation number. Each view
+    (authenticated or masked) is serialized, and compressed per encoding,
+    once per generation and then shared by every request, so an idle
+    fleet costs one dictionary lookup per poll and a conditional GET with
+    a matching ETag costs nothing else. A view is rebuilt on the first
+    request after a change. Only while the fleet changes continuously
+    (changes less than max_age apart) is it rebuilt at most once every
+    max_age seconds, and may lag by up to that long.
+    """
+
+    ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+    def __init__(self, store, project: Callable[[Dict, bool], Dict],
+                 max_age: float = 1.0, min_compress_size: int = 1024):
+        self.store = store
+        self.project = project
+        self.max_age = max_age
+        self.min_compress_size = min_compress_size
+        # Distinguishes ETags across restarts, when generations start over
+        self._instance = os.urandom(4).hex()
+        self.generation = 0
+        self._changed_at = float('-inf')
+        # True while changes arrive less than max_age apart
+        self._churning = False
+        self._views = {}  # authenticated -> SnapshotView
+        self._lock = threading.Lock()
+        store.add_listener(self._on_change)
+
+    def _on_change(self, name: str, server_id: str):
+        now = time.monotonic()
+        with self._lock:
+            self.generation += 1
+            self._churning = now - self._changed_at < self.max_age
+            self._changed_at = now
+
+    def view(self, authenticated: bool) -> SnapshotView:
+        view = self._views.get(authenticated)
+        if view is not None and (view.generation == self.generation
+                                 or (self._churning and time.monotonic() - view.built_at < self.max_age)):
+            return view
+        with self._lock:
+            generation = self.generation
+            view = self._views.get(authenticated)
+            if view is not None and view.generation == generation:
+                return view
+        with instruments.timer('read.snapshot_build'):
+            view = self._build(authenticated, generation)
+        with self._lock:
+            current = self._views.get(authenticated)
+            if current is None or current.generation < view.generation:
+                self._views[authenticated] = view
+        return view
+
+    def warm(self, authenticated: bool = False):
+        """Build a view and its compressed bodies ahead of the first request"""
+        view = self.view(authenticated)
+        if len(view.body()) >= self.min_compress_size:
+            for encoding in self.ENCODINGS:
+                view.body(encoding)
+
+    def _build(self, authenticated: bool, generation: int) -> SnapshotView:
+        servers = self.store.all()
+        servers.sort(key=lambda s: (-(s.get('order_index') or 0), s['id']))
+        body = json.dumps([self.project(server, authenticated) for server in servers],
+                          separators=(',', ':')).encode('utf-8')
+        etag = f'"{self._instance}-{generation}-{"a" if authenticated else "m"}"'
+        return SnapshotView(generation, etag, body, time.monotonic())
+
+    def negotiate(self, view: SnapshotView, accept_encodings) -> str:
+        """Pick the content encoding for a request's Accept-Encoding"""
+        if len(view.body()) < self.min_compress_size:
+            return 'identity'
+        for encoding in self.ENCODINGS:
+            if encoding in accept_encodings:
+                return encoding
+        return 'identity'
@@ -0,0 +1,379 @@
+import bisect
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional
+from config import Config
+
+
+class Histogram:
+    """Latency histogram with fixed, geometrically spaced buckets.
+
+    observe() is a bisect and three additions, cheap enough for every
+    report on the ingest path. Percentiles are reported as the upper
+    bound of the bucket they fall in (at most 50% high), capped at the
+    largest value seen.
+    """
+
+    # 10us up to ~74s
+    BOUNDS = tuple(1e-5 * 1.5 ** i for i in range(40))
+
+    def __init__(self):
+        self._counts = [0] * (len(self.BOUNDS) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        index = bisect.bisect_left(self.BOUNDS, seconds)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += seconds
+            if seconds > self._max:
+                self._max = seconds
+
+    def _percentile(self, counts, total: int, q: float, maximum: float) -> float:
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank and count:
+                bound = self.BOUNDS[index] if index < len(self.BOUNDS) else maximum
+                return min(bound, maximum)
+        return maximum
+
+    def snapshot(self) -> Dict:
+        """Count, mean, max and p50/p90/p99 in milliseconds"""
+        with self._lock:
+            counts, total, total_time, maximum = list(self._counts), self._count, self._sum, self._max
+        if not total:
+            return {'count': 0}
+        return {
+            'count': total,
+            'mean_ms': round(total_time / total * 1000, 3),
+            'p50_ms': round(self._percentile(counts, total, 0.50, maximum) * 1000, 3),
+            'p90_ms': round(self._percentile(counts, total, 0.90, maximum) * 1000, 3),
+            'p99_ms': round(self._percentile(counts, total, 0.99, maximum) * 1000, 3),
+            'max_ms': round(maximum * 1000, 3)
+        }
+
+
+class _Timer:
+    __slots__ = ('_histogram', '_started')
+
+    def __init__(self, histogram: Histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._histogram.observe(time.perf_counter() - self._started)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Instrumentation:
+    """Process-wide latency histograms, event counters and gauges.
+
+    Hot paths wrap their stages in timer(name) and bump count(name);
+    gauges are callables (queue depths and the like) evaluated only when
+    stats() is read, e.g. by GET /api/internal/stats. When disabled,
+    timer() returns a shared no-op context manager.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._histograms = {}
+        self._counters = Counter()
+        self._gauges = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def histogram(self, name: str) -> Histogram:
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram())
+        return histogram
+
+    def timer(self, name: str):
+        """Context manager recording the duration of its block"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self.histogram(name))
+
+    def observe(self, name: str, seconds: float):
+        if self.enabled:
+            self.histogram(name).observe(seconds)
+
+    def count(self, name: str, amount: int = 1):
+        if self.enabled:
+            with self._lock:
+                self._counters[name] += amount
+
+    def timed(self, name: str):
+        """Decorator counting calls of a function and timing each one"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                self.count(name)
+                with self.timer(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def add_gauge(self, name: str, read: Callable[[], float]):
+        """Register a value that is read when stats are collected"""
+        self._gauges[name] = read
+
+    def stats(self) -> Dict:
+        gauges = {}
+        for name, read in list(self._gauges.items()):
+            try:
+                gauges[name] = read()
+            except Exception as e:
+                gauges[name] = None
+                logging.error(f"Error reading gauge {name}: {e}")
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = dict(self._histograms)
+        return {
+            'enabled': self.enabled,
+            'since': self.started_at,
+            'latency': {name: histogram.snapshot() for name, histogram in sorted(histograms.items())},
+            'counters': dict(sorted(counters.items())),
+            'gauges': gauges
+        }
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+            self._counters = Counter()
+            self.started_at = time.time()
+
+
+class StartupTimer:
+    """Durations of the backend's startup phases.
+
+    Each mark(name) closes a phase that began at the previous mark, or at
+    the origin for the first one. The origin is when this module was
+    imported unless begin() moves it earlier, as serve.py does with the
+    time it started.
+    """
+
+    def __init__(self):
+        self._origin = time.perf_counter()
+        self._marks = []
+
+    def begin(self, origin: float):
+        """Measure from origin, a time.perf_counter() value"""
+        self._origin = origin
+
+    def mark(self, name: str):
+        self._marks.append((name, time.perf_counter()))
+
+    def phases(self) -> Dict[str, float]:
+        """Milliseconds spent in each phase, in order"""
+        phases, previous = {}, self._origin
+        for name, at in self._marks:
+            phases[name] = round((at - previous) * 1000, 1)
+            previous = at
+        return phases
+
+    def total_ms(self) -> float:
+        return round((self._marks[-1][1] - self._origin) * 1000, 1) if self._marks else 0.0
+
+    def summary(self) -> str:
+        phases = ', '.join(f'{name} {ms:.0f} ms' for name, ms in self.phases().items())
+        return f'Started in {self.total_ms():.0f} ms ({phases})'
+
+
+def _os_thread_api():
+    """The _thread module and sleep as they were before monkey-patching.
+
+    Under gevent or eventlet a green sampler would only run when the
+    loop yields, and would then mostly see itself.
+    """
+    import _thread
+    thread_module, sleep = _thread, time.sleep
+    if 'gevent' in sys.modules:
+        from gevent import monkey
+        if monkey.is_module_patched('_thread'):
+            thread_module = {name: monkey.get_original('_thread', name)
+                             for name in ('start_new_thread', 'allocate_lock', 'get_ident')}
+            sleep = monkey.get_original('time', 'sleep')
+    elif 'eventlet' in sys.modules:
+        from eventlet import patcher
+        if patcher.is_monkey_patched('thread'):
+            thread_module = patcher.original('_thread')
+            sleep = patcher.original('time').sleep
+    if not isinstance(thread_module, dict):
+        thread_module = {name: getattr(thread_module, name)
+                         for name in ('start_new_thread', 'allocate_lock', 'get_ident')}
+    return thread_module, sleep
+
+
+class SamplingProfiler:
+    """Statistical profiler that can be switched on in a running backend.
+
+    While running, an OS thread captures the stack of every other thread
+    each interval and counts the stacks, so the cost is a few
+    microseconds per sample regardless of how hot the sampled code is.
+    report() lists the hottest frames and stacks; folded() returns the
+    stacks in the collapsed format flame graph tools read.
+    """
+
+    MAX_DEPTH = 64
+
+    def __init__(self):
+        self._stacks = Counter()
+        self._samples = 0
+        self._running = False
+        self._generation = 0
+        self._interval = 0.005
+        self._started_at = None
+        self._stopped_at = None
+        self._thread_api, self._sleep = _os_thread_api()
+        # A real lock: it is shared with the sampler's OS thread
+        self._lock = self._thread_api['allocate_lock']()
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self, interval: float = 0.005, duration: Optional[float] = None):
+        """Start a new profile; stops by itself after duration seconds"""
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            self._stacks = Counter()
+            self._samples = 0
+            self._interval = interval
+            self._running = True
+            self._started_at = time.time()
+            self._stopped_at = None
+        self._thread_api['start_new_thread'](self._run, (generation, interval, duration))
+
+    def stop(self):
+        with self._lock:
+            if self._running:
+                self._running = False
+                self._stopped_at = time.time()
+
+    def _run(self, generation: int, interval: float, duration: Optional[float]):
+        own_id = self._thread_api['get_ident']()
+        deadline = time.monotonic() + duration if duration else None
+        while self._running and self._generation == generation:
+            if deadline is not None and time.monotonic() >= deadline:
+                self.stop()
+                break
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stacks.append(self._collapse(frame))
+            with self._lock:
+                if self._generation != generation:
+                    break
+                self._stacks.update(stacks)
+                self._samples += 1
+            self._sleep(interval)
+
+    def _collapse(self, frame) -> str:
+        names = []
+        while frame is not None and len(names) < self.MAX_DEPTH:
+            code = frame.f_code
+            names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def report(self, limit: int = 30) -> Dict:
+        with self._lock:
+            stacks, samples = Counter(self._stacks), self._samples
+        leaves = Counter()
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(stacks.values()) or 1
+        return {
+            'running': self._running,
+            'started_at': self._started_at,
+            'stopped_at': self._stopped_at,
+            'interval': self._interval,
+            'samples': samples,
+            'top_frames': [
+                {'frame': frame, 'count': count, 'percent': round(count * 100 / total, 2)}
+                for frame, count in leaves.most_common(limit)
+            ],
+            'top_stacks': [
+                {'stack': stack, 'count': count} for stack, count in stacks.most_common(limit)
+            ]
+        }
+
+    def folded(self) -> str:
+        with self._lock:
+            stacks = Counter(self._stacks)
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+
+# Loggers the Socket.IO and Engine.IO servers write every packet to at INFO
+ENGINE_LOGGERS = ('socketio.server', 'engineio.server')
+
+
+def engine_loggers(level: str):
+    """Loggers to hand to SocketIO(logger=..., engineio_logger=...).
+
+    With logger=True the servers log each packet at INFO to stderr,
+    which costs a formatted line per frame. These loggers start at the
+    given level (ERROR by default) and print to stderr when lowered;
+    set_engine_log_level() changes them at runtime.
+    """
+    loggers = []
+    for name in ENGINE_LOGGERS:
+        logger = logging.getLogger(name)
+        if not any(isinstance(handler, logging.StreamHandler) and not isinstance(handler, logging.FileHandler)
+                   for handler in logger.handlers):
+            logger.addHandler(logging.StreamHandler())
+        loggers.append(logger)
+    set_engine_log_level(level)
+    return loggers
+
+
+def set_engine_log_level(level: str) -> str:
+    """Set the Socket.IO/Engine.IO log level by name; returns the level set"""
+    numeric = logging.getLevelName(str(level).upper())
+    if not isinstance(numeric, int):
+        raise ValueError(f'Unknown log level: {level}')
+    for name in ENGINE_LOGGERS:
+        logging.getLogger(name).setLevel(numeric)
+    return logging.getLevelName(numeric)
+
+
+def engine_log_level() -> str:
+    return logging.getLevelName(logging.getLogger(ENGINE_LOGGERS[0]).getEffectiveLevel())
+
+
+instruments = Instrumentation(enabled=Config.INSTRUMENTATION_ENABLED)
+startup = StartupTimer()
+profiler = SamplingProfiler()
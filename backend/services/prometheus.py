@@ -0,0 +1,123 @@
+import gzip
+import threading
+from typing import Dict, List, Optional
+
+
+def _escape(value) -> str:
+    return str(value if value is not None else '').replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value) -> Optional[str]:
+    try:
+        return repr(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class FleetExposition:
+    """Prometheus text exposition of the live fleet for GET /metrics.
+
+    The sample lines of every host are rendered once per change (the
+    store listener marks the host dirty) and kept per metric family, so a
+    scrape only re-renders hosts that reported since the previous one and
+    then joins cached strings. An unchanged fleet returns the previous
+    body as is.
+    """
+
+    PREFIX = 'server_monitor_'
+    STATUSES = ('running', 'stopped', 'maintenance')
+
+    # (metric name, server field, help text)
+    GAUGES = (
+        ('cpu_percent', 'cpu', 'CPU usage in percent.'),
+        ('memory_percent', 'memory', 'Memory usage in percent.'),
+        ('disk_percent', 'disk', 'Disk usage over all partitions in percent.'),
+        ('network_receive_bytes_per_second', 'network_in', 'Network receive rate.'),
+        ('network_transmit_bytes_per_second', 'network_out', 'Network transmit rate.'),
+        ('uptime_seconds', 'uptime', 'Seconds since the host booted.'),
+    )
+
+    def __init__(self, store):
+        self.store = store
+        self._hosts = {}  # server id -> tuple of rendered lines per family
+        self._dirty = set()
+        self._body = None
+        self._gzipped = None
+        self._lock = threading.Lock()
+        self._loaded = False
+        store.add_listener(self._on_change)
+
+    def _on_change(self, name: str, server_id: str):
+        with self._lock:
+            self._dirty.add(server_id)
+            self._body = None
+            self._gzipped = None
+
+    def _render_host(self, server: Dict) -> tuple:
+        labels = (f'name="{_escape(server.get("name"))}",'
+                  f'location="{_escape(server.get("location"))}",'
+                  f'type="{_escape(server.get("type"))}"')
+        lines = []
+        for metric, field, _ in self.GAUGES:
+            value = _number(server.get(field))
+            lines.append(f'{self.PREFIX}{metric}{{{labels}}} {value}\n' if value is not None else '')
+        lines.append(''.join(
+            f'{self.PREFIX}status{{{labels},status="{status}"}} {1 if server.get("status") == status else 0}\n'
+            for status in self.STATUSES
+        ))
+        return tuple(lines)
+
+    def _families(self) -> List[tuple]:
+        families = [(metric, help_text) for metric, _, help_text in self.GAUGES]
+        families.append(('status', 'Current status; 1 for the state the host is in.'))
+        return families
+
+    def render(self) -> bytes:
+        with self._lock:
+            if self._body is not None:
+                return self._body
+            if not self._loaded:
+                dirty = None
+            else:
+                dirty, self._dirty = self._dirty, set()
+
+        if dirty is None:
+            hosts = {server['id']: self._render_host(server) for server in self.store.all()}
+            with self._lock:
+                self._hosts = hosts
+                self._loaded = True
+        else:
+            for server_id in dirty:
+                server = self.store.get_by_id(server_id)
+                rendered = self._render_host(server) if server is not None else None
+                with self._lock:
+                    if rendered is None:
+                        self._hosts.pop(server_id, None)
+                    else:
+                        self._hosts[server_id] = rendered
+
+        with self._lock:
+            hosts = list(self._hosts.values())
+        parts = []
+        for index, (metric, help_text) in enumerate(self._families()):
+            parts.append(f'# HELP {self.PREFIX}{metric} {help_text}\n# TYPE {self.PREFIX}{metric} gauge\n')
+            parts.extend(host[index] for host in hosts)
+        parts.append(f'# HELP {self.PREFIX}hosts Number of registered hosts.\n'
+                     f'# TYPE {self.PREFIX}hosts gauge\n{self.PREFIX}hosts {len(hosts)}\n')
+        body = ''.join(parts).encode('utf-8')
+        with self._lock:
+            # Unless something changed while rendering
+            if not self._dirty:
+                self._body = body
+        return body
+
+    def render_gzip(self) -> bytes:
+        """The exposition gzip-compressed, compressed once per change"""
+        gzipped = self._gzipped
+        body = self.render()
+        if gzipped is None or gzipped[0] is not body:
+            gzipped = (body, gzip.compress(body, compresslevel=6))
+            with self._lock:
+                if self._body is body:
+                    self._gzipped = gzipped
+        return gzipped[1]
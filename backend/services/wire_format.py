@@ -0,0 +1,38 @@
+from typing import Dict
+
+try:
+    import msgpack
+except ImportError:  # optional, agents fall back to JSON
+    msgpack = None
+
+# Version of the field-id schema below; announced to agents in the
+# 'capabilities' event and bumped whenever an id changes meaning.
+# client/monitor.py keeps its own copy of the table.
+SCHEMA_VERSION = 1
+
+# Field id -> report field. Ids are positions: append, never reorder.
+REPORT_FIELDS = (
+    'id', 'name', 'type', 'location', 'ip_address', 'uptime',
+    'network_in', 'network_out', 'cpu', 'memory', 'disk',
+    'os_type', 'cpu_info', 'total_memory', 'total_disk'
+)
+
+FIELD_IDS = {field: index for index, field in enumerate(REPORT_FIELDS)}
+
+
+def available() -> bool:
+    return msgpack is not None
+
+
+def encode_report(report: Dict) -> bytes:
+    """MessagePack map of field id -> native value; unknown fields are dropped"""
+    return msgpack.packb({FIELD_IDS[key]: value for key, value in report.items() if key in FIELD_IDS})
+
+
+def decode_report(payload: bytes) -> Dict:
+    """Inverse of encode_report(); ids from a newer schema are ignored"""
+    packed = msgpack.unpackb(payload, strict_map_key=False)
+    if not isinstance(packed, dict):
+        raise ValueError('Invalid packed report')
+    return {REPORT_FIELDS[key]: value for key, value in packed.items()
+            if isinstance(key, int) and 0 <= key < len(REPORT_FIELDS)}
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# The backend reads its configuration at import time
+os.environ.setdefault('SERVER_IP', '127.0.0.1')
+os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(prefix='monitor-tests-'), 'servers.db'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,27 @@
+import pytest
+from flask import Flask
+
+from routes import api as api_module
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(api_module.server_model, 'verify_token', lambda token: token == 'secret')
+    app = Flask(__name__)
+
+    @app.route('/check')
+    def check():
+        return {'stream': api_module.is_request_authenticated(allow_query_token=True),
+                'default': api_module.is_request_authenticated()}
+
+    return app
+
+
+def test_query_token_is_only_accepted_where_allowed(app):
+    response = app.test_client().get('/check?token=secret')
+    assert response.get_json() == {'stream': True, 'default': False}
+
+
+def test_header_token_is_accepted_everywhere(app):
+    response = app.test_client().get('/check', headers={'Authorization': 'Bearer secret'})
+    assert response.get_json() == {'stream': True, 'default': True}
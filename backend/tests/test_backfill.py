@@ -0,0 +1,76 @@
+import gzip
+import json
+import zlib
+
+import pytest
+
+from routes.api import PayloadTooLarge, decode_backfill, gunzip_limited
+
+
+def test_gunzip_limited_round_trip():
+    data = json.dumps({'name': 'a', 'samples': []}).encode()
+    assert gunzip_limited(gzip.compress(data), 1024) == data
+
+
+def test_gunzip_limited_rejects_bombs():
+    bomb = gzip.compress(b'\0' * (8 * 1024 * 1024))
+    assert len(bomb) < 16 * 1024
+    with pytest.raises(PayloadTooLarge):
+        gunzip_limited(bomb, 1024 * 1024)
+
+
+def test_gunzip_limited_rejects_truncated_and_invalid_data():
+    data = gzip.compress(b'x' * 1000)
+    with pytest.raises(ValueError):
+        gunzip_limited(data[:len(data) // 2], 1024 * 1024)
+    with pytest.raises(ValueError):
+        gunzip_limited(b'not gzip', 1024)
+    with pytest.raises(ValueError):
+        gunzip_limited(zlib.compress(b'x'), 1024)
+
+
+def test_decode_backfill_applies_the_configured_limit(monkeypatch):
+    from config import Config
+    monkeypatch.setattr(Config, 'BACKFILL_MAX_BYTES', 1024)
+    payload = gzip.compress(json.dumps({'name': 'a', 'samples': [{'ts': 1}] * 1000}).encode())
+    with pytest.raises(PayloadTooLarge):
+        decode_backfill(payload)
+
+
+@pytest.fixture
+def client():
+    from flask import Flask
+    from routes.api import api, server_model
+    server_model.init_db()
+    server_model.add_allowed_client('backfill-host')
+    app = Flask(__name__)
+    app.register_blueprint(api, url_prefix='/api')
+    return app.test_client()
+
+
+def test_backfill_route_checks_the_allow_list_before_the_body(client):
+    bomb = gzip.compress(b'\0' * (8 * 1024 * 1024))
+    response = client.post('/api/servers/backfill?name=unknown', data=bomb,
+                           headers={'Content-Encoding': 'gzip'})
+    assert response.status_code == 403
+    assert client.post('/api/servers/backfill', json={'name': 'x', 'samples': []}).status_code == 400
+
+
+def test_backfill_route_rejects_oversized_payloads(client, monkeypatch):
+    from config import Config
+    monkeypatch.setattr(Config, 'BACKFILL_MAX_BYTES', 64 * 1024)
+    bomb = gzip.compress(b'\0' * (8 * 1024 * 1024))
+    response = client.post('/api/servers/backfill?name=backfill-host', data=bomb,
+                           headers={'Content-Encoding': 'gzip'})
+    assert response.status_code == 413
+
+
+def test_backfill_route_stores_samples_for_the_named_client(client):
+    import time
+    payload = {'name': 'backfill-host', 'samples': [{'ts': time.time() - 60, 'cpu': 5}]}
+    response = client.post('/api/servers/backfill?name=backfill-host', json=payload)
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['stored'] == 1
+
+    payload['name'] = 'someone-else'
+    assert client.post('/api/servers/backfill?name=backfill-host', json=payload).status_code == 400
@@ -0,0 +1,43 @@
+import pytest
+from flask import Flask, request
+from flask_socketio import SocketIO
+
+from services.broadcast import BroadcastFanout
+
+
+def project(server, authenticated):
+    return dict(server, ip_address=server['ip_address'] if authenticated else '***')
+
+
+@pytest.fixture
+def fanout():
+    app = Flask(__name__)
+    socketio = SocketIO(app, async_mode='threading')
+    fanout = BroadcastFanout(socketio, project)
+
+    @socketio.on('connect')
+    def connect(auth=None):
+        auth = auth if isinstance(auth, dict) else {}
+        fanout.add_viewer(request.sid, False, batch=bool(auth.get('status_batch')))
+
+    return socketio, app, fanout
+
+
+def received(client):
+    return [(packet['name'], packet['args'][0]) for packet in client.get_received()]
+
+
+def test_viewers_without_the_capability_get_per_server_updates(fanout):
+    socketio, app, fanout = fanout
+    legacy = socketio.test_client(app)
+    batched = socketio.test_client(app, auth={'status_batch': True})
+    fanout.publish({'name': 'a', 'ip_address': '10.0.0.1', 'cpu': 1})
+    fanout.publish({'name': 'b', 'ip_address': '10.0.0.2', 'cpu': 2})
+    fanout.flush()
+
+    assert [(name, server['name']) for name, server in received(legacy)] == [
+        ('server_status_update', 'a'), ('server_status_update', 'b')]
+    [(name, batch)] = received(batched)
+    assert name == 'server_status_batch'
+    assert [server['name'] for server in batch] == ['a', 'b']
+    assert batch[0]['ip_address'] == '***'
@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def client():
+    from flask import Flask
+    from routes.api import api, server_model
+    server_model.init_db()
+    server_model.add_allowed_client('bulk-a')
+    server_model.add_allowed_client('bulk-b')
+    app = Flask(__name__)
+    app.register_blueprint(api, url_prefix='/api')
+    return app.test_client()
+
+
+REPORTS = [{'id': 'bulk-a', 'name': 'bulk-a', 'cpu': 1.0}, {'id': 'bulk-b', 'name': 'bulk-b', 'cpu': 2.0}]
+
+
+@pytest.mark.parametrize('body, content_type', [
+    (json.dumps(REPORTS), 'application/json'),
+    (json.dumps({'servers': REPORTS}), 'application/json'),
+    (json.dumps({'servers': REPORTS}, indent=2), 'application/json'),
+    ('\n'.join(json.dumps(report) for report in REPORTS), 'application/x-ndjson'),
+    ('\n'.join(json.dumps(report) for report in REPORTS), 'application/json'),
+])
+def test_bulk_update_payloads(client, body, content_type):
+    response = client.post('/api/servers/bulk-update', data=body, content_type=content_type)
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['accepted'] == 2
+
+
+def test_single_ndjson_report_is_still_accepted(client):
+    response = client.post('/api/servers/bulk-update', data=json.dumps(REPORTS[0]),
+                           content_type='application/x-ndjson')
+    assert response.get_json()['accepted'] == 1
+
+
+def test_servers_must_be_a_list(client):
+    response = client.post('/api/servers/bulk-update', json={'servers': {'name': 'bulk-a'}})
+    assert response.status_code == 400
@@ -0,0 +1,57 @@
+import json
+import threading
+
+import pytest
+
+redis = pytest.importorskip('redis')
+
+from services.cluster import RedisBus  # noqa: E402
+
+
+class FakePubSub:
+    def __init__(self, items):
+        self.items = items
+        self.closed = False
+
+    def subscribe(self, channel):
+        pass
+
+    def listen(self):
+        for item in self.items:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+        threading.Event().wait()  # stay subscribed
+
+    def close(self):
+        self.closed = True
+
+
+class FakeRedis:
+    def __init__(self, subscriptions):
+        self.subscriptions = subscriptions
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return self.subscriptions.pop(0)
+
+
+def test_subscription_survives_a_lost_connection(monkeypatch):
+    first = FakePubSub([{'data': json.dumps({'n': 1})}, redis.ConnectionError('gone')])
+    second = FakePubSub([{'data': json.dumps({'n': 2})}])
+    bus = RedisBus.__new__(RedisBus)
+    bus.redis, bus.channel = FakeRedis([first, second]), 'test'
+    monkeypatch.setattr(RedisBus, 'RECONNECT_DELAY', 0)
+
+    received, reconnected = [], threading.Event()
+    done = threading.Event()
+
+    def callback(message):
+        received.append(message['n'])
+        if message['n'] == 2:
+            done.set()
+
+    bus.subscribe(callback, on_reconnect=reconnected.set)
+    assert done.wait(5)
+    assert received == [1, 2]
+    assert reconnected.is_set()
+    assert first.closed
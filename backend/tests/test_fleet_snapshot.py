@@ -0,0 +1,55 @@
+import time
+
+from services.fleet_snapshot import FleetSnapshot
+
+
+class FakeStore:
+    def __init__(self, servers):
+        self.servers = servers
+        self.listeners = []
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def all(self):
+        return [dict(server) for server in self.servers]
+
+    def change(self, index, **fields):
+        self.servers[index].update(fields)
+        for callback in self.listeners:
+            callback(self.servers[index]['name'], self.servers[index]['id'])
+
+
+def project(server, authenticated):
+    return dict(server)
+
+
+def make_snapshot(max_age=60):
+    store = FakeStore([{'id': 'a', 'name': 'a', 'cpu': 1}, {'id': 'b', 'name': 'b', 'cpu': 2}])
+    return store, FleetSnapshot(store, project, max_age=max_age)
+
+
+def test_a_change_is_visible_on_the_next_request():
+    store, snapshot = make_snapshot()
+    first = snapshot.view(False)
+    store.change(0, cpu=50)
+    second = snapshot.view(False)
+    assert second.etag != first.etag
+    assert b'"cpu":50' in second.body()
+
+
+def test_unchanged_fleet_reuses_the_view():
+    store, snapshot = make_snapshot()
+    assert snapshot.view(False) is snapshot.view(False)
+
+
+def test_constant_churn_is_rate_limited():
+    store, snapshot = make_snapshot(max_age=60)
+    snapshot.view(False)
+    store.change(0, cpu=10)
+    built = snapshot.view(False)
+    store.change(1, cpu=20)  # right after the previous change
+    assert snapshot.view(False) is built
+
+    built.built_at = time.monotonic() - 61
+    assert b'"cpu":20' in snapshot.view(False).body()
@@ -0,0 +1,52 @@
+import pytest
+
+from models.server import Server
+
+
+def report(name, **fields):
+    return {'id': name, 'name': name, 'type': 'VPS', 'location': 'US', 'os_type': 'Debian', **fields}
+
+
+@pytest.fixture
+def server_model(tmp_path):
+    model = Server(str(tmp_path / 'servers.db'))
+    model.init_db()
+    for i in range(25):
+        name = f'host-{i:02d}'
+        model.add_allowed_client(name)
+        model.update_server(report(name, location='DE' if i % 2 else 'US'))
+    model.flush_live_state()
+    yield model
+    model.pool.close_all()
+
+
+def pages(server_model, filters, limit):
+    after, seen = None, []
+    while True:
+        servers, after = server_model.list_servers(filters, after, limit)
+        seen.extend(server['name'] for server in servers)
+        if after is None:
+            return seen
+
+
+def test_filtered_listing_sees_unflushed_changes_without_flushing(server_model):
+    server_model.update_server(report('host-00', location='FR'))
+    assert server_model.live_state.dirty_count()
+
+    servers, _ = server_model.list_servers({'location': ['FR']})
+    assert [server['name'] for server in servers] == ['host-00']
+    assert server_model.live_state.dirty_count()
+
+
+@pytest.mark.parametrize('filters, count', [
+    ({}, 25),
+    ({'location': ['DE']}, 12),
+    ({'location': ['DE', 'US']}, 25),
+])
+def test_pages_cover_every_server_once(server_model, filters, count):
+    # host-07 (DE) sorts first, the rest tie on order_index and go by id
+    server_model.update_server_order(server_model.live_state.get_id('host-07'), 5)
+    every = [server['name'] for server in server_model.list_servers(filters)[0]]
+    assert every[0] == 'host-07'
+    assert len(every) == len(set(every)) == count
+    assert pages(server_model, filters, 4) == every
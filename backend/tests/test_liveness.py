@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models.server import Server
+
+
+@pytest.fixture
+def server_model(tmp_path):
+    model = Server(str(tmp_path / 'servers.db'))
+    model.init_db()
+    for name in ('quiet', 'fresh'):
+        model.add_allowed_client(name)
+        model.update_server({'id': name, 'name': name})
+    yield model
+    model.pool.close_all()
+
+
+def age(server_model, name, seconds):
+    last_update = (datetime.now() - timedelta(seconds=seconds)).isoformat()
+    server_model.live_state.update(name, {'last_update': last_update})
+
+
+def test_mark_stopped_stops_servers_past_their_deadline(server_model):
+    age(server_model, 'quiet', 120)
+    [server] = server_model.mark_stopped(['quiet'])
+    assert server['status'] == Server.STATUS_STOPPED
+    assert server_model.live_state.get('quiet')['status'] == Server.STATUS_STOPPED
+
+
+def test_mark_stopped_keeps_a_server_that_reported_after_expiring(server_model):
+    # The deadline passed, then a report came in before mark_stopped ran
+    assert server_model.mark_stopped(['fresh']) == []
+    assert server_model.live_state.get('fresh')['status'] == Server.STATUS_RUNNING
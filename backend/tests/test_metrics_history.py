@@ -0,0 +1,110 @@
+import sqlite3
+
+import pytest
+
+from models.metrics_history import MetricsHistory
+
+RETENTION = {'raw': 3600, '1m': 7 * 24 * 3600, '1h': 365 * 24 * 3600}
+NOW = 1_700_000_000 // 3600 * 3600 + 1800  # half past an hour
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = MetricsHistory(str(tmp_path / 'history.db'), RETENTION)
+    conn = history.pool.connection()
+    try:
+        history.init_db(conn.cursor())
+        conn.commit()
+    finally:
+        conn.close()
+    yield history
+    history.pool.close_all()
+
+
+def test_default_range_uses_raw_samples(history):
+    # GET /servers/<id>/metrics without from/to: the last hour, ending now
+    end = NOW
+    start = end - 3600
+    assert history.choose_resolution(start, end, None, now=NOW)[0] == 'raw'
+
+    history.record('s1', {'cpu': 10}, ts=NOW - 30)
+    history.flush()
+    result = history.query('s1', start, end, now=NOW)
+    assert result['resolution'] == 'raw'
+    assert [point['cpu_avg'] for point in result['points']] == [10]
+
+
+def test_older_range_falls_back_to_minutes(history):
+    assert history.choose_resolution(NOW - 7200, NOW - 3600, None, now=NOW)[0] == '1m'
+
+
+def test_rollup_includes_samples_still_queued(history):
+    minute = NOW // 60 * 60 - 120
+    history.record('s1', {'cpu': 10}, ts=minute + 5)
+    history.flush()
+    history.record('s1', {'cpu': 30}, ts=minute + 50)  # not flushed yet
+
+    history.rollup(now=minute + 65)
+
+    conn = history.pool.connection()
+    try:
+        row = conn.execute('SELECT samples, cpu_avg FROM metrics_1m WHERE server_id = ? AND ts = ?',
+                           ('s1', minute)).fetchone()
+    finally:
+        conn.close()
+    assert tuple(row) == (2, 20)
+
+
+def test_rollup_lag_leaves_recent_minutes_for_later(history):
+    minute = NOW // 60 * 60 - 120
+    history.record('s1', {'cpu': 10}, ts=minute + 5)
+    history.rollup(now=minute + 65, lag=10)
+
+    # Written by another worker after the first rollup
+    history.record('s1', {'cpu': 30}, ts=minute + 58)
+    history.rollup(now=minute + 75, lag=10)
+
+    conn = history.pool.connection()
+    try:
+        row = conn.execute('SELECT samples FROM metrics_1m WHERE server_id = ? AND ts = ?',
+                           ('s1', minute)).fetchone()
+    finally:
+        conn.close()
+    assert row[0] == 2
+
+
+class LockedConnection:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def executemany(self, *args):
+        raise sqlite3.OperationalError('database is locked')
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+def test_failed_flush_keeps_the_samples(history, monkeypatch):
+    connection = history.pool.connection
+    history.record('s1', {'cpu': 10}, ts=NOW - 20)
+    monkeypatch.setattr(history.pool, 'connection', lambda: LockedConnection(connection()))
+    with pytest.raises(sqlite3.OperationalError):
+        history.flush()
+    history.record('s1', {'cpu': 20}, ts=NOW - 10)
+    assert history.pending_count() == 2
+
+    monkeypatch.setattr(history.pool, 'connection', connection)
+    assert history.flush() == 2
+    points = history.query('s1', NOW - 3600, NOW, now=NOW)['points']
+    assert [point['cpu_avg'] for point in points] == [10, 20]
+
+
+def test_failed_flushes_keep_at_most_max_pending_samples(history, monkeypatch):
+    connection = history.pool.connection
+    monkeypatch.setattr(history, 'MAX_PENDING', 3)
+    monkeypatch.setattr(history.pool, 'connection', lambda: LockedConnection(connection()))
+    for second in range(5):
+        history.record('s1', {'cpu': second}, ts=NOW - 60 + second)
+    with pytest.raises(sqlite3.OperationalError):
+        history.flush()
+    assert [row[2] for row in history._pending] == [2, 3, 4]
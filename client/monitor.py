@@ -1,22 +1,54 @@
-import psutil
-import requests
 import time
+STARTED = time.monotonic()  # for the time-to-first-report message
+
 import platform
 import os
 import socket
 import hashlib
 import subprocess
 import argparse
-from socketio import Client
+import json
+import threading
+import asyncio
+import gzip
+import logging
+from collections import deque
+from contextlib import contextmanager, redirect_stdout
+
+# Imported on first use: requests is only needed by the network probes,
+# socketio when connecting, psutil once sampling starts. Importing the
+# module (tests, --help, --benchmark with its stubs) loads none of them.
+requests = None
+psutil = None
+
+def http():
+    """The requests module, imported on first use"""
+    global requests
+    if requests is None:
+        import requests as module
+        requests = module
+    return requests
+
+def psutil_module():
+    """The psutil module, imported on first use"""
+    global psutil
+    if psutil is None:
+        import psutil as module
+        psutil = module
+    return psutil
 
-# Set UTF-8 encoding for Windows
+try:
+    import msgpack
+except ImportError:  # optional, reports are sent as JSON without it
+    msgpack = None
+
+# Set UTF-8 encoding for Windows; line buffered so service logs stay timely
 import sys
-import codecs
-sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer)
-sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer)
+for stream in (sys.stdout, sys.stderr):
+    if hasattr(stream, 'reconfigure'):
+        stream.reconfigure(encoding='utf-8', errors='replace', line_buffering=True)
 
 # Global variable definitions
-CACHED_LOCATION = None
 NODE_NAME = socket.gethostname()  # Default to hostname
 SERVER_ID = None  # Will be initialized after get_machine_id()
 
@@ -26,54 +58,319 @@ try:
 except ImportError:
     API_URL = os.getenv('API_URL', 'http://localhost:5000/api/servers/update')
 
+DEFAULT_PROBE_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.probe_cache.json')
+DEFAULT_SPOOL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.spool')
+DEFAULT_RELAY_SPOOL = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.relay_spool.ndjson')
+DEFAULT_IDENTITY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.machine_id')
+
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Server Monitor Client')
     parser.add_argument('--name', type=str, help='Custom node name', default=socket.gethostname())
+    parser.add_argument('--probe-cache', type=str, default=DEFAULT_PROBE_CACHE,
+                        help='File that keeps slow probe results across restarts (empty to disable)')
+    parser.add_argument('--identity-file', type=str, default=DEFAULT_IDENTITY_FILE,
+                        help='File that caches the machine ID (empty to disable)')
+    parser.add_argument('--spool-dir', type=str, default=DEFAULT_SPOOL_DIR,
+                        help='Directory that buffers samples while the backend is unreachable (empty to disable)')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Run sampling, probes and reporting as asyncio tasks (needs aiohttp)')
+    parser.add_argument('--relay', action='store_true',
+                        help='Accept reports from local agents and forward them upstream in batches')
+    parser.add_argument('--relay-host', type=str, default='0.0.0.0', help='Relay listen address')
+    parser.add_argument('--relay-port', type=int, default=5001, help='Relay listen port')
+    parser.add_argument('--relay-spool', type=str, default=DEFAULT_RELAY_SPOOL,
+                        help='File that buffers batches while the upstream is unreachable')
+    parser.add_argument('--self-telemetry', action='store_true',
+                        help="Also report the agent's own CPU, memory and timings to the backend")
+    parser.add_argument('--verbose', action='store_true',
+                        help='Log every report and the socket.io traffic')
+    parser.add_argument('--benchmark', type=int, metavar='ITERATIONS',
+                        help='Measure the collection loop against stubbed system calls and exit')
+    parser.add_argument('--benchmark-output', type=str, help='Also write the benchmark results as JSON')
     args = parser.parse_args()
-    return args.name.strip('"\'')  # Remove any quotes from the name
+    args.name = args.name.strip('"\'')  # Remove any quotes from the name
+    return args
 
 def get_location_from_ip():
-    global CACHED_LOCATION
-    if CACHED_LOCATION:
-        return CACHED_LOCATION
-        
     try:
         # Use more reliable ip-api.com service
-        response = requests.get('http://ip-api.com/json/', timeout=5)
+        response = http().get('http://ip-api.com/json/', timeout=5)
         data = response.json()
         
         if data.get('status') == 'success':
             # Get two-letter country code
-            country_code = data.get('countryCode', 'UN')
-            CACHED_LOCATION = country_code
-            return country_code
+            return data.get('countryCode', 'UN')
             
         # If the main API fails, try the backup API
-        ip = requests.get('https://api.ipify.org', timeout=5).text
-        response = requests.get(f'https://ipapi.co/{ip}/json/', timeout=5).json()
-        country_code = response.get('country_code', 'UN')
-        CACHED_LOCATION = country_code
-        return country_code
+        ip = http().get('https://api.ipify.org', timeout=5).text
+        response = http().get(f'https://ipapi.co/{ip}/json/', timeout=5).json()
+        return response.get('country_code', 'UN')
         
     except Exception as e:
         print(f"Error getting location: {e}")
-        CACHED_LOCATION = 'UN'  # UN as the default value, indicating unknown
-        return CACHED_LOCATION
+        return 'UN'  # UN as the default value, indicating unknown
+
+class AgentTelemetry:
+    """The agent's own footprint, reported with --self-telemetry.
+
+    Timings are rolling windows of the last WINDOW durations per name:
+    'loop' (one report iteration), 'lag' (how late an iteration started),
+    'send' (emitting a report), 'sample' and 'probe.<name>'. CPU time and
+    RSS come from the agent's own process when a snapshot is taken.
+    """
+
+    WINDOW = 100
+
+    def __init__(self):
+        self._timings = {}  # name -> (deque of seconds, total count)
+        self._lock = threading.Lock()
+        self._process = None  # psutil.Process of the agent, on the first snapshot
+        self._started = time.monotonic()
+        self._last_cpu = None  # (monotonic time, cpu seconds)
+
+    def observe(self, name, seconds):
+        with self._lock:
+            window, count = self._timings.get(name) or (deque(maxlen=self.WINDOW), 0)
+            window.append(seconds)
+            self._timings[name] = (window, count + 1)
+
+    @contextmanager
+    def timer(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def snapshot(self):
+        """The telemetry block: totals plus per-timing last/p50/max in milliseconds"""
+        now = time.monotonic()
+        if self._process is None:
+            self._process = psutil_module().Process()
+        cpu = self._process.cpu_times()
+        cpu_seconds = cpu.user + cpu.system
+        cpu_percent = None
+        if self._last_cpu is not None and now > self._last_cpu[0]:
+            cpu_percent = round((cpu_seconds - self._last_cpu[1]) / (now - self._last_cpu[0]) * 100, 2)
+        self._last_cpu = (now, cpu_seconds)
+        with self._lock:
+            timings = {name: (sorted(window), window[-1], count)
+                       for name, (window, count) in self._timings.items() if window}
+        return {
+            'uptime': int(now - self._started),
+            'cpu_seconds': round(cpu_seconds, 3),
+            'cpu_percent': cpu_percent,
+            'rss_mb': round(self._process.memory_info().rss / (1024 * 1024), 2),
+            'threads': threading.active_count(),
+            'timings_ms': {
+                name: {
+                    'last': round(last * 1000, 3),
+                    'p50': round(ordered[len(ordered) // 2] * 1000, 3),
+                    'max': round(ordered[-1] * 1000, 3),
+                    'count': count
+                }
+                for name, (ordered, last, count) in timings.items()
+            }
+        }
+
+TELEMETRY = AgentTelemetry()
+
+# Seconds between agent_telemetry events with --self-telemetry
+TELEMETRY_INTERVAL = 60
+
+class MetricSampler:
+    """Samples CPU, memory, network and disk I/O counters on a background thread.
+
+    Rates are computed over the real elapsed time between two samples
+    (monotonic clock), so readers never block and never depend on when
+    they happened to be called.
+    """
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last = None  # (timestamp, net counters, disk counters)
+        self._snapshot = {
+            'cpu': 0.0,
+            'memory': 0.0,
+            'network_in': 0.0,
+            'network_out': 0.0,
+            'disk_read': 0.0,
+            'disk_write': 0.0
+        }
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            # Prime cpu_percent so the first interval has a baseline, and
+            # take a first sample for the first report
+            psutil_module().cpu_percent(interval=None)
+            self.sample()
+            self._thread = threading.Thread(target=self._run, name='metric-sampler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        next_sample = time.monotonic()
+        while True:
+            try:
+                with TELEMETRY.timer('sample'):
+                    self.sample()
+            except Exception as e:
+                print(f"Error sampling metrics: {e}")
+            next_sample += self.interval
+            time.sleep(max(0, next_sample - time.monotonic()))
+
+    @staticmethod
+    def _rate(new, old, elapsed):
+        # Counters can wrap or reset (e.g. interface restart)
+        return max(0, new - old) / elapsed if elapsed > 0 else 0.0
+
+    def sample(self):
+        now = time.monotonic()
+        net = psutil_module().net_io_counters()
+        try:
+            disk = psutil_module().disk_io_counters()
+        except Exception:
+            disk = None
+        values = {
+            'cpu': psutil_module().cpu_percent(interval=None),
+            'memory': psutil_module().virtual_memory().percent
+        }
+        if self._last is not None:
+            last_time, last_net, last_disk = self._last
+            elapsed = now - last_time
+            values['network_in'] = self._rate(net.bytes_recv, last_net.bytes_recv, elapsed)
+            values['network_out'] = self._rate(net.bytes_sent, last_net.bytes_sent, elapsed)
+            if disk is not None and last_disk is not None:
+                values['disk_read'] = self._rate(disk.read_bytes, last_disk.read_bytes, elapsed)
+                values['disk_write'] = self._rate(disk.write_bytes, last_disk.write_bytes, elapsed)
+        self._last = (now, net, disk)
+        with self._lock:
+            self._snapshot.update(values)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._snapshot)
+
+SAMPLER = MetricSampler()
+
+class ProbeCache:
+    """Cached results of slow probes (public IP, virtualization, CPU model...).
+
+    Each probe has its own TTL. A cached value is always returned right
+    away; once it expires, the probe is re-run on a background thread and
+    the old value is served until the new one is ready. Results can be
+    persisted to a JSON file so a restarted agent starts with them.
+    """
+
+    def __init__(self):
+        self._probes = {}  # name -> (function, ttl in seconds)
+        self._values = {}  # name -> (value, wall-clock time of the probe)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.path = None
+
+    def register(self, name, func, ttl):
+        self._probes[name] = (func, ttl)
+
+    def load(self, path):
+        """Use path for persistence and read whatever it already holds"""
+        self.path = path or None
+        if not self.path:
+            return
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+            with self._lock:
+                for name, entry in stored.items():
+                    if name in self._probes:
+                        self._values[name] = (entry['value'], entry['updated'])
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error loading probe cache: {e}")
+
+    def _save(self):
+        if not self.path:
+            return
+        with self._lock:
+            stored = {name: {'value': value, 'updated': updated}
+                      for name, (value, updated) in self._values.items()}
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(stored, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Error saving probe cache: {e}")
+
+    def store(self, name, value):
+        with self._lock:
+            self._values[name] = (value, time.time())
+        self._save()
+
+    def cached(self, name):
+        """The last result of a probe, or None; never runs the probe"""
+        with self._lock:
+            entry = self._values.get(name)
+        return entry[0] if entry is not None else None
+
+    def stale(self):
+        """Names of probes that never ran or whose result has expired"""
+        now = time.time()
+        with self._lock:
+            return [name for name, (_, ttl) in self._probes.items()
+                    if name not in self._values or now - self._values[name][1] >= ttl]
+
+    def function(self, name):
+        return self._probes[name][0]
+
+    def refresh(self, name):
+        """Run a probe now and store its result"""
+        func, _ = self._probes[name]
+        try:
+            with TELEMETRY.timer(f'probe.{name}'):
+                value = func()
+            self.store(name, value)
+            return value
+        finally:
+            with self._lock:
+                self._refreshing.discard(name)
+
+    def _refresh_async(self, name):
+        with self._lock:
+            if name in self._refreshing:
+                return
+            self._refreshing.add(name)
+        threading.Thread(target=self.refresh, args=(name,), name=f'probe-{name}', daemon=True).start()
+
+    def refresh_stale(self):
+        """Start background runs of every probe that never ran or expired"""
+        for name in self.stale():
+            self._refresh_async(name)
+
+    def get(self, name, wait=True):
+        """Cached value of a probe; without a cached value, wait for the probe
+        or (wait=False) return None and run it in the background"""
+        with self._lock:
+            entry = self._values.get(name)
+        if entry is None:
+            if not wait:
+                self._refresh_async(name)
+                return None
+            # Nothing cached yet, this first run has to wait for the probe
+            with self._lock:
+                self._refreshing.add(name)
+            return self.refresh(name)
+        value, updated = entry
+        if time.time() - updated >= self._probes[name][1]:
+            self._refresh_async(name)
+        return value
 
 def get_network_speed():
-    try:
-        # Get initial value
-        net1 = psutil.net_io_counters()
-        time.sleep(1)  # Wait for 1 second
-        # Get final value
-        net2 = psutil.net_io_counters()
-        # Calculate the rate per second
-        bytes_sent = net2.bytes_sent - net1.bytes_sent
-        bytes_recv = net2.bytes_recv - net1.bytes_recv
-        return bytes_recv, bytes_sent
-    except Exception as e:
-        print(f"Error getting network speed: {e}")
-        return 0, 0
+    """Current receive and send rates in bytes per second"""
+    snapshot = SAMPLER.snapshot()
+    return snapshot['network_in'], snapshot['network_out']
 
 def get_detailed_os_info():
     if platform.system() == 'Windows':
@@ -122,29 +419,29 @@ def get_cpu_info():
             import wmi
             w = wmi.WMI()
             cpu = w.Win32_Processor()[0]
-            return f"{cpu.Name} ({psutil.cpu_count()} threads)"
+            return f"{cpu.Name} ({psutil_module().cpu_count()} threads)"
         else:
             with open('/proc/cpuinfo') as f:
                 for line in f:
                     if line.startswith('model name'):
                         model = line.split(':')[1].strip()
-                        return f"{model} ({psutil.cpu_count()} threads)"
+                        return f"{model} ({psutil_module().cpu_count()} threads)"
             # If the model name cannot be read, return basic information
-            return f"CPU ({psutil.cpu_count()} threads)"
+            return f"CPU ({psutil_module().cpu_count()} threads)"
     except Exception as e:
         print(f"Error getting CPU info: {e}")
-        return f"CPU ({psutil.cpu_count()} threads)"
+        return f"CPU ({psutil_module().cpu_count()} threads)"
 
 def get_all_disks_usage():
     try:
         total_size = 0
         total_used = 0
         # Get all disk partitions
-        partitions = psutil.disk_partitions()
+        partitions = psutil_module().disk_partitions()
         for partition in partitions:
             try:
                 # Track all accessible partitions
-                usage = psutil.disk_usage(partition.mountpoint)
+                usage = psutil_module().disk_usage(partition.mountpoint)
                 total_size += usage.total
                 total_used += usage.used
             except (PermissionError, OSError):
@@ -170,19 +467,21 @@ def get_ip_address():
     
     try:
         # Try to get public IPv4
-        response = requests.get('https://api.ipify.org', timeout=5)
+        response = http().get('https://api.ipify.org', timeout=5)
         if response.ok:
             ipv4 = response.text.strip()
-            print(f"Got public IPv4: {ipv4}")
+            if VERBOSE:
+                print(f"Got public IPv4: {ipv4}")
     except Exception as e:
         print(f"Failed to get public IPv4: {e}")
     
     try:
         # Try to get public IPv6
-        response = requests.get('https://api6.ipify.org', timeout=5)
+        response = http().get('https://api6.ipify.org', timeout=5)
         if response.ok:
             ipv6 = response.text.strip()
-            print(f"Got public IPv6: {ipv6}")
+            if VERBOSE:
+                print(f"Got public IPv6: {ipv6}")
     except Exception as e:
         print(f"Failed to get public IPv6: {e}")
     
@@ -193,7 +492,8 @@ def get_ip_address():
             s.connect(('8.8.8.8', 80))
             ipv4 = s.getsockname()[0]
             s.close()
-            print(f"Got local IPv4: {ipv4}")
+            if VERBOSE:
+                print(f"Got local IPv4: {ipv4}")
         except Exception as e:
             print(f"Failed to get local IPv4: {e}")
             ipv4 = '127.0.0.1'
@@ -209,28 +509,66 @@ def get_ip_address():
     return '127.0.0.1'
 
 def get_server_info():
-    network_in, network_out = get_network_speed()
-    memory = psutil.virtual_memory()
-    disk_percent, total_disk = get_all_disks_usage()
+    """Full report. Probes that never ran are started in the background and
+    left out (None) instead of holding up the report on network lookups
+    and subprocesses; they are filled in by a later report."""
+    metrics = SAMPLER.snapshot()
+    with TELEMETRY.timer('probe.disks'):
+        disk_percent, total_disk = get_all_disks_usage()
     
     return {
         'id': SERVER_ID,
         'name': NODE_NAME,
-        'type': get_server_type(),
-        'location': get_location_from_ip(),
-        'ip_address': get_ip_address(),
-        'uptime': int(time.time() - psutil.boot_time()),
-        'network_in': network_in,
-        'network_out': network_out,
-        'cpu': psutil.cpu_percent(),
-        'memory': psutil.virtual_memory().percent,
+        'type': PROBES.get('server_type', wait=False),
+        'location': PROBES.get('location', wait=False),
+        'ip_address': PROBES.get('ip_address', wait=False),
+        'uptime': int(time.time() - psutil_module().boot_time()),
+        'network_in': metrics['network_in'],
+        'network_out': metrics['network_out'],
+        'cpu': metrics['cpu'],
+        'memory': metrics['memory'],
         'disk': disk_percent,
-        'os_type': get_detailed_os_info(),
-        'cpu_info': get_cpu_info(),
-        'total_memory': psutil.virtual_memory().total / (1024 * 1024 * 1024),
+        'os_type': PROBES.get('os_type', wait=False),
+        'cpu_info': PROBES.get('cpu_info', wait=False),
+        'total_memory': psutil_module().virtual_memory().total / (1024 * 1024 * 1024),
         'total_disk': total_disk
     }
 
+# DMI product names of virtual machines and cloud instances
+VIRT_PRODUCTS = [
+    'kvm', 'vmware', 'virtualbox', 'xen', 'openstack', 'qemu',
+    'amazon ec2', 'google compute engine', 
+    'microsoft corporation virtual machine', 'alibaba cloud ecs',
+    'virtual machine', 'bochs', 'standard pc', 
+    'standard personal computer', 'pc-q35', 'q35', 'pc-i440fx',
+    'hetzner vserver', 'vultr', 'linode', 'droplet', 'scaleway',
+    'ovhcloud', 'proxmox', 'parallels', 'hyper-v', 'oracle vm',
+    'innotek', 'cloud server', 'virtual server', 'vps',
+    'vc2', 'vc2-high-cpu', 'vc2-high-memory',
+    'digitalocean', 'do-regular', 'do-premium',
+    'azure virtual machine', 'azure vm',
+    'aws ec2', 't2.micro', 't3.micro',
+    'gcp instance', 'gce instance',
+    'lightsail', 'elastic compute service',
+    'tencent cloud cvm', 'huawei cloud ecs',
+    'ucloud uhost', 'kingsoft cloud kec',
+    'vagrant', 'docker', 'lxc', 'openvz',
+    'esxi', 'citrix xenserver', 'nutanix ahv',
+    'cloudstack', 'openshift', 'kubernetes',
+    'rackspace cloud', 'ibm cloud virtual server',
+    'upcloud', 'kamatera', 'hostwinds',
+    'time4vps', 'hetzner cloud', 'contabo vps'
+]
+
+# Hypervisors named in the kernel log of a guest
+VIRT_HINTS = ['kvm', 'vmware', 'xen', 'hyperv']
+
+def is_virtual_product():
+    """Check the DMI product name against known virtual platforms"""
+    with open('/sys/class/dmi/id/product_name') as f:
+        product_name = f.read().strip().lower()
+    return any(virt in product_name for virt in VIRT_PRODUCTS)
+
 def get_server_type():
     """Determine if server is VPS or Dedicated through multiple checks"""
     if platform.system() == "Windows":
@@ -265,34 +603,8 @@ def get_server_type():
                 pass
                 
             # Method 2: Check product name
-            with open('/sys/class/dmi/id/product_name') as f:
-                product_name = f.read().strip().lower()
-                virt_products = [
-                    'kvm', 'vmware', 'virtualbox', 'xen', 'openstack', 'qemu',
-                    'amazon ec2', 'google compute engine', 
-                    'microsoft corporation virtual machine', 'alibaba cloud ecs',
-                    'virtual machine', 'bochs', 'standard pc', 
-                    'standard personal computer', 'pc-q35', 'q35', 'pc-i440fx',
-                    'hetzner vserver', 'vultr', 'linode', 'droplet', 'scaleway',
-                    'ovhcloud', 'proxmox', 'parallels', 'hyper-v', 'oracle vm',
-                    'innotek', 'cloud server', 'virtual server', 'vps',
-                    'vc2', 'vc2-high-cpu', 'vc2-high-memory',
-                    'digitalocean', 'do-regular', 'do-premium',
-                    'azure virtual machine', 'azure vm',
-                    'aws ec2', 't2.micro', 't3.micro',
-                    'gcp instance', 'gce instance',
-                    'lightsail', 'elastic compute service',
-                    'tencent cloud cvm', 'huawei cloud ecs',
-                    'ucloud uhost', 'kingsoft cloud kec',
-                    'vagrant', 'docker', 'lxc', 'openvz',
-                    'esxi', 'citrix xenserver', 'nutanix ahv',
-                    'cloudstack', 'openshift', 'kubernetes',
-                    'rackspace cloud', 'ibm cloud virtual server',
-                    'upcloud', 'kamatera', 'hostwinds',
-                    'time4vps', 'hetzner cloud', 'contabo vps'
-                ]
-                if any(virt in product_name for virt in virt_products):
-                    return "VPS"
+            if is_virtual_product():
+                return "VPS"
                     
             # Method 3: Check CPU info for virtualization flags
             # with open('/proc/cpuinfo') as f:
@@ -303,7 +615,7 @@ def get_server_type():
             # Method 4: Check dmesg for virtualization hints
             try:
                 dmesg = subprocess.run(['dmesg'], capture_output=True, text=True).stdout.lower()
-                if any(hint in dmesg for hint in ['kvm', 'vmware', 'xen', 'hyperv']):
+                if any(hint in dmesg for hint in VIRT_HINTS):
                     return "VPS"
             except:
                 pass
@@ -314,8 +626,35 @@ def get_server_type():
     # If all checks fail to detect virtualization features, then it is a physical server
     return "Dedicated Server"
 
-def get_machine_id():
-    """Get the unique identifier of the machine"""
+async def run_command(*command):
+    """Run a command without blocking the event loop; (returncode, lowercased stdout)"""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+        stdout, _ = await process.communicate()
+        return process.returncode, stdout.decode(errors='replace').lower()
+    except (OSError, ValueError):
+        return None, ''
+
+async def get_server_type_async():
+    """get_server_type() with the Linux command checks run concurrently"""
+    if platform.system() == "Windows":
+        return await asyncio.to_thread(get_server_type)
+    (virt_code, virt), (_, dmesg) = await asyncio.gather(
+        run_command('systemd-detect-virt'), run_command('dmesg'))
+    if virt_code == 0 and virt.strip() != 'none':
+        return "VPS"
+    try:
+        if is_virtual_product():
+            return "VPS"
+    except OSError:
+        pass
+    if any(hint in dmesg for hint in VIRT_HINTS):
+        return "VPS"
+    return "Dedicated Server"
+
+def compute_machine_id(hostname):
+    """Derive the unique identifier of the machine"""
     try:
         if platform.system() == "Windows":
             # Windows uses WMI to get the system UUID
@@ -324,28 +663,67 @@ def get_machine_id():
             system_info = w.Win32_ComputerSystemProduct()[0]
             return hashlib.md5(system_info.UUID.encode()).hexdigest()
         else:
-            # Linux system maintains the original logic
-            hostname = socket.gethostname()
-            mac = subprocess.check_output("cat /sys/class/net/$(ls /sys/class/net | head -n 1)/address", 
-                                       shell=True).decode().strip()
+            # Hostname and the MAC of the first interface (the one `ls /sys/class/net` lists first)
+            interface = sorted(os.listdir('/sys/class/net'))[0]
+            with open(f'/sys/class/net/{interface}/address') as f:
+                mac = f.read().strip()
             machine_id = f"{hostname}-{mac}"
             return hashlib.md5(machine_id.encode()).hexdigest()
     except Exception as e:
         print(f"Error getting machine ID: {e}")
         # Use the hostname as a fallback
-        return hashlib.md5(socket.gethostname().encode()).hexdigest()
+        return hashlib.md5(hostname.encode()).hexdigest()
+
+def get_machine_id(cache_path=DEFAULT_IDENTITY_FILE):
+    """Get the unique identifier of the machine, cached in cache_path.
+
+    The cache is keyed by hostname, which is part of the identifier, so a
+    renamed host gets a fresh one; starts after the first (and Windows
+    hosts, where loading WMI takes seconds) only read the file.
+    """
+    hostname = socket.gethostname()
+    if cache_path:
+        try:
+            with open(cache_path) as f:
+                cached = json.load(f)
+            if cached.get('hostname') == hostname and cached.get('id'):
+                return cached['id']
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error reading machine ID cache: {e}")
+    
+    machine_id = compute_machine_id(hostname)
+    if cache_path:
+        try:
+            tmp_path = f"{cache_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'hostname': hostname, 'id': machine_id}, f)
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            print(f"Error saving machine ID cache: {e}")
+    return machine_id
+
+# Slow probes and how long (seconds) their results stay fresh
+PROBES = ProbeCache()
+PROBES.register('ip_address', get_ip_address, 60 * 60)
+PROBES.register('location', get_location_from_ip, 24 * 60 * 60)
+PROBES.register('server_type', get_server_type, 24 * 60 * 60)
+PROBES.register('cpu_info', get_cpu_info, 24 * 60 * 60)
+PROBES.register('os_type', get_detailed_os_info, 24 * 60 * 60)
 
 def update_server_with_retry(server_info, max_retries=3, retry_delay=1):
     """Send update with retry mechanism"""
     for attempt in range(max_retries):
         try:
-            response = requests.post(API_URL, json=server_info, timeout=5)
+            response = http().post(API_URL, json=server_info, timeout=5)
             if response.status_code == 200:
-                print(f"Data uploaded successfully")
+                if VERBOSE:
+                    print(f"Data uploaded successfully")
                 return True
             else:
                 print(f"Update failed (attempt {attempt + 1}/{max_retries}): {response.status_code}")
-        except requests.exceptions.RequestException as e:
+        except http().exceptions.RequestException as e:
             print(f"Connection error (attempt {attempt + 1}/{max_retries}): {e}")
         
         if attempt < max_retries - 1:
@@ -353,38 +731,77 @@ def update_server_with_retry(server_info, max_retries=3, retry_delay=1):
     
     return False
 
-sio = Client(
-    reconnection=True,
-    reconnection_attempts=0,  # 无限重试
-    reconnection_delay=1,
-    reconnection_delay_max=10,
-    randomization_factor=0.5,
-    logger=True,  # 启用日志以便调试
-    engineio_logger=True
-)
+# socketio.Client of the sync and relay modes, see create_client()
+sio = None
+
+# --verbose: log every report and the socket.io traffic
+VERBOSE = False
+
+def enable_verbose_logging():
+    global VERBOSE
+    VERBOSE = True
+    for name in ('socketio.client', 'engineio.client'):
+        logging.getLogger(name).setLevel(logging.INFO)
 
 # 添加新的��接状态跟踪
 CONNECTING = False
 RETRY_INTERVAL = 5
+REPORT_INTERVAL = 3
 MAX_CONSECUTIVE_ERRORS = 3
 error_count = 0
 
-@sio.event
+# Delta protocol: the last report sent on this connection (None means send
+# a full report next) and the features the backend announced
+LAST_REPORT = None
+SERVER_CAPABILITIES = {}
+
 def connect():
-    global CONNECTING, error_count
+    global CONNECTING, error_count, LAST_REPORT
     print('Connected to server')
     CONNECTING = False
     error_count = 0
+    LAST_REPORT = None
+
+def on_capabilities(data):
+    global SERVER_CAPABILITIES
+    SERVER_CAPABILITIES = data or {}
+
+def on_resync():
+    """The backend lost track of this connection, send a full report next"""
+    global LAST_REPORT
+    LAST_REPORT = None
 
-@sio.event
 def connect_error(error):
     print(f"Connection error: {error}")
 
-@sio.event
 def disconnect():
-    global CONNECTING
+    global CONNECTING, SERVER_CAPABILITIES
     print('Disconnected from server')
     CONNECTING = False
+    # Cleared here, not on connect: servers may announce them before the
+    # connect handler runs
+    SERVER_CAPABILITIES = {}
+
+def create_client():
+    """Import socketio and set up the client; done in main(), not at import time"""
+    global sio
+    from socketio import Client
+    sio = Client(
+        reconnection=True,
+        reconnection_attempts=0,  # 无限重试
+        reconnection_delay=1,
+        reconnection_delay_max=10,
+        randomization_factor=0.5,
+        # Per-packet logging only with --verbose, see enable_verbose_logging()
+        logger=False,
+        engineio_logger=False
+    )
+    sio.on('connect', connect)
+    sio.on('capabilities', on_capabilities)
+    sio.on('resync', on_resync)
+    sio.on('connect_error', connect_error)
+    sio.on('disconnect', disconnect)
+    return sio
 
 def get_system_info_buffer():
     """Buffer system information to reduce I/O operations"""
@@ -392,28 +809,203 @@ def get_system_info_buffer():
     if not hasattr(get_system_info_buffer, '_last_full_update'):
         get_system_info_buffer._last_full_update = 0
         get_system_info_buffer._cached_info = None
+        get_system_info_buffer._complete = False
     
-    # Perform a full update every 10 seconds
-    if current_time - get_system_info_buffer._last_full_update >= 10:
+    # Perform a full update every 10 seconds, and on every report until
+    # the background probes have filled in all fields
+    if (current_time - get_system_info_buffer._last_full_update >= 10
+            or not get_system_info_buffer._complete):
         system_info = get_server_info()
-        # Round all float values to 2 decimal places
-        for key, value in system_info.items():
-            if isinstance(value, float):
-                system_info[key] = round(value, 2)
+        get_system_info_buffer._complete = None not in system_info.values()
+        # Round all float values to 2 decimal places; pending probes are
+        # left to the backend defaults
+        system_info = {key: round(value, 2) if isinstance(value, float) else value
+                       for key, value in system_info.items() if value is not None}
         
         get_system_info_buffer._cached_info = system_info
         get_system_info_buffer._last_full_update = current_time
         return get_system_info_buffer._cached_info
     
-    # Only update frequently changing metrics
+    # Only update frequently changing metrics, read from the sampler snapshot
+    metrics = SAMPLER.snapshot()
     cached_info = get_system_info_buffer._cached_info.copy()
     cached_info.update({
-        'cpu': round(psutil.cpu_percent(), 2),
-        'memory': round(psutil.virtual_memory().percent, 2),
-        'uptime': int(time.time() - psutil.boot_time())
+        'cpu': round(metrics['cpu'], 2),
+        'memory': round(metrics['memory'], 2),
+        'network_in': round(metrics['network_in'], 2),
+        'network_out': round(metrics['network_out'], 2),
+        'uptime': int(time.time() - psutil_module().boot_time())
     })
     return cached_info
 
+# MessagePack field-id schema, same table as backend/services/wire_format.py.
+# Ids are positions: append, never reorder, and bump the version on change.
+WIRE_SCHEMA_VERSION = 1
+WIRE_FIELDS = (
+    'id', 'name', 'type', 'location', 'ip_address', 'uptime',
+    'network_in', 'network_out', 'cpu', 'memory', 'disk',
+    'os_type', 'cpu_info', 'total_memory', 'total_disk'
+)
+WIRE_FIELD_IDS = {field: index for index, field in enumerate(WIRE_FIELDS)}
+
+def pack_report(report):
+    """Compact binary report: MessagePack map of field id -> native value"""
+    return msgpack.packb({WIRE_FIELD_IDS[key]: value for key, value in report.items() if key in WIRE_FIELD_IDS})
+
+def report_message(last_report, system_info, capabilities):
+    """(event, data) for a report: the full inventory once per connection, then only changed fields"""
+    if last_report is None or not capabilities.get('delta'):
+        event, data = 'server_update', system_info
+    else:
+        # An empty delta still tells the backend the server is alive
+        event, data = 'server_delta', {key: value for key, value in system_info.items()
+                                       if last_report.get(key) != value}
+    # Binary encoding when both sides support the same schema, JSON otherwise
+    if msgpack is not None and capabilities.get('msgpack') == WIRE_SCHEMA_VERSION:
+        return f'{event}_packed', pack_report(data)
+    return event, data
+
+def send_report(system_info):
+    global LAST_REPORT
+    event, data = report_message(LAST_REPORT, system_info, SERVER_CAPABILITIES)
+    with TELEMETRY.timer('send'):
+        sio.emit(event, data)
+    if VERBOSE:
+        print(f"Sent {event}")
+    LAST_REPORT = system_info
+
+class SampleSpool:
+    """Bounded on-disk buffer of samples taken while the backend is unreachable.
+
+    Samples are appended as JSON lines to segment files of at most
+    SEGMENT_SAMPLES lines; beyond MAX_SEGMENTS the oldest segment is
+    deleted, so the spool works as a ring buffer (about three days at the
+    default report interval). After reconnecting, replay() sends the
+    segments as gzip-compressed 'server_backfill' batches with their
+    original timestamps and deletes them once the backend acknowledges;
+    the threaded agent runs it through start_replay() so reporting goes on.
+    The threaded agent also records through start_recording(), on its own
+    thread, so samples keep the report interval while connect attempts
+    block or back off.
+    """
+
+    SEGMENT_SAMPLES = 1200
+    MAX_SEGMENTS = 72
+    # Segments per backfill message, keeps messages well under the
+    # backend's Socket.IO payload limit
+    SEGMENTS_PER_BATCH = 10
+    FIELDS = ('cpu', 'memory', 'disk', 'network_in', 'network_out')
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.current = None
+        self.current_count = 0
+        self.replaying = False
+        self._recorder = None
+
+    def segments(self):
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        return sorted(os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                      if name.startswith('segment-') and name.endswith('.ndjson'))
+
+    def append(self, system_info):
+        if not self.directory:
+            return
+        sample = {'ts': round(time.time(), 3)}
+        sample.update({field: system_info.get(field) for field in self.FIELDS})
+        try:
+            if self.current is None or self.current_count >= self.SEGMENT_SAMPLES:
+                os.makedirs(self.directory, exist_ok=True)
+                self.current = os.path.join(self.directory, f'segment-{time.time_ns():020d}.ndjson')
+                self.current_count = 0
+                for old in self.segments()[:-self.MAX_SEGMENTS]:
+                    os.remove(old)
+            with open(self.current, 'a') as f:
+                f.write(json.dumps(sample) + '\n')
+            self.current_count += 1
+        except OSError as e:
+            print(f"Spool write error: {e}")
+
+    def batches(self, name):
+        """Yield (segment paths, sample count, gzip payload) for each backfill message"""
+        segments = self.segments()
+        # New samples after reconnecting start a new segment
+        self.current = None
+        for start in range(0, len(segments), self.SEGMENTS_PER_BATCH):
+            batch = segments[start:start + self.SEGMENTS_PER_BATCH]
+            samples = []
+            for path in batch:
+                with open(path) as f:
+                    for line in f:
+                        try:
+                            samples.append(json.loads(line))
+                        except ValueError:
+                            pass  # torn write from a crash
+            payload = gzip.compress(json.dumps({'name': name, 'samples': samples}).encode('utf-8'))
+            yield batch, len(samples), payload
+
+    def acknowledge(self, batch, count, ack):
+        """Handle the backend's answer to a batch; False if it must be kept for later"""
+        if isinstance(ack, dict) and ack.get('retry'):
+            return False
+        if not isinstance(ack, dict) or 'error' in ack:
+            print(f"Backfill rejected, discarding {count} samples: {ack}")
+        else:
+            print(f"Backfilled {ack.get('stored', 0)} of {count} samples")
+        for path in batch:
+            os.remove(path)
+        return True
+
+    def replay(self, name):
+        """Backfill spooled samples; returns False if they must be kept for later"""
+        for batch, count, payload in self.batches(name):
+            try:
+                ack = sio.call('server_backfill', payload, timeout=30)
+            except Exception as e:
+                print(f"Backfill failed, keeping spool: {e}")
+                return False
+            if not self.acknowledge(batch, count, ack):
+                return False
+        return True
+
+    def start_replay(self, name):
+        """replay() on a background thread, so live reports keep their cadence"""
+        if self.replaying:
+            return
+        self.replaying = True
+        threading.Thread(target=self._replay_thread, args=(name,), name='spool-replay', daemon=True).start()
+
+    def _replay_thread(self, name):
+        try:
+            self.replay(name)
+        except Exception as e:
+            # e.g. a segment rotated away while it was being read
+            print(f"Backfill error, keeping spool: {e}")
+        finally:
+            self.replaying = False
+
+    def start_recording(self, offline, interval):
+        """Append a sample every interval seconds while offline() is true"""
+        if self._recorder is None:
+            self._recorder = threading.Thread(target=self._record_thread, args=(offline, interval),
+                                              name='spool-recorder', daemon=True)
+            self._recorder.start()
+
+    def _record_thread(self, offline, interval):
+        next_sample = time.monotonic() + interval
+        while True:
+            time.sleep(max(0, next_sample - time.monotonic()))
+            next_sample = max(next_sample + interval, time.monotonic())
+            if not offline():
+                continue
+            # Rates from the sampler; disk from the last report that was built
+            sample = dict(getattr(get_system_info_buffer, '_cached_info', None) or {})
+            sample.update((key, round(value, 2)) for key, value in SAMPLER.snapshot().items())
+            self.append(sample)
+
+SPOOL = SampleSpool(None)
+
 def connect_with_retry():
     global CONNECTING
     try:
@@ -430,31 +1022,610 @@ def connect_with_retry():
         CONNECTING = False
         time.sleep(RETRY_INTERVAL)
 
+class Relay:
+    """Local aggregation point for the agents of one site (--relay).
+
+    Agents point API_URL at the relay and speak the same Socket.IO
+    protocol as with the backend (full reports, deltas, resync). Reports
+    are merged per host and forwarded every REPORT_INTERVAL as one
+    'server_bulk_update' batch over this process's single upstream
+    connection, so the backend sees one socket per site. Batches that
+    cannot be delivered are appended to a spool file. Once the upstream is
+    back they are not resent as live reports, which would mark every host
+    running as of the replay: their samples are backfilled into each
+    host's history with their original timestamps, a few hosts per tick.
+    """
+
+    # Hosts per upstream event
+    MAX_BATCH = 1000
+    # Spooled batches older than this (seconds) are dropped on replay
+    SPOOL_MAX_AGE = 60 * 60
+    # Hosts backfilled from the spool per tick, so live forwarding keeps its pace
+    REPLAY_HOSTS_PER_TICK = 50
+    # Stop spooling when the file reaches this size (bytes)
+    SPOOL_MAX_BYTES = 50 * 1024 * 1024
+
+    def __init__(self, spool_path):
+        self.spool_path = spool_path
+        self.sessions = {}  # sid -> last full report merged with its deltas
+        self.pending = {}   # host name -> latest report since the last batch
+        self.lock = threading.Lock()
+        self.forwarded = 0
+
+    def serve(self, host, port):
+        """Accept agent connections on a background thread"""
+        try:
+            import socketio
+            from werkzeug.serving import run_simple
+        except ImportError as e:
+            sys.exit(f"Relay mode needs werkzeug and simple-websocket: {e}")
+
+        # always_connect: the capabilities go out after the CONNECT packet
+        server = socketio.Server(async_mode='threading', cors_allowed_origins='*', always_connect=True)
+        server.on('connect', lambda sid, environ, auth=None: server.emit('capabilities', {'delta': True}, to=sid))
+        server.on('server_update', lambda sid, data: self.on_update(sid, data))
+        server.on('server_delta', lambda sid, data: self.on_delta(server, sid, data))
+        server.on('server_backfill', lambda sid, data: self.forward_backfill(data))
+        server.on('disconnect', lambda sid: self.sessions.pop(sid, None))
+        app = socketio.WSGIApp(server)
+        thread = threading.Thread(target=run_simple, args=(host, port, app),
+                                  kwargs={'threaded': True}, name='relay-server', daemon=True)
+        thread.start()
+        print(f"Relay listening on {host}:{port}")
+
+    def on_update(self, sid, data):
+        if not isinstance(data, dict) or 'id' not in data or 'name' not in data:
+            return
+        with self.lock:
+            self.sessions[sid] = dict(data)
+            self.pending[data['name']] = dict(data)
+
+    def on_delta(self, server, sid, data):
+        with self.lock:
+            report = self.sessions.get(sid)
+            if report is None:
+                # Relay restarted under a connected agent
+                server.emit('resync', to=sid)
+                return
+            report.update(data or {})
+            self.pending[report['name']] = dict(report)
+
+    def forward_backfill(self, payload):
+        """Pass an agent's spooled samples upstream; the ack goes back to the agent"""
+        if not sio.connected:
+            return {'error': 'Upstream unavailable', 'retry': True}
+        try:
+            return sio.call('server_backfill', payload, timeout=30)
+        except Exception as e:
+            return {'error': str(e), 'retry': True}
+
+    def add(self, report):
+        """Queue a report that did not arrive over the relay socket (the relay's own host)"""
+        with self.lock:
+            self.pending[report['name']] = dict(report)
+
+    def take_batch(self):
+        with self.lock:
+            batch, self.pending = list(self.pending.values()), {}
+        return batch
+
+    def send(self, batch):
+        """Forward one batch in chunks; returns the reports the upstream did not acknowledge"""
+        if not sio.connected:
+            return batch
+        unsent = []
+        for start in range(0, len(batch), self.MAX_BATCH):
+            chunk = batch[start:start + self.MAX_BATCH]
+            try:
+                ack = sio.call('server_bulk_update', {'servers': chunk}, timeout=10)
+            except Exception as e:
+                print(f"Relay forward error: {e}")
+                # Chunks before this one were acknowledged and must not be resent
+                unsent.extend(batch[start:])
+                break
+            if not isinstance(ack, dict) or 'error' in ack:
+                print(f"Relay batch rejected, spooling {len(chunk)} reports: {ack}")
+                unsent.extend(chunk)
+            else:
+                self.forwarded += len(chunk)
+        return unsent
+
+    def spool(self, batch):
+        if not self.spool_path:
+            return
+        try:
+            if os.path.exists(self.spool_path) and os.path.getsize(self.spool_path) >= self.SPOOL_MAX_BYTES:
+                print("Relay spool is full, dropping batch")
+                return
+            with open(self.spool_path, 'a') as f:
+                f.write(json.dumps({'ts': time.time(), 'servers': batch}) + '\n')
+        except OSError as e:
+            print(f"Relay spool error: {e}")
+
+    def replay(self):
+        """Backfill spooled samples into history; rewrite the spool with what is left"""
+        if not self.spool_path or not os.path.exists(self.spool_path) or not sio.connected:
+            return
+        try:
+            with open(self.spool_path) as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+        except (OSError, ValueError) as e:
+            print(f"Relay spool unreadable, discarding: {e}")
+            entries = []
+        cutoff = time.time() - self.SPOOL_MAX_AGE
+        entries = [entry for entry in entries if entry['ts'] >= cutoff]
+
+        samples = {}  # host name -> samples with the time they were spooled
+        for entry in entries:
+            for report in entry['servers']:
+                sample = {'ts': entry['ts']}
+                sample.update({field: report.get(field) for field in SampleSpool.FIELDS})
+                samples.setdefault(report.get('name'), []).append(sample)
+
+        for name in list(samples)[:self.REPLAY_HOSTS_PER_TICK]:
+            payload = gzip.compress(json.dumps({'name': name, 'samples': samples[name]}).encode('utf-8'))
+            try:
+                ack = sio.call('server_backfill', payload, timeout=30)
+            except Exception as e:
+                ack = {'error': str(e), 'retry': True}
+            if isinstance(ack, dict) and ack.get('retry'):
+                print(f"Relay backfill failed, keeping spool: {ack.get('error')}")
+                break
+            if not isinstance(ack, dict) or 'error' in ack:
+                print(f"Relay backfill of {name} rejected, discarding: {ack}")
+            del samples[name]
+
+        try:
+            if not samples:
+                os.remove(self.spool_path)
+                print(f"Relay backfilled {len(entries)} spooled batches")
+                return
+            with open(self.spool_path, 'w') as f:
+                for entry in entries:
+                    servers = [report for report in entry['servers'] if report.get('name') in samples]
+                    if servers:
+                        f.write(json.dumps({'ts': entry['ts'], 'servers': servers}) + '\n')
+        except OSError as e:
+            print(f"Relay spool error: {e}")
+
+    def tick(self):
+        batch = self.take_batch()
+        unsent = self.send(batch) if batch else []
+        if unsent:
+            self.spool(unsent)
+            return
+        self.replay()
+
+def run_relay(args):
+    """Relay mode: forward this site's agents, plus this host, upstream"""
+    relay = Relay(args.relay_spool)
+    relay.serve(args.relay_host, args.relay_port)
+    next_tick = time.monotonic()
+
+    while True:
+        try:
+            connect_with_retry()
+            relay.add(get_system_info_buffer())
+            relay.tick()
+        except Exception as e:
+            print(f"Relay error: {e}")
+        next_tick = max(next_tick + REPORT_INTERVAL, time.monotonic())
+        time.sleep(max(0, next_tick - time.monotonic()))
+
+class AsyncAgent:
+    """--async mode: the agent as independent asyncio tasks.
+
+    Sampling, slow probes, disk usage, sending and reconnecting each run
+    in their own task on one event loop, over socketio.AsyncClient. Probes
+    run concurrently with a timeout (subprocess checks through
+    asyncio.create_subprocess_exec), and the send task only reads cached
+    values, so a hanging probe or a stalled reconnect never delays a
+    report.
+    """
+
+    PROBE_TIMEOUT = 15
+    DISK_INTERVAL = 10
+
+    # Probes with a native asyncio implementation; the others run in a thread
+    ASYNC_PROBES = {'server_type': get_server_type_async}
+
+    def __init__(self, self_telemetry=False):
+        try:
+            from socketio import AsyncClient
+            import aiohttp  # noqa: F401 (transport of AsyncClient)
+        except ImportError as e:
+            sys.exit(f"Async mode needs aiohttp: {e}")
+        self.sio = AsyncClient(
+            reconnection=True,
+            reconnection_attempts=0,
+            reconnection_delay=1,
+            reconnection_delay_max=10,
+            randomization_factor=0.5
+        )
+        self.sio.on('connect', self.on_connect)
+        self.sio.on('disconnect', self.on_disconnect)
+        self.sio.on('capabilities', self.on_capabilities)
+        self.sio.on('resync', self.on_resync)
+        self.last_report = None
+        self.capabilities = {}
+        self.disk = (0, 0)
+        self.replaying = False
+        self.self_telemetry = self_telemetry
+        self.first_report = True
+        # Set on connect so the full report goes out without waiting for the next tick
+        self.report_now = None
+
+    async def on_connect(self):
+        print('Connected to server')
+        self.last_report = None
+        self.report_now.set()
+
+    async def on_disconnect(self):
+        print('Disconnected from server')
+        self.capabilities = {}
+
+    @property
+    def online(self):
+        # The namespace is usable as soon as the connect handler runs,
+        # before sio.connect() returns and sets sio.connected
+        return '/' in self.sio.namespaces
+
+    async def on_capabilities(self, data):
+        self.capabilities = data or {}
+
+    async def on_resync(self):
+        self.last_report = None
+
+    async def sample_loop(self):
+        while True:
+            try:
+                with TELEMETRY.timer('sample'):
+                    SAMPLER.sample()
+            except Exception as e:
+                print(f"Error sampling metrics: {e}")
+            await asyncio.sleep(SAMPLER.interval)
+
+    async def run_probe(self, name):
+        try:
+            if name in self.ASYNC_PROBES:
+                probe = self.ASYNC_PROBES[name]()
+            else:
+                probe = asyncio.to_thread(PROBES.function(name))
+            with TELEMETRY.timer(f'probe.{name}'):
+                value = await asyncio.wait_for(probe, self.PROBE_TIMEOUT)
+            PROBES.store(name, value)
+        except asyncio.TimeoutError:
+            print(f"Probe {name} timed out")
+        except Exception as e:
+            print(f"Probe {name} failed: {e}")
+
+    async def probe_loop(self):
+        while True:
+            stale = PROBES.stale()
+            if stale:
+                await asyncio.gather(*(self.run_probe(name) for name in stale))
+            await asyncio.sleep(60)
+
+    async def disk_loop(self):
+        while True:
+            try:
+                with TELEMETRY.timer('probe.disks'):
+                    self.disk = await asyncio.wait_for(asyncio.to_thread(get_all_disks_usage), self.PROBE_TIMEOUT)
+            except asyncio.TimeoutError:
+                print("Disk usage probe timed out")
+            await asyncio.sleep(self.DISK_INTERVAL)
+
+    async def connect_loop(self):
+        while True:
+            if not self.sio.connected:
+                try:
+                    print("Attempting to connect...")
+                    await asyncio.wait_for(
+                        self.sio.connect(API_URL, transports=['websocket'], wait_timeout=10), 15)
+                except Exception as e:
+                    print(f"Connection error: {e}")
+            await asyncio.sleep(RETRY_INTERVAL)
+
+    def build_report(self):
+        """Current report from the sampler snapshot and cached probe results"""
+        metrics = SAMPLER.snapshot()
+        disk_percent, total_disk = self.disk
+        report = {
+            'id': SERVER_ID,
+            'name': NODE_NAME,
+            'type': PROBES.cached('server_type'),
+            'location': PROBES.cached('location'),
+            'ip_address': PROBES.cached('ip_address'),
+            'uptime': int(time.time() - psutil_module().boot_time()),
+            'network_in': metrics['network_in'],
+            'network_out': metrics['network_out'],
+            'cpu': metrics['cpu'],
+            'memory': metrics['memory'],
+            'disk': disk_percent,
+            'os_type': PROBES.cached('os_type'),
+            'cpu_info': PROBES.cached('cpu_info'),
+            'total_memory': psutil_module().virtual_memory().total / (1024 * 1024 * 1024),
+            'total_disk': total_disk
+        }
+        # Probes that have not finished yet are left to the backend defaults
+        return {key: round(value, 2) if isinstance(value, float) else value
+                for key, value in report.items() if value is not None}
+
+    async def send_loop(self):
+        loop = asyncio.get_running_loop()
+        next_report = loop.time()
+        while True:
+            started = loop.time()
+            TELEMETRY.observe('lag', max(0, started - next_report))
+            report = self.build_report()
+            if self.online:
+                try:
+                    event, data = report_message(self.last_report, report, self.capabilities)
+                    with TELEMETRY.timer('send'):
+                        await self.sio.emit(event, data)
+                    if VERBOSE:
+                        print(f"Sent {event}")
+                    if self.first_report:
+                        print(f"First report sent {(time.monotonic() - STARTED) * 1000:.0f} ms after start")
+                        self.first_report = False
+                    self.last_report = report
+                    if not self.replaying and SPOOL.segments():
+                        self.replaying = True
+                        asyncio.create_task(self.replay_spool())
+                except Exception as e:
+                    print(f"Error sending report: {e}")
+            else:
+                SPOOL.append(report)
+            TELEMETRY.observe('loop', loop.time() - started)
+            next_report = max(next_report + REPORT_INTERVAL, loop.time())
+            try:
+                await asyncio.wait_for(self.report_now.wait(), max(0, next_report - loop.time()))
+                next_report = loop.time()
+            except asyncio.TimeoutError:
+                pass
+            self.report_now.clear()
+
+    async def telemetry_loop(self):
+        while True:
+            await asyncio.sleep(TELEMETRY_INTERVAL)
+            if self.self_telemetry and self.online:
+                try:
+                    await self.sio.emit('agent_telemetry', TELEMETRY.snapshot())
+                except Exception as e:
+                    print(f"Error sending telemetry: {e}")
+
+    async def replay_spool(self):
+        try:
+            for batch, count, payload in SPOOL.batches(NODE_NAME):
+                try:
+                    ack = await self.sio.call('server_backfill', payload, timeout=30)
+                except Exception as e:
+                    print(f"Backfill failed, keeping spool: {e}")
+                    return
+                if not SPOOL.acknowledge(batch, count, ack):
+                    return
+        finally:
+            self.replaying = False
+
+    async def run(self):
+        self.report_now = asyncio.Event()
+        await asyncio.gather(
+            self.sample_loop(),
+            self.probe_loop(),
+            self.disk_loop(),
+            self.connect_loop(),
+            self.send_loop(),
+            self.telemetry_loop()
+        )
+
+class BenchmarkStubs:
+    """Canned stand-ins for psutil, requests, subprocess and the socket.
+
+    --benchmark swaps them in for the module globals, so the collection
+    loop runs offline, with the same work per call on every machine, and
+    only the agent's own code is measured. BENCHMARK_PARTITIONS mounts
+    are reported, as on hosts with snap or container mounts.
+    """
+
+    BENCHMARK_PARTITIONS = 24
+
+    class Namespace:
+        def __init__(self, **fields):
+            self.__dict__.update(fields)
+
+    class Response:
+        ok = True
+        status_code = 200
+        text = '203.0.113.10'
+
+        def json(self):
+            return {'status': 'success', 'countryCode': 'DE', 'country_code': 'DE'}
+
+    def __init__(self):
+        self._counter = 0
+        self.sent = 0
+        self.sent_bytes = 0
+
+    # psutil
+    def cpu_percent(self, interval=None):
+        return 10.0 + self._counter % 7
+
+    def virtual_memory(self):
+        return self.Namespace(percent=41.2, total=512 * 1024 * 1024)
+
+    def net_io_counters(self):
+        self._counter += 1
+        return self.Namespace(bytes_recv=self._counter * 125000, bytes_sent=self._counter * 64000)
+
+    def disk_io_counters(self):
+        return self.Namespace(read_bytes=self._counter * 4096, write_bytes=self._counter * 8192)
+
+    def disk_partitions(self):
+        return [self.Namespace(mountpoint=f'/mnt/{i}') for i in range(self.BENCHMARK_PARTITIONS)]
+
+    def disk_usage(self, path):
+        return self.Namespace(total=20 * 1024 ** 3, used=7 * 1024 ** 3)
+
+    def boot_time(self):
+        return time.time() - 86400
+
+    def cpu_count(self):
+        return 2
+
+    # requests
+    def get(self, url, timeout=None):
+        return self.Response()
+
+    def post(self, url, json=None, timeout=None):
+        return self.Response()
+
+    # subprocess
+    def run(self, *args, **kwargs):
+        return subprocess.CompletedProcess(args, 0, stdout='kvm\n', stderr='')
+
+    def check_output(self, *args, **kwargs):
+        return b'02:00:00:00:00:01\n'
+
+    # socket.io client: encode the packet the way the client would, send nothing
+    connected = True
+
+    def emit(self, event, data=None):
+        payload = data if isinstance(data, bytes) else json.dumps([event, data]).encode('utf-8')
+        self.sent += 1
+        self.sent_bytes += len(payload)
+
+def run_benchmark(iterations, output=None):
+    """--benchmark: per-call cost of each stage of the collection loop"""
+    global psutil, requests, subprocess, sio, SERVER_ID, SERVER_CAPABILITIES, LAST_REPORT
+    stubs = BenchmarkStubs()
+    # The benchmark's own CPU time and RSS come from the real psutil
+    process = psutil_module().Process()
+    psutil = requests = subprocess = sio = stubs
+    SERVER_ID = hashlib.md5(NODE_NAME.encode()).hexdigest()
+    # Prefer the binary wire format when this agent can produce it
+    SERVER_CAPABILITIES = {'delta': True, 'msgpack': WIRE_SCHEMA_VERSION if msgpack else None}
+    
+    def measure(function):
+        durations = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            function()
+            durations.append(time.perf_counter() - started)
+        durations.sort()
+        return {
+            'mean_us': round(sum(durations) / len(durations) * 1e6, 1),
+            'p50_us': round(durations[len(durations) // 2] * 1e6, 1),
+            'p99_us': round(durations[min(len(durations) - 1, int(len(durations) * 0.99))] * 1e6, 1)
+        }
+    
+    def full_iteration():
+        get_system_info_buffer._last_full_update = 0
+        send_report(get_system_info_buffer())
+    
+    def cached_iteration():
+        SAMPLER.sample()
+        send_report(get_system_info_buffer())
+    
+    stages = {'sample': SAMPLER.sample, 'probe.disks': get_all_disks_usage}
+    for name in PROBES.stale():
+        stages[f'probe.{name}'] = PROBES.function(name)
+    # Every 10 seconds the report is rebuilt with the disk probe, in
+    # between it only takes the latest sample
+    stages['iteration (rebuild)'] = full_iteration
+    stages['iteration (cached)'] = cached_iteration
+    
+    cpu_before = process.cpu_times()
+    # Probe error messages would only flood the terminal
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        for name in PROBES.stale():
+            PROBES.store(name, PROBES.function(name)())
+        full_iteration()
+        results = {name: measure(function) for name, function in stages.items()}
+    cpu_after = process.cpu_times()
+    
+    # Share of one core at the normal cadence: a sample every second and
+    # a report every REPORT_INTERVAL, of which one in four is rebuilt
+    sample_cost = results['sample']['mean_us']
+    report_cost = (3 * results['iteration (cached)']['mean_us'] + results['iteration (rebuild)']['mean_us']) / 4 - sample_cost
+    core_share = (sample_cost / SAMPLER.interval + max(0, report_cost) / REPORT_INTERVAL) / 1e6
+    summary = {
+        'iterations': iterations,
+        'stages': results,
+        'estimated_cpu_percent': round(core_share * 100, 4),
+        'benchmark_cpu_seconds': round((cpu_after.user + cpu_after.system) - (cpu_before.user + cpu_before.system), 3),
+        'rss_mb': round(process.memory_info().rss / (1024 * 1024), 2),
+        'bytes_per_report': round(stubs.sent_bytes / max(1, stubs.sent), 1),
+        'wire_format': 'msgpack' if msgpack else 'json',
+        'python': platform.python_version()
+    }
+    
+    print(f"{'stage':<22} {'mean us':>10} {'p50 us':>10} {'p99 us':>10}")
+    for name, result in results.items():
+        print(f"{name:<22} {result['mean_us']:>10} {result['p50_us']:>10} {result['p99_us']:>10}")
+    print(f"Estimated steady-state CPU (agent code, system calls stubbed): {summary['estimated_cpu_percent']}% of one core, "
+          f"RSS {summary['rss_mb']} MB, {summary['bytes_per_report']} bytes per report ({summary['wire_format']})")
+    if output:
+        with open(output, 'w') as f:
+            json.dump(summary, f, indent=2)
+
 def main():
     global NODE_NAME, SERVER_ID, CONNECTING, error_count
     
-    NODE_NAME = parse_arguments()
-    SERVER_ID = get_machine_id()
+    args = parse_arguments()
+    NODE_NAME = args.name
+    if args.verbose:
+        enable_verbose_logging()
+    if args.benchmark:
+        run_benchmark(args.benchmark, args.benchmark_output)
+        return
+    SERVER_ID = get_machine_id(args.identity_file)
+    PROBES.load(args.probe_cache)
+    SPOOL.directory = args.spool_dir
     
     print(f"Starting monitoring for server: {SERVER_ID}")
     print(f"Node name: {NODE_NAME}")
     print(f"Sending data to: {API_URL}")
     
+    if args.use_async:
+        asyncio.run(AsyncAgent(self_telemetry=args.self_telemetry).run())
+        return
+    SAMPLER.start()
+    # Network lookups and subprocess probes run while socketio loads and connects
+    PROBES.refresh_stale()
+    create_client()
+    if args.relay:
+        run_relay(args)
+        return
+    # Keeps the history gap-free until the backend is reachable again,
+    # at the report interval however connect attempts are paced
+    SPOOL.start_recording(lambda: not sio.connected, REPORT_INTERVAL)
+    next_report = time.monotonic()
+    next_telemetry = time.monotonic() + TELEMETRY_INTERVAL
+    first_report = True
+    
     while True:
         try:
             connect_with_retry()
-                
+            
+            started = time.monotonic()
+            TELEMETRY.observe('lag', max(0, started - next_report))
+            system_info = get_system_info_buffer()
             if sio.connected:
-                system_info = get_system_info_buffer()
-
-                for key, value in system_info.items():
-                    if isinstance(value, (float, int)):
-                        system_info[key] = str(value)
-                
-                sio.emit('server_update', system_info)
+                send_report(system_info)
+                if first_report:
+                    print(f"First report sent {(time.monotonic() - STARTED) * 1000:.0f} ms after start")
+                    first_report = False
+                if not SPOOL.replaying and SPOOL.segments():
+                    SPOOL.start_replay(NODE_NAME)
+                if args.self_telemetry and started >= next_telemetry:
+                    sio.emit('agent_telemetry', TELEMETRY.snapshot())
+                    next_telemetry = started + TELEMETRY_INTERVAL
                 error_count = 0
+            TELEMETRY.observe('loop', time.monotonic() - started)
                 
-            time.sleep(3)
+            # Keep a steady 3 second cadence regardless of how long the report took
+            next_report = max(next_report + REPORT_INTERVAL, time.monotonic())
+            time.sleep(max(0, next_report - time.monotonic()))
             
         except Exception as e:
             error_count += 1
@@ -477,7 +1648,7 @@ if __name__ == "__main__":
     try:
         main()
     except KeyboardInterrupt:
-        if sio.connected:
+        if sio is not None and sio.connected:
             sio.disconnect()
         print("\nMonitoring program stopped")
     except Exception as e:
@@ -0,0 +1,93 @@
+import socket
+import time
+
+import pytest
+
+import monitor
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def listening(port):
+    with socket.socket() as sock:
+        return sock.connect_ex(('127.0.0.1', port)) == 0
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out')
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def relay(monkeypatch):
+    relay = monitor.Relay(None)
+    events = []
+    on_update, on_delta = relay.on_update, relay.on_delta
+    monkeypatch.setattr(relay, 'on_update', lambda sid, data: (events.append('server_update'), on_update(sid, data)))
+    monkeypatch.setattr(relay, 'on_delta', lambda server, sid, data: (events.append('server_delta'), on_delta(server, sid, data)))
+    port = free_port()
+    relay.serve('127.0.0.1', port)
+    wait_for(lambda: listening(port))
+    return relay, port, events
+
+
+def test_agent_behind_the_relay_sends_deltas(relay):
+    relay, port, events = relay
+    agent = monitor.create_client()
+    try:
+        agent.connect(f'http://127.0.0.1:{port}', transports=['websocket'], wait_timeout=5)
+        wait_for(lambda: monitor.SERVER_CAPABILITIES.get('delta'))
+        report = {'id': 'agent-1', 'name': 'agent-1', 'cpu': 10.0}
+        monitor.send_report(report)
+        monitor.send_report(dict(report, cpu=20.0))
+        wait_for(lambda: len(events) == 2)
+    finally:
+        agent.disconnect()
+    assert events == ['server_update', 'server_delta']
+    assert relay.pending['agent-1']['cpu'] == 20.0
+
+
+class FakeUpstream:
+    connected = True
+
+    def __init__(self, *acks):
+        self.acks = list(acks)
+        self.chunks = []
+
+    def call(self, event, data, timeout=None):
+        self.chunks.append([report['name'] for report in data['servers']])
+        ack = self.acks.pop(0)
+        if isinstance(ack, Exception):
+            raise ack
+        return ack
+
+
+def reports(count):
+    return [{'id': str(index), 'name': f'host-{index}'} for index in range(count)]
+
+
+def test_send_returns_only_the_unacknowledged_reports(monkeypatch):
+    relay = monitor.Relay(None)
+    relay.MAX_BATCH = 2
+    upstream = FakeUpstream({'accepted': 2}, {'error': 'busy'}, {'accepted': 2})
+    monkeypatch.setattr(monitor, 'sio', upstream)
+    unsent = relay.send(reports(6))
+    assert [report['name'] for report in unsent] == ['host-2', 'host-3']
+    assert relay.forwarded == 4
+
+
+def test_send_keeps_acknowledged_chunks_out_of_the_spool_after_an_error(monkeypatch):
+    relay = monitor.Relay(None)
+    relay.MAX_BATCH = 2
+    upstream = FakeUpstream({'accepted': 2}, TimeoutError('no ack'))
+    monkeypatch.setattr(monitor, 'sio', upstream)
+    unsent = relay.send(reports(5))
+    assert [report['name'] for report in unsent] == ['host-2', 'host-3', 'host-4']
+    assert len(upstream.chunks) == 2
@@ -0,0 +1,31 @@
+import json
+import time
+
+import monitor
+
+
+def spooled(spool):
+    samples = []
+    for path in spool.segments():
+        with open(path) as f:
+            samples.extend(json.loads(line) for line in f)
+    return samples
+
+
+def test_recording_keeps_its_interval_while_offline(tmp_path):
+    spool = monitor.SampleSpool(str(tmp_path))
+    offline = [True]
+    spool.start_recording(lambda: offline[0], 0.05)
+    # The connect loop of the agent may block far longer than this
+    time.sleep(0.5)
+    offline[0] = False
+    time.sleep(0.1)
+
+    samples = spooled(spool)
+    assert 8 <= len(samples) <= 11
+    gaps = [b['ts'] - a['ts'] for a, b in zip(samples, samples[1:])]
+    assert max(gaps) < 0.1
+    assert set(monitor.SampleSpool.FIELDS) <= set(samples[0])
+
+    time.sleep(0.2)
+    assert len(spooled(spool)) == len(samples)
@@ -24,7 +24,7 @@ const ServerList: React.FC<ServerListProps> = ({ servers }) => {
   };
 
   const sortedServers = [...servers].sort((a, b) => 
-    (b.order_index || 0) - (a.order_index || 0)
+    (b.order_index || 0) - (a.order_index || 0) || (a.id < b.id ? -1 : a.id > b.id ? 1 : 0)
   ).map(server => ({
     ...server,
     is_expanded: expandedServers.has(server.id)
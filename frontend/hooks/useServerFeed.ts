@@ -0,0 +1,67 @@
+import { useEffect, useState } from 'react';
+import { Server } from '../types/server';
+import { API_URL } from '../config/config';
+
+const POLL_INTERVAL = 5000;
+
+// Subscribe to the backend push feed: one snapshot, then diff frames.
+// Falls back to polling /api/servers where EventSource is unavailable.
+export function useServerFeed(token?: string | null) {
+  const [servers, setServers] = useState<Server[]>([]);
+  const [loading, setLoading] = useState(true);
+
+  useEffect(() => {
+    if (typeof window === 'undefined') return;
+
+    if (!('EventSource' in window)) {
+      const fetchServers = async () => {
+        try {
+          const response = await fetch(`${API_URL}/api/servers`, {
+            headers: token ? { 'Authorization': `Bearer ${token}` } : {},
+          });
+          setServers(await response.json());
+        } catch (error) {
+          console.error('Error fetching servers:', error);
+        } finally {
+          setLoading(false);
+        }
+      };
+      fetchServers();
+      const interval = setInterval(fetchServers, POLL_INTERVAL);
+      return () => clearInterval(interval);
+    }
+
+    const query = token ? `?token=${encodeURIComponent(token)}` : '';
+    const source = new EventSource(`${API_URL}/api/servers/stream${query}`);
+
+    source.addEventListener('snapshot', (event) => {
+      setServers(JSON.parse((event as MessageEvent).data));
+      setLoading(false);
+    });
+
+    source.addEventListener('diff', (event) => {
+      const { servers: changed, removed } = JSON.parse((event as MessageEvent).data) as {
+        servers: Server[];
+        removed: string[];
+      };
+      setServers((current) => {
+        const byId = new Map(current.map((server) => [server.id, server]));
+        changed.forEach((server) => byId.set(server.id, { ...byId.get(server.id), ...server }));
+        removed.forEach((id) => byId.delete(id));
+        // Same order as the backend listing: order_index descending, then id
+        return Array.from(byId.values()).sort(
+          (a, b) => (b.order_index || 0) - (a.order_index || 0) || (a.id < b.id ? -1 : a.id > b.id ? 1 : 0)
+        );
+      });
+    });
+
+    source.onerror = () => {
+      // EventSource reconnects by itself and gets a fresh snapshot
+      setLoading(false);
+    };
+
+    return () => source.close();
+  }, [token]);
+
+  return { servers, loading };
+}
@@ -1,8 +1,7 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState } from 'react';
 import Layout from '../../components/Layout';
 import ClientTable from '../../components/admin/ClientTable';
 import AddClientModal from '../../components/admin/AddClientModal';
-import { Server } from '../../types/server';
 import { 
   PlusIcon, 
   ServerIcon, 
@@ -13,42 +12,21 @@ import ProtectedRoute from '../../components/ProtectedRoute';
 import AdminStats from '../../components/admin/AdminStats';
 import ResetPasswordModal from '../../components/admin/ResetPasswordModal';
 import { useAuth } from '../../hooks/useAuth';
+import { useServerFeed } from '../../hooks/useServerFeed';
 import { API_URL } from '../../config/config';
 import { Toaster } from 'react-hot-toast';
 import { fetchWithAuth } from '../../utils/api';
 
 export default function AdminDashboard() {
-  const { logout } = useAuth();
-  const [clients, setClients] = useState<Server[]>([]);
-  const [loading, setLoading] = useState(true);
+  const { logout, token } = useAuth();
+  // Same push feed as the dashboard; deletes, reorders and new clients
+  // arrive as diffs, so the actions below do not refetch the list
+  const { servers: clients, loading: feedLoading } = useServerFeed(token);
+  const [loading, setLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [isAddModalOpen, setIsAddModalOpen] = useState(false);
   const [isResetModalOpen, setIsResetModalOpen] = useState(false);
 
-  const fetchClients = async () => {
-    try {
-      setLoading(true);
-      const response = await fetchWithAuth('/api/servers');
-      if (!response.ok) {
-        throw new Error('Failed to fetch clients');
-      }
-      const data = await response.json();
-      console.log('Received clients data:', data);
-      setClients(data);
-    } catch (error) {
-      console.error('Error fetching clients:', error);
-      setError(error instanceof Error ? error.message : 'Failed to fetch clients');
-    } finally {
-      setLoading(false);
-    }
-  };
-
-  useEffect(() => {
-    fetchClients();
-    const interval = setInterval(fetchClients, 8000);
-    return () => clearInterval(interval);
-  }, []);
-
   const handleDelete = async (clientId: string) => {
     try {
       setError(null);
@@ -59,7 +37,6 @@ export default function AdminDashboard() {
       if (!response.ok) {
         throw new Error('Failed to delete server');
       }
-      await fetchClients();
     } catch (error) {
       console.error('Error deleting server:', error);
       setError(error instanceof Error ? error.message : 'Failed to delete server');
@@ -84,8 +61,6 @@ export default function AdminDashboard() {
       if (!response.ok) {
         throw new Error('Failed to update order');
       }
-      
-      await fetchClients();
     } catch (error) {
       console.error('Error updating order:', error);
       setError(error instanceof Error ? error.message : 'Failed to update order');
@@ -110,8 +85,6 @@ export default function AdminDashboard() {
       if (!response.ok) {
         throw new Error('Failed to add client');
       }
-      
-      await fetchClients();
     } catch (error) {
       console.error('Error adding client:', error);
       setError(error instanceof Error ? error.message : 'Failed to add client');
@@ -181,7 +154,7 @@ export default function AdminDashboard() {
                 dark:border-gray-700/50 backdrop-blur-sm">
                 <ClientTable 
                   clients={clients} 
-                  loading={loading} 
+                  loading={loading || feedLoading} 
                   onDelete={handleDelete}
                   onUpdateOrder={handleUpdateOrder}
                 />
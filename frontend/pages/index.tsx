@@ -1,31 +1,11 @@
 import Layout from '../components/Layout'
 import ServerList from '../components/ServerList'
-import { useEffect, useState } from 'react'
-import { Server } from '../types/server'
 import Link from 'next/link'
-import { API_URL } from '../config/config';
+import { useServerFeed } from '../hooks/useServerFeed'
 
 export default function Home() {
-  const [servers, setServers] = useState<Server[]>([])
-  const [loading, setLoading] = useState(true)
-
-  useEffect(() => {
-    const fetchServers = async () => {
-      try {
-        const response = await fetch(`${API_URL}/api/servers`)
-        const data = await response.json()
-        setServers(data)
-      } catch (error) {
-        console.error('Error fetching servers:', error)
-      } finally {
-        setLoading(false)
-      }
-    }
-
-    fetchServers()
-    const interval = setInterval(fetchServers, 5000)
-    return () => clearInterval(interval)
-  }, [])
+  // Live fleet state pushed by the backend instead of polling every 5 seconds
+  const { servers, loading } = useServerFeed()
 
   const getAverageMetrics = () => {
     if (servers.length === 0) return { cpu: 0, memory: 0, disk: 0 }
@@ -46,7 +46,7 @@ python -m venv venv
 call venv\Scripts\activate
 
 :: Install dependencies
-pip install psutil requests "python-socketio[client]" wmi
+pip install psutil requests "python-socketio[client]" wmi msgpack
 
 :: Download monitor.py from repository
 powershell -Command "& { Invoke-WebRequest -Uri 'https://raw.githubusercontent.com/wanghui5801/Monitor-nextjs/main/client/monitor.py' -OutFile 'monitor.py' }"